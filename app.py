@@ -1,14 +1,28 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import math
 import os
+import time
 import dash
 from dash import dcc, html, dash_table
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
+from flask import Response, abort, g, jsonify, request
+from gspread.exceptions import SpreadsheetNotFound
+
+from datos import (ActualizadorFondo, SincronizadorHojas, Snapshot, a_columnas, cargar_hojas, elegir_frecuencia,
+                   remuestrear)
+from figuras import CacheFiguras, crear_figura_escuela, styles
+from historico import (ANIO_ACTUAL, DIRECTORIO_HISTORICO, PROGRAMAS, TITULOS, AlmacenAnual, comparacion_interanual,
+                       anio_ultima_foto, congelar_cerrados, congelar_desde_sheets, nombre_planilla)
+from mapas import ServicioMapas
+from metricas import LIMITES_BYTES, RegistroMetricas
+from respuestas import CompresorRespuestas, cacheable
+from sheets import ConexionSheets, credenciales_entorno
+from snapshots import DIRECTORIO_SNAPSHOTS, CoordinadorWorkers, cargar_ultimo, guardar_snapshot, podar
 
 # ===== 1. Configuración inicial =====
 # ===== Estilos CSS personalizados =====
@@ -16,16 +30,6 @@ external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 app = dash.Dash(__name__, suppress_callback_exceptions=True, external_stylesheets=external_stylesheets)
 server = app.server
 
-# Configuración de estilos
-styles = {
-    'background': '#F5F5F5',
-    'text': '#0A2463',
-    'accent': '#0A2463', #COLOR DE TÍTULO GENERAL
-    'card': '#FFFFFF',
-    'font': 'Roboto, sans-serif',
-    'grid': '#E0E0E0'
-}
-
 app.index_string = '''
 <!DOCTYPE html>
 <html>
@@ -46,61 +50,344 @@ app.index_string = '''
 </html>
 '''
 
+# ===== Métricas =====
+# Tiempos por callback y etapa, llamadas a Sheets y tamaño de las respuestas, en /metrics.
+# Con DIAGNOSTICO=1 se muestra además un panel con las últimas trazas.
+DIAGNOSTICO = os.environ.get('DIAGNOSTICO', '0') == '1'
+metricas = RegistroMetricas()
+metricas_sheets = metricas.histograma('dashboard_sheets_segundos', 'Duración de cada llamada a Google Sheets', ['operacion'])
+metricas_actualizacion = metricas.histograma(
+    'dashboard_actualizacion_segundos', 'Duración de cada etapa de la recarga de datos', ['etapa'])
+metricas_pedidos = metricas.histograma(
+    'dashboard_pedido_segundos', 'Duración del pedido HTTP de cada callback, serialización incluida', ['callback'])
+metricas_respuestas = metricas.histograma(
+    'dashboard_respuesta_bytes', 'Tamaño de la respuesta de cada callback', ['callback'], LIMITES_BYTES)
+
 # ===== 2. Conexión a Google Sheets =====
 try:
-    # Verificación de variables de entorno
-    required_vars = [
-        'GCP_PROJECT_ID',
-        'GCP_PRIVATE_KEY',
-        'GCP_CLIENT_EMAIL',
-        'GCP_CLIENT_X509_CERT_URL'
-    ]
-    
-    missing_vars = [var for var in required_vars if var not in os.environ]
-    if missing_vars:
-        raise RuntimeError(f"Faltan variables de entorno: {', '.join(missing_vars)}")
+    # Credenciales de la cuenta de servicio a partir de las variables GCP_* del entorno
+    credentials = credenciales_entorno()
+    # Una sola conexión para todo el proceso: sesión keep-alive, clave de la planilla
+    # y lista de hojas resueltas una vez, token renovado antes de vencer y reintentos en 429.
+    # Solo el año en curso se pide a Google; los anteriores se leen del histórico congelado
+    def abrir_conexion(anio):
+        return ConexionSheets(credentials, nombre_planilla(anio), pool=int(os.environ.get('SHEETS_POOL', 8)),
+                              al_llamar=lambda operacion, segundos: metricas_sheets.observar(segundos, operacion))
 
-    SCOPES = [
-        'https://www.googleapis.com/auth/spreadsheets',
-        'https://www.googleapis.com/auth/drive'
-    ]
+    ANIO_PLANILLA = ANIO_ACTUAL
+    conexion = abrir_conexion(ANIO_PLANILLA)
+    if anio_ultima_foto() != ANIO_PLANILLA:
+        # Sin fotos de este año (año nuevo o disco vacío): su planilla puede no existir
+        # todavía, y entonces se sigue con la del año anterior
+        try:
+            conexion.planilla()
+        except SpreadsheetNotFound:
+            print(f"No se encontró {nombre_planilla(ANIO_PLANILLA)}; se usa {nombre_planilla(ANIO_PLANILLA - 1)}")
+            ANIO_PLANILLA -= 1
+            conexion = abrir_conexion(ANIO_PLANILLA)
+        except Exception as e:
+            print(f"Error al abrir {nombre_planilla(ANIO_PLANILLA)}: {str(e)}")
+        # Con gunicorn --preload esto corre antes del fork: los workers no comparten sockets.
+        # La clave de la planilla queda, así la primera recarga no la vuelve a buscar
+        conexion.cerrar_sockets()
+    print(f"Año en curso: {ANIO_PLANILLA} ({nombre_planilla(ANIO_PLANILLA)})")
 
-    creds_dict = {
-        "type": "service_account",
-        "project_id": os.environ['GCP_PROJECT_ID'],
-        "private_key_id": os.environ.get('GCP_PRIVATE_KEY_ID', ''),
-        "private_key": os.environ['GCP_PRIVATE_KEY'].replace('\\n', '\n'),
-        "client_email": os.environ['GCP_CLIENT_EMAIL'],
-        "client_id": os.environ.get('GCP_CLIENT_ID', ''),
-        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-        "token_uri": "https://oauth2.googleapis.com/token",
-        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-        "client_x509_cert_url": os.environ['GCP_CLIENT_X509_CERT_URL']
-    }
+except Exception as e:
+    print(f"Error crítico: {str(e)}")
+    credentials = None
+    conexion = None
+    ANIO_PLANILLA = ANIO_ACTUAL
+    print("Modo de fallo seguro activado")
+
+# Carga de datos: se arranca con la última foto guardada en disco (milisegundos)
+# y las hojas se piden a Google en segundo plano
+hojas_vacias = {
+    indice: pd.DataFrame(columns=['Escuela', 'Fecha', 'Inscriptos', 'Presentes', 'Observaciones'])
+    for indice in (0, 1, 2, 3)
+}
+# Al cambiar de año, la última foto del año que terminó se congela en el histórico
+# antes de que la poda de snapshots la borre; desde ahí ese año no vuelve a pedirse a Google
+almacen = AlmacenAnual()
+try:
+    for anio in congelar_cerrados(ANIO_PLANILLA):
+        print(f"Año {anio} congelado en {DIRECTORIO_HISTORICO}")
+except Exception as e:
+    print(f"Error al congelar años cerrados: {str(e)}")
+try:
+    snapshot_inicial = cargar_ultimo(anio=ANIO_PLANILLA)
+except Exception as e:
+    print(f"Error al leer snapshots: {str(e)}")
+    snapshot_inicial = None
+if snapshot_inicial is None:
+    snapshot_inicial = Snapshot(hojas_vacias)
+else:
+    print(f"Datos iniciales del snapshot del {snapshot_inicial.actualizado.strftime('%d/%m/%Y %H:%M:%S')}")
+
+# ===== Cache de figuras =====
+# Una figura ya armada para la misma versión de datos se devuelve tal cual.
+# Con CACHE_FIGURAS_DIR (vacío para desactivarlo) se comparte en disco entre workers.
+cache_figuras = CacheFiguras(
+    max_entradas=int(os.environ.get('CACHE_FIGURAS_MAX', 256)),
+    max_bytes=int(os.environ.get('CACHE_FIGURAS_MB', 64)) * 1024 * 1024,
+    directorio=os.environ.get('CACHE_FIGURAS_DIR', 'cache_figuras') or None,
+    max_bytes_disco=int(os.environ.get('CACHE_FIGURAS_DISCO_MB', 256)) * 1024 * 1024
+)
+
+# ===== Actualización en segundo plano =====
+# Los callbacks leen siempre la última foto en memoria; las hojas se recargan
+# en un hilo aparte cada INTERVALO_ACTUALIZACION segundos o al pulsar "Actualizar Datos".
+INTERVALO_ACTUALIZACION = int(os.environ.get('INTERVALO_ACTUALIZACION', 300))
+SNAPSHOTS_CONSERVAR = int(os.environ.get('SNAPSHOTS_CONSERVAR', 10))
+# Las hojas son registros diarios: en modo incremental solo se piden las filas nuevas
+SINCRONIZACION_INCREMENTAL = os.environ.get('SINCRONIZACION_INCREMENTAL', '1') == '1'
+SINCRONIZACION_COMPLETA_CADA = int(os.environ.get('SINCRONIZACION_COMPLETA_CADA', 12))
+sincronizador = SincronizadorHojas(completa_cada=SINCRONIZACION_COMPLETA_CADA)
+
+def cargar_varias_hojas(indices):
+    if conexion is None:
+        raise RuntimeError("Sin conexión a Google Sheets")
+    if SINCRONIZACION_INCREMENTAL:
+        hojas, tiempos = sincronizador.sincronizar(conexion, indices)
+        print("Hojas sincronizadas: " + ", ".join(
+            f"{i}: {d['modo']} (+{d['filas_nuevas']} filas)" for i, d in sorted(sincronizador.ultimo_detalle.items())))
+    else:
+        hojas, tiempos = cargar_hojas(conexion, indices)
+    for etapa in ('completa', 'incremental', 'total'):
+        if etapa in tiempos:
+            metricas_actualizacion.observar(tiempos[etapa], f'sheets_{etapa}')
+    print("Hojas recargadas en " + ", ".join(f"{k}: {v:.2f}s" for k, v in tiempos.items()))
+    return hojas, tiempos
+
+def persistir_snapshot(snapshot):
+    for etapa in ('normalizar', 'particionar', 'agregados'):
+        metricas_actualizacion.observar(snapshot.tiempos[etapa], etapa)
+    # Cada carga exitosa queda en disco para el próximo arranque
+    inicio = time.perf_counter()
+    guardar_snapshot(snapshot, anio=ANIO_PLANILLA)
+    podar(SNAPSHOTS_CONSERVAR)
+    metricas_actualizacion.observar(time.perf_counter() - inicio, 'guardar')
+    if anios_sin_historico and credentials is not None:
+        inicio = time.perf_counter()
+        completar_historico()
+        metricas_actualizacion.observar(time.perf_counter() - inicio, 'historico')
+
+# Años cerrados que se ofrecen para comparar. Si historico/ no sobrevive al deploy (disco
+# efímero) ni hay fotos de esos años, el worker que sincroniza baja cada planilla una vez,
+# después de su primera foto del año en curso
+ANIOS_CERRADOS = int(os.environ.get('ANIOS_CERRADOS', 2))
+anios_sin_historico = {anio for anio in range(ANIO_PLANILLA - ANIOS_CERRADOS, ANIO_PLANILLA)
+                       if almacen.manifest(anio) is None}
+
+def completar_historico():
+    # Un año que falló por la red se reintenta en la próxima foto; uno sin planilla, no
+    congelados, sin_planilla = congelar_desde_sheets(anios_sin_historico, credentials)
+    for anio in congelados:
+        print(f"Año {anio} congelado desde {nombre_planilla(anio)} en {DIRECTORIO_HISTORICO}")
+    anios_sin_historico.difference_update(congelados, sin_planilla,
+                                          [anio for anio in anios_sin_historico if almacen.manifest(anio) is not None])
+
+actualizador = ActualizadorFondo(
+    cargar_varias_hojas,
+    [0, 1, 2, 3],
+    intervalo=INTERVALO_ACTUALIZACION,
+    snapshot=snapshot_inicial,
+    al_actualizar=persistir_snapshot
+)
+
+def invalidar_todo():
+    # El botón fuerza una descarga completa para tomar también correcciones de filas viejas,
+    # y vuelve a pedir la lista de hojas por si se agregó o renombró alguna
+    sincronizador.invalidar()
+    if conexion is not None:
+        conexion.invalidar()
+
+# Con varios workers de gunicorn solo uno descarga de Sheets; el resto carga
+# de disco cada foto nueva que ese worker guarda
+coordinador = CoordinadorWorkers(
+    actualizador,
+    DIRECTORIO_SNAPSHOTS,
+    sondeo=int(os.environ.get('SONDEO_WORKERS', 5)),
+    al_pedir=invalidar_todo
+)
+
+@server.before_request
+def iniciar_actualizador():
+    coordinador.iniciar()
+
+# ===== Métricas HTTP =====
+def estadistica_sheets(clave):
+    return lambda: {(): conexion.estadisticas[clave]} if conexion is not None else {}
+
+metricas.contador('dashboard_sheets_llamadas_total', 'Llamadas a Google Sheets, por operación',
+                  lambda: {(op,): n for op, n in conexion.llamadas_por_operacion.items()} if conexion is not None else {},
+                  ['operacion'])
+metricas.contador('dashboard_sheets_reintentos_total', 'Reintentos por 429/5xx', estadistica_sheets('reintentos'))
+metricas.contador('dashboard_sheets_bytes_total', 'Bytes recibidos de Google Sheets', estadistica_sheets('bytes'))
+metricas.contador('dashboard_figuras_cache_total', 'Consultas al cache de figuras, por resultado',
+                  lambda: {('memoria',): cache_figuras.hits, ('disco',): cache_figuras.hits_disco,
+                           ('construida',): cache_figuras.misses},
+                  ['resultado'])
+metricas.contador('dashboard_historico_particiones_total', 'Particiones (año, programa) del histórico, por origen',
+                  lambda: {('disco',): almacen.lecturas, ('memoria',): almacen.aciertos},
+                  ['origen'])
+
+@server.before_request
+def iniciar_medicion():
+    g.inicio_pedido = time.perf_counter()
+
+@server.after_request
+def registrar_pedido(respuesta):
+    # El callback ya midió sus etapas; acá se agrega lo que hace Dash después (serializar a JSON)
+    traza = g.pop('traza_metricas', None)
+    inicio = g.pop('inicio_pedido', None)
+    if traza is not None and inicio is not None:
+        segundos = time.perf_counter() - inicio
+        tamano = respuesta.calculate_content_length() or 0
+        metricas_pedidos.observar(segundos, traza['callback'])
+        metricas_respuestas.observar(tamano, traza['callback'])
+        traza['pedido_segundos'] = segundos
+        traza['bytes'] = tamano
+    return respuesta
+
+@server.route('/metrics')
+def exportar_metricas():
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
 
-    credentials = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-    client = gspread.authorize(credentials)
+# ===== Compresión =====
+# brotli o gzip para el JSON de los callbacks, los bundles de Dash y los mapas. Se registra
+# después de las métricas para que `dashboard_respuesta_bytes` mida lo que viaja de verdad.
+if os.environ.get('COMPRIMIR_RESPUESTAS', '1') == '1':
+    compresor = CompresorRespuestas(server, nivel_brotli=int(os.environ.get('NIVEL_BROTLI', 5)))
+    metricas.contador('dashboard_compresion_bytes_total', 'Bytes de las respuestas comprimidas, antes y después',
+                      lambda: {('original',): compresor.bytes_originales, ('enviado',): compresor.bytes_enviados},
+                      ['etapa'])
 
-    # Carga de datos
+# ===== Mapas de sedes =====
+# Los exports de Folium se leen una vez y se sirven como GeoJSON a una página Leaflet liviana;
+# los participantes se agrupan en el servidor según el zoom
+servicio_mapas = ServicioMapas(directorio=os.path.dirname(os.path.abspath(__file__)))
+# Nombre y DNI de cada participante son datos personales: la consulta por id está apagada
+# salvo con MAPA_DATOS_PERSONALES=1 (p. ej. detrás de un proxy con autenticación)
+MAPA_DATOS_PERSONALES = os.environ.get('MAPA_DATOS_PERSONALES', '0') == '1'
+
+@server.route('/mapa/<capa>')
+def pagina_mapa(capa):
     try:
-        spreadsheet = client.open("Raciones_2025")
-        cch = pd.DataFrame(spreadsheet.get_worksheet(0).get_all_records())
-        ci = pd.DataFrame(spreadsheet.get_worksheet(1).get_all_records())
-        cj = pd.DataFrame(spreadsheet.get_worksheet(2).get_all_records())
-        cai = pd.DataFrame(spreadsheet.get_worksheet(3).get_all_records())
-    except Exception as e:
-        print(f"Error al cargar datos: {str(e)}")
-        raise
+        # La página lleva adentro la versión de los datos: se revalida siempre (304 si no cambió)
+        return cacheable(Response(servicio_mapas.pagina(capa, MAPA_DATOS_PERSONALES), mimetype='text/html'))
+    except KeyError:
+        abort(404)
 
-except Exception as e:
-    print(f"Error crítico: {str(e)}")
-    cch = pd.DataFrame(columns=['Escuela', 'Fecha', 'Inscriptos', 'Presentes', 'Observaciones'])
-    ci = pd.DataFrame(columns=['Escuela', 'Fecha', 'Inscriptos', 'Presentes', 'Observaciones'])
-    cj = pd.DataFrame(columns=['Escuela', 'Fecha', 'Inscriptos', 'Presentes', 'Observaciones'])
-    cai = pd.DataFrame(columns=['Escuela', 'Fecha', 'Inscriptos', 'Presentes', 'Observaciones'])
-    print("Modo de fallo seguro activado")
+@server.route('/mapa/<capa>.geojson')
+def geojson_mapa(capa):
+    try:
+        return cacheable(Response(servicio_mapas.geojson(capa), mimetype='application/geo+json'),
+                         servicio_mapas.version(capa))
+    except (KeyError, FileNotFoundError):
+        abort(404)
+
+@server.route('/mapa/<capa>/sedes.geojson')
+def sedes_mapa(capa):
+    try:
+        return cacheable(Response(servicio_mapas.sedes_geojson(capa), mimetype='application/geo+json'),
+                         servicio_mapas.version(capa))
+    except (KeyError, FileNotFoundError):
+        abort(404)
+
+@server.route('/mapa/<capa>/grupos.geojson')
+def grupos_mapa(capa):
+    # ?z=<zoom>&bbox=oeste,sur,este,norte: participantes agrupados para esa vista
+    try:
+        zoom = int(request.args.get('z', 12))
+        bbox = request.args.get('bbox')
+        bbox = tuple(float(v) for v in bbox.split(',')) if bbox else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError(bbox)
+    except ValueError:
+        abort(400)
+    try:
+        return cacheable(Response(servicio_mapas.agrupados(capa, zoom, bbox), mimetype='application/geo+json'),
+                         servicio_mapas.version(capa))
+    except (KeyError, FileNotFoundError):
+        abort(404)
+
+# Más allá de esto el anillo de celdas a revisar crece sin sentido para una ciudad
+RADIO_MAXIMO_M = 50_000
+
+def argumento_numerico(nombre, tipo=float, defecto=None, minimo=None, maximo=None):
+    # ValueError (400) si falta, no es un número finito o está fuera de [minimo, maximo]
+    valor = request.args.get(nombre)
+    if valor is None:
+        if defecto is None:
+            raise ValueError(nombre)
+        return defecto
+    valor = tipo(valor)
+    if not math.isfinite(valor) or (minimo is not None and valor < minimo) or (maximo is not None and valor > maximo):
+        raise ValueError(nombre)
+    return valor
+
+def coordenadas():
+    return argumento_numerico('lat', minimo=-90, maximo=90), argumento_numerico('lon', minimo=-180, maximo=180)
+
+# Consultas al índice espacial: sede más cercana, participantes en un radio y captación
+@server.route('/mapa/<capa>/cercana')
+def cercana_mapa(capa):
+    # ?lat=&lon=&k=
+    try:
+        lat, lon = coordenadas()
+        k = argumento_numerico('k', int, 1, minimo=1, maximo=100)
+    except ValueError:
+        abort(400)
+    try:
+        return jsonify(servicio_mapas.indice(capa).sede_cercana(lat, lon, k))
+    except (KeyError, FileNotFoundError):
+        abort(404)
+
+@server.route('/mapa/<capa>/radio')
+def radio_mapa(capa):
+    # ?sede=<id>&m=<metros> o ?lat=&lon=&m=<metros>
+    try:
+        radio = argumento_numerico('m', float, 2000.0, minimo=0, maximo=RADIO_MAXIMO_M)
+        if 'sede' in request.args:
+            sede = argumento_numerico('sede', int)
+        else:
+            lat, lon = coordenadas()
+    except ValueError:
+        abort(400)
+    try:
+        indice = servicio_mapas.indice(capa)
+        if 'sede' in request.args:
+            return jsonify(indice.contar_cerca_de_sede(sede, radio))
+        return jsonify(indice.contar_en_radio(lat, lon, radio))
+    except (KeyError, FileNotFoundError):
+        abort(404)
+
+@server.route('/mapa/<capa>/captacion/<int:id_sede>')
+def captacion_mapa(capa, id_sede):
+    try:
+        return jsonify(servicio_mapas.indice(capa).captacion(id_sede))
+    except (KeyError, FileNotFoundError):
+        abort(404)
+
+@server.route('/mapa/<capa>/participante/<int:id_participante>')
+def participante_mapa(capa, id_participante):
+    if not MAPA_DATOS_PERSONALES:
+        abort(404)
+    try:
+        datos = servicio_mapas.participante(capa, id_participante)
+    except (KeyError, FileNotFoundError):
+        abort(404)
+    if datos is None:
+        abort(404)
+    # Nunca en caches compartidos ni en disco del navegador
+    respuesta = jsonify(datos)
+    respuesta.headers['Cache-Control'] = 'private, no-store'
+    return respuesta
 
 # ===== 3. Layout principal =====
+# Hoja de cada programa -> prefijo de sus componentes (el mismo nombre que usa el histórico)
+PREFIJOS = PROGRAMAS
+
 dropdown_style = {
     'backgroundColor': styles['card'],
     'color': styles['text'],
@@ -131,6 +418,16 @@ app.layout = html.Div([
             'height': '40px',
             'widht': '100%'
         }),
+        html.Span(id='estado-datos', style={
+            'color': styles['text'],
+            'fontSize': '13px',
+            'margin': '10px'
+        }),
+        dcc.Interval(id='intervalo-estado', interval=10 * 1000, n_intervals=0),
+        dcc.Store(id='version-datos'),
+        # Datos de cada programa para filtrar por escuela en el navegador, y su versión
+        *[dcc.Store(id=f'datos-{prefijo}') for prefijo in PREFIJOS.values()],
+        dcc.Store(id='datos-versiones', data={}),
     ], style={'backgroundColor': styles['background']}),
     
     dcc.Tabs(id="tabs", value='tab-ci', children=[
@@ -169,32 +466,18 @@ app.layout = html.Div([
             'color': styles['accent'],
             'border': f'2px solid {styles["accent"]}'
         }),
-        dcc.Tab(label='Resumen y Alertas', value='tab-resumen', children=[
-            html.Div([
-                html.H2("Resumen General", style={'color': styles['accent']}),
-                dcc.Graph(id='resumen-graph'),
-                html.H2("Alertas", style={'color': styles['accent'], 'marginTop': '30px'}),
-                html.H3("Aparecen los centros con menos del 40% de asistencia", style={'color': styles['accent'], 'marginTop': '30px'}),               
-                html.Div(id='alertas-container', style={
-                    'backgroundColor': styles['card'],
-                    'padding': '15px',
-                    'borderRadius': '5px',
-                    'marginBottom': '20px'
-                }),
-                html.H2("Programa", style={'color': styles['accent'], 'marginTop': '30px'}),
-                dcc.Dropdown(
-                    id='tipo-centro',
-                    options=[
-                        {'label': 'Centros Infantiles', 'value': 'ci'},
-                        {'label': 'Club de Chicos', 'value': 'cch'},
-                        {'label': 'Club de Jóvenes', 'value': 'cj'},
-                    ],
-                    value='ci',
-                    style=dropdown_style
-                ),
-                dcc.Graph(id='tendencias-graph')
-            ], style={'padding': '20px'})
-        ], style={
+        dcc.Tab(label='Mapa de Sedes', value='tab-mapa', style={
+            'backgroundColor': styles['background'],
+            'color': styles['text'],
+            'border': f'1px solid {styles["accent"]}',
+            'fontWeight': 'bold',
+            'padding': '10px'
+        }, selected_style={
+            'backgroundColor': styles['card'],
+            'color': styles['accent'],
+            'border': f'2px solid {styles["accent"]}'
+        }),
+        dcc.Tab(label='Resumen y Alertas', value='tab-resumen', style={
             'backgroundColor': styles['background'],
             'color': styles['text'],
             'border': f'1px solid {styles["accent"]}',
@@ -214,7 +497,27 @@ app.layout = html.Div([
     html.Div(id='tabs-content', style={
         'backgroundColor': styles['background'],
         'padding': '20px'
-    })
+    }),
+    
+    # Panel de diagnóstico (DIAGNOSTICO=1): últimas trazas de los callbacks
+    html.Details([
+        html.Summary('Diagnóstico', style={'cursor': 'pointer', 'fontWeight': 'bold'}),
+        html.Div(id='diagnostico-trazas'),
+        html.A('Ver /metrics', href='/metrics', target='_blank', style={'color': styles['accent']})
+    ], style={
+        'position': 'fixed',
+        'bottom': '10px',
+        'right': '10px',
+        'maxWidth': '520px',
+        'maxHeight': '50vh',
+        'overflowY': 'auto',
+        'backgroundColor': 'rgba(255,255,255,0.95)',
+        'border': f'1px solid {styles["accent"]}',
+        'borderRadius': '5px',
+        'padding': '8px',
+        'fontSize': '11px',
+        'zIndex': 1000
+    }) if DIAGNOSTICO else html.Div()
 ], style={
     'backgroundColor': styles['background'],
     'minHeight': '100vh',
@@ -224,106 +527,241 @@ app.layout = html.Div([
 
 # ===== 4. Callbacks =====
 def create_tab_content(tab):
-    if tab == 'tab-ci':
+    # Lista de escuelas ya calculada al cargar la foto; las filas llegan aparte a datos-<prefijo>
+    for indice, prefijo in PREFIJOS.items():
+        if tab == f'tab-{prefijo}':
+            return crear_pestana_escuela(indice)
+    if tab == 'tab-mapa':
         return html.Div([
             dcc.Dropdown(
-                id='ci-escuela',
-                options=[{'label': e, 'value': e} for e in ci['Escuela'].unique()],
-                value=ci['Escuela'].iloc[0] if not ci.empty else None,
+                id='mapa-capa',
+                options=[
+                    {'label': 'Inscriptos por sede', 'value': 'inscriptos'},
+                    {'label': 'Control de sedes', 'value': 'control'},
+                ],
+                value='inscriptos',
+                clearable=False,
                 style=dropdown_style
             ),
-            dcc.Graph(id='ci-graph'),
-            html.Div(id='ci-table')
-        ])
-    elif tab == 'tab-cch':
-        return html.Div([
-            dcc.Dropdown(
-                id='cch-escuela',
-                options=[{'label': e, 'value': e} for e in cch['Escuela'].unique()],
-                value=cch['Escuela'].iloc[0] if not cch.empty else None,
-                style=dropdown_style
-            ),
-            dcc.Graph(id='cch-graph'),
-            html.Div(id='cch-table')
+            html.Iframe(id='mapa-iframe', src='/mapa/inscriptos', style={
+                'width': '100%',
+                'height': '650px',
+                'border': f'1px solid {styles["grid"]}',
+                'marginTop': '10px'
+            }),
+            html.H3("Consultas", style={'color': styles['accent'], 'marginTop': '20px'}),
+            html.Div([
+                dcc.Input(id='mapa-lat', type='number', placeholder='Latitud', step='any',
+                          style={'marginRight': '10px'}),
+                dcc.Input(id='mapa-lon', type='number', placeholder='Longitud', step='any',
+                          style={'marginRight': '10px'}),
+                dcc.Input(id='mapa-radio', type='number', value=2, min=0.1, max=RADIO_MAXIMO_M / 1000, step=0.1,
+                          style={'marginRight': '5px', 'width': '80px'}),
+                html.Span("km", style={'marginRight': '10px'}),
+                html.Button('Consultar', id='mapa-consultar', n_clicks=0),
+            ], style={'marginBottom': '10px'}),
+            dcc.Dropdown(id='mapa-sede', placeholder='Sede (para radio y captación)', style=dropdown_style),
+            html.Div(id='mapa-resultado', style={
+                'backgroundColor': styles['card'],
+                'padding': '15px',
+                'borderRadius': '5px',
+                'marginTop': '10px'
+            })
         ])
-    elif tab == 'tab-cj':
+    elif tab == 'tab-resumen':
+        # Como las demás pestañas, el resumen existe en el layout solo mientras está abierto:
+        # una versión nueva de los datos no recalcula sus gráficos si nadie los está mirando
+        anios = anios_disponibles()
         return html.Div([
+            html.H2("Resumen General", style={'color': styles['accent']}),
+            dcc.Graph(id='resumen-graph'),
+            html.H2("Alertas", style={'color': styles['accent'], 'marginTop': '30px'}),
+            html.H3("Aparecen los centros con menos del 40% de asistencia", style={'color': styles['accent'], 'marginTop': '30px'}),               
+            html.Div(id='alertas-container', style={
+                'backgroundColor': styles['card'],
+                'padding': '15px',
+                'borderRadius': '5px',
+                'marginBottom': '20px'
+            }),
+            html.H2("Programa", style={'color': styles['accent'], 'marginTop': '30px'}),
             dcc.Dropdown(
-                id='cj-escuela',
-                options=[{'label': e, 'value': e} for e in cj['Escuela'].unique()],
-                value=cj['Escuela'].iloc[0] if not cj.empty else None,
+                id='tipo-centro',
+                options=[
+                    {'label': 'Centros Infantiles', 'value': 'ci'},
+                    {'label': 'Club de Chicos', 'value': 'cch'},
+                    {'label': 'Club de Jóvenes', 'value': 'cj'},
+                ],
+                value='ci',
                 style=dropdown_style
             ),
-            dcc.Graph(id='cj-graph'),
-            html.Div(id='cj-table')
-        ])
-    elif tab == 'tab-cai':
-        return html.Div([
-            dcc.Dropdown(
-                id='cai-escuela',
-                options=[{'label': e, 'value': e} for e in cai['Escuela'].unique()],
-                value=cai['Escuela'].iloc[0] if not cai.empty else None,
-                style=dropdown_style
+            dcc.Graph(id='tendencias-graph'),
+            html.H2("Comparación interanual", style={'color': styles['accent'], 'marginTop': '30px'}),
+            html.P(
+                "Todavía no hay años cerrados en el histórico para comparar con el año en curso."
+                if not anios else None,
+                style={'color': styles['text']}
             ),
-            dcc.Graph(id='cai-graph'),
-            html.Div(id='cai-table')
+            html.Div([
+                dcc.Checklist(
+                    id='interanual-anios',
+                    options=[{'label': str(anio), 'value': anio} for anio in anios],
+                    value=anios[-2:],
+                    inline=True,
+                    inputStyle={'marginRight': '5px', 'marginLeft': '10px'}
+                ),
+                dcc.RadioItems(
+                    id='interanual-modo',
+                    options=[
+                        {'label': 'Año contra año', 'value': 'comparar'},
+                        {'label': 'Serie continua', 'value': 'continua'},
+                    ],
+                    value='comparar',
+                    inline=True,
+                    inputStyle={'marginRight': '5px', 'marginLeft': '10px'},
+                    style={'marginTop': '5px'}
+                ),
+            ]),
+            dcc.Graph(id='interanual-graph')
         ])
     return html.Div()
 
+@app.callback(
+    [Output('estado-datos', 'children'),
+     Output('version-datos', 'data')],
+    [Input('refresh-button', 'n_clicks'),
+     Input('intervalo-estado', 'n_intervals')],
+    [State('version-datos', 'data')]
+)
+@metricas.callback
+def actualizar_estado(n_clicks, n_intervals, version_actual):
+    # El botón solo encola la recarga; los datos nuevos llegan en un próximo intervalo
+    if dash.callback_context.triggered_id == 'refresh-button':
+        coordinador.pedir_actualizacion()
+    
+    snapshot = actualizador.snapshot
+    if snapshot.actualizado is None:
+        estado = "Sin datos cargados"
+    else:
+        estado = f"Datos actualizados: {snapshot.actualizado.strftime('%d/%m/%Y %H:%M:%S')}"
+    if coordinador.pendiente():
+        estado += " (actualizando...)"
+    elif actualizador.ultimo_error:
+        estado += " (error en la última actualización)"
+    
+    version = snapshot.id if snapshot.id != version_actual else dash.no_update
+    return estado, version
+
 @app.callback(Output('tabs-content', 'children'),
               [Input('tabs', 'value')])
+@metricas.callback
 def render_content(tab):
     return create_tab_content(tab)
 
-def create_graph_and_table(worksheet_num, escuela, title):
+@app.callback([Output('mapa-iframe', 'src'),
+               Output('mapa-sede', 'options')],
+              [Input('mapa-capa', 'value')])
+@metricas.callback
+def update_mapa(capa):
     try:
-        worksheet = client.open("Raciones_2025").get_worksheet(worksheet_num)
-        df = pd.DataFrame(worksheet.get_all_records())
-        
-        filtered = df[df['Escuela'] == escuela]
-        
-        # Crear gráfico
-        fig = px.line(
-            filtered,
-            x='Fecha',
-            y=['Inscriptos', 'Presentes'],
-            title=f"{title} - {escuela}",
-            color_discrete_sequence=[styles['accent'], '#FF0000']
-        )
-        
-        # Estilo del gráfico
-        fig.update_layout(
-            plot_bgcolor=styles['card'],
-            paper_bgcolor=styles['background'],
-            font={'color': styles['text']},
-            xaxis={'gridcolor': styles['grid']},
-            yaxis={'gridcolor': styles['grid']},
-            title={'font': {'size': 20, 'color': styles['accent']}},
-            legend_title_text='',
-            hovermode='x unified'
-        )
-        
-        # Añadir anotaciones
-        for idx, row in filtered.iterrows():
-            if row['Presentes'] == 0 and pd.notna(row.get('Observaciones', '')):
-                fig.add_annotation(
-                    x=row['Fecha'],
-                    y=0,
-                    text=row['Observaciones'],
-                    showarrow=True,
-                    arrowhead=1,
-                    ax=0,
-                    ay=-40,
-                    bgcolor="rgba(255,165,0,0.3)",
-                    bordercolor=styles['accent'],
-                    font=dict(size=10, color='blue'),
-                    yanchor='top'
-                )
-        
-        # Crear tabla
-        table = dash_table.DataTable(
-            data=filtered.to_dict('records'),
-            columns=[{'name': col, 'id': col} for col in filtered.columns],
+        sedes = servicio_mapas.sedes(capa)
+        opciones = [{'label': nombre, 'value': int(id_sede)} for id_sede, nombre in zip(sedes['id'], sedes['nombre'])]
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        opciones = []
+    return f'/mapa/{capa}', opciones
+
+def lista_resultado(titulo, filas):
+    return html.Div([html.B(titulo), html.Ul([html.Li(fila) for fila in filas])])
+
+@app.callback(
+    Output('mapa-resultado', 'children'),
+    [Input('mapa-consultar', 'n_clicks')],
+    [State('mapa-capa', 'value'),
+     State('mapa-lat', 'value'),
+     State('mapa-lon', 'value'),
+     State('mapa-radio', 'value'),
+     State('mapa-sede', 'value')],
+    prevent_initial_call=True
+)
+@metricas.callback
+def consultar_mapa(n_clicks, capa, lat, lon, radio_km, sede):
+    # Con un punto: sedes más cercanas y participantes en el radio;
+    # con una sede: participantes en el radio alrededor de ella y su captación
+    try:
+        indice = servicio_mapas.indice(capa)
+        radio = min(float(radio_km or 2) * 1000, RADIO_MAXIMO_M)
+        resultado = []
+        if lat is not None and lon is not None and math.isfinite(lat) and math.isfinite(lon):
+            resultado.append(lista_resultado("Sedes más cercanas al punto", [
+                f"{s['nombre']}: {s['distancia_m'] / 1000:.2f} km" for s in indice.sede_cercana(lat, lon, 3)
+            ]))
+            conteo = indice.contar_en_radio(lat, lon, radio)
+            resultado.append(lista_resultado(
+                f"{conteo['participantes']} participantes a menos de {radio / 1000:g} km del punto",
+                [f"{nombre}: {n}" for nombre, n in sorted(conteo['por_sede'].items(), key=lambda x: -x[1])]
+            ))
+        if sede is not None:
+            conteo = indice.contar_cerca_de_sede(sede, radio)
+            captacion = indice.captacion(sede)
+            resultado.append(lista_resultado(
+                f"{captacion['nombre']}: {conteo['participantes']} participantes viven a menos de {radio / 1000:g} km",
+                [f"{nombre}: {n}" for nombre, n in sorted(conteo['por_sede'].items(), key=lambda x: -x[1])]
+            ))
+            if captacion['participantes']:
+                resultado.append(lista_resultado("Captación", [
+                    f"Asisten: {captacion['participantes']}",
+                    f"Distancia mediana: {captacion['distancia_mediana_m'] / 1000:.2f} km "
+                    f"(90%: {captacion['distancia_p90_m'] / 1000:.2f} km)",
+                    f"Tienen otra sede más cerca: {captacion['con_otra_sede_mas_cerca']}",
+                    f"Participantes para los que es la sede más cercana: {captacion['mas_cercana_para']}",
+                ]))
+        return resultado or "Ingresá un punto (latitud y longitud) o elegí una sede"
+    except Exception as e:
+        print(f"Error en consultar_mapa: {str(e)}")
+        return html.Div("Error al consultar el mapa")
+
+# ===== Pestañas por escuela: filtrado en el navegador =====
+# Cada programa viaja una vez por versión de los datos a un dcc.Store en forma columnar;
+# elegir otra escuela filtra y redibuja en el navegador, sin pedidos al servidor.
+FILAS_TABLA = 10
+
+def plantilla_escuela():
+    # Figura de muestra con las tres trazas (Inscriptos, Presentes y días sin asistencia):
+    # el navegador copia su estilo y solo le pone los datos de la escuela elegida
+    muestra = pd.DataFrame({'Fecha': [pd.Timestamp('2025-01-01')], 'Inscriptos': [0],
+                            'Presentes': [0], 'Observaciones': ['']})
+    figura = crear_figura_escuela(muestra, '', '').to_dict()
+    for traza in figura['data']:
+        for clave in ('x', 'y', 'customdata'):
+            traza.pop(clave, None)
+    return figura
+
+def crear_pestana_escuela(indice):
+    prefijo = PREFIJOS[indice]
+    escuelas = actualizador.snapshot.escuelas.get(indice, [])
+    columnas = actualizador.snapshot.hojas[indice].columns
+    return html.Div([
+        dcc.Dropdown(
+            id=f'{prefijo}-escuela',
+            options=[{'label': e, 'value': e} for e in escuelas],
+            value=escuelas[0] if escuelas else None,
+            style=dropdown_style
+        ),
+        dcc.Graph(id=f'{prefijo}-graph'),
+        # Paginado, orden y filtro en el navegador: las filas de la escuela ya están ahí.
+        # Las fechas van en ISO para que ordenar y filtrar por fecha funcione
+        dash_table.DataTable(
+            id=f'{prefijo}-tabla',
+            data=[],
+            columns=[
+                {'name': col, 'id': col,
+                 'type': 'numeric' if col in ('Inscriptos', 'Presentes') else 'datetime' if col == 'Fecha' else 'text'}
+                for col in columnas
+            ],
+            page_action='native',
+            sort_action='native',
+            filter_action='native',
+            page_size=FILAS_TABLA,
             style_table={'overflowX': 'auto'},
             style_header={
                 'backgroundColor': styles['background'],
@@ -347,124 +785,311 @@ def create_graph_and_table(worksheet_num, escuela, title):
                     'if': {'column_id': 'Observaciones'},
                     'fontStyle': 'italic'
                 }
-            ],
-            page_size=10
+            ]
         )
-        
-        return fig, table
-        
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return px.line(), html.Div("Error al cargar datos")
+    ])
 
 @app.callback(
-    [Output('ci-graph', 'figure'),
-     Output('ci-table', 'children')],
-    [Input('ci-escuela', 'value'),
-     Input('refresh-button', 'n_clicks')]    
+    [Output(f'datos-{prefijo}', 'data') for prefijo in PREFIJOS.values()] + [Output('datos-versiones', 'data')],
+    [Input('tabs', 'value'),
+     Input('version-datos', 'data')],
+    [State('datos-versiones', 'data')]
 )
-def update_ci(escuela, n_clicks):
-    return create_graph_and_table(1, escuela, "Centros Infantiles")
+@metricas.callback
+def cargar_datos_escuelas(tab, version, versiones):
+    # Solo el programa de la pestaña abierta, y solo si el navegador tiene una versión anterior
+    snapshot = actualizador.snapshot
+    versiones = dict(versiones or {})
+    indice = next((i for i, prefijo in PREFIJOS.items() if tab == f'tab-{prefijo}'), None)
+    if indice is None or versiones.get(PREFIJOS[indice]) == snapshot.id:
+        raise PreventUpdate
+    try:
+        with metricas.etapa('columnas'):
+            datos = cache_figuras.obtener(
+                ('columnas', snapshot.id, indice),
+                lambda: dict(a_columnas(snapshot.hojas[indice]), version=snapshot.id,
+                             titulo=TITULOS[indice], plantilla=plantilla_escuela())
+            )
+    except Exception as e:
+        print(f"Error en cargar_datos_escuelas: {str(e)}")
+        raise PreventUpdate
+    versiones[PREFIJOS[indice]] = snapshot.id
+    return [datos if i == indice else dash.no_update for i in PREFIJOS] + [versiones]
 
-@app.callback(
-    [Output('cch-graph', 'figure'),
-     Output('cch-table', 'children')],
-    [Input('cch-escuela', 'value'),
-     Input('refresh-button', 'n_clicks')]
-)
-def update_cch(escuela, n_clicks):
-    return create_graph_and_table(0, escuela, "Club de Chicos")
+FILTRAR_ESCUELA_JS = """
+function(escuela, datos) {
+    const nada = window.dash_clientside.no_update;
+    if (!datos || !datos.datos.Escuela || escuela === null || escuela === undefined) {
+        return [nada, nada];
+    }
+    const columnas = datos.datos;
+    const dia = 24 * 60 * 60 * 1000;
+    const valor = (nombre, fila) => {
+        const c = columnas[nombre];
+        if (c.tipo === 'fecha') {
+            return new Date(Date.parse(c.base) + c.valores[fila] * dia).toISOString().slice(0, 10);
+        }
+        return c.tipo === 'texto' ? c.categorias[c.valores[fila]] : c.valores[fila];
+    };
 
-@app.callback(
-    [Output('cj-graph', 'figure'),
-     Output('cj-table', 'children')],
-    [Input('cj-escuela', 'value'),
-     Input('refresh-button', 'n_clicks')]
-)
-def update_cj(escuela, n_clicks):
-    return create_graph_and_table(2, escuela, "Club de Jóvenes")
+    // Filas de la escuela: Escuela viene codificada con diccionario
+    const codigo = columnas.Escuela.categorias.indexOf(escuela);
+    const filas = [];
+    columnas.Escuela.valores.forEach((v, i) => { if (v === codigo) filas.push(i); });
+    const columna = nombre => filas.map(i => valor(nombre, i));
+
+    const fechas = columna('Fecha');
+    const presentes = columna('Presentes');
+    const sinAsistencia = filas.filter((_, n) => presentes[n] === 0);
+    const figura = JSON.parse(JSON.stringify(datos.plantilla));
+    figura.layout.title.text = datos.titulo + ' - ' + escuela;
+    figura.data = figura.data.filter(traza => {
+        if (traza.name === 'Sin asistencia') {
+            traza.x = sinAsistencia.map(i => valor('Fecha', i));
+            traza.y = sinAsistencia.map(() => 0);
+            traza.customdata = sinAsistencia.map(i => valor('Observaciones', i));
+            return sinAsistencia.length > 0;
+        }
+        traza.x = fechas;
+        traza.y = traza.name === 'Presentes' ? presentes : columna(traza.name);
+        return true;
+    });
+
+    const tabla = filas.map(i => Object.fromEntries(datos.columnas.map(nombre => [nombre, valor(nombre, i)])));
+    return [figura, tabla];
+}
+"""
+
+for prefijo in PREFIJOS.values():
+    app.clientside_callback(
+        FILTRAR_ESCUELA_JS,
+        [Output(f'{prefijo}-graph', 'figure'),
+         Output(f'{prefijo}-tabla', 'data')],
+        [Input(f'{prefijo}-escuela', 'value'),
+         Input(f'datos-{prefijo}', 'data')]
+    )
+
+ALERTAS_VISIBLES = 20
+
+def crear_alertas(alertas, limite=ALERTAS_VISIBLES):
+    if alertas.empty:
+        return html.Div([
+            html.I(className="fa fa-check-circle", style={'color': 'green', 'marginRight': '10px'}),
+            "No hay alertas críticas en este momento"
+        ], style={'color': 'green'})
+    
+    # Se envían como máximo `limite` filas; "Ver todas" pide el resto al servidor
+    visibles = alertas if limite is None else alertas.head(limite)
+    contenido = [
+        dash_table.DataTable(
+            id='alertas-tabla',
+            data=visibles.to_dict('records'),
+            columns=[{'name': col, 'id': col} for col in alertas.columns],
+            style_table={'overflowX': 'auto'},
+            style_header={
+                'backgroundColor': styles['background'],
+                'color': styles['accent'],
+                'fontWeight': 'bold',
+                'border': f'1px solid {styles["accent"]}'
+            },
+            style_cell={
+                'backgroundColor': styles['card'],
+                'border': f'1px solid {styles["grid"]}',
+                'textAlign': 'left'
+            },
+            style_data_conditional=[
+                {
+                    'if': {'filter_query': '{Alerta} = "Baja asistencia"'},
+                    'color': 'red'
+                },
+                {
+                    'if': {'filter_query': '{Alerta} = "Baja matrícula"'},
+                    'color': 'orange'
+                }
+            ],
+            page_size=ALERTAS_VISIBLES
+        )
+    ]
+    if len(visibles) < len(alertas):
+        contenido.append(html.Button(
+            f'Ver todas ({len(alertas)})',
+            id='alertas-ver-todas',
+            n_clicks=0,
+            style={'marginTop': '10px'}
+        ))
+    return html.Div(contenido)
 
 @app.callback(
-    [Output('cai-graph', 'figure'),
-     Output('cai-table', 'children')],
-    [Input('cai-escuela', 'value'),
-     Input('refresh-button', 'n_clicks')]
+    Output('alertas-container', 'children', allow_duplicate=True),
+    Input('alertas-ver-todas', 'n_clicks'),
+    prevent_initial_call=True
 )
-def update_cai(escuela, n_clicks):
-    return create_graph_and_table(3, escuela, "CAI")
+@metricas.callback
+def ver_todas_alertas(n_clicks):
+    if not n_clicks:
+        return dash.no_update
+    return crear_alertas(actualizador.snapshot.agregados.alertas, limite=None)
+
+def crear_figura_resumen(resumen_tipos):
+    # Totales de la última fecha de cada programa, ya agregados en la foto
+    # Gráfico de barras con sub-barra de presentes
+    fig_resumen = go.Figure()
+
+    # Barra de inscriptos (transparente, solo para establecer el máximo)
+    fig_resumen.add_trace(go.Bar(
+        x=resumen_tipos['Tipo'],
+        y=resumen_tipos['Inscriptos'],
+        name='Inscriptos',
+        marker_color='rgba(255,0,100,0.8)',  # Rojo levemente transparente
+        hoverinfo='y+name',
+        hovertemplate='Total Inscriptos: %{y}<extra></extra>',
+        width=0.6
+    ))
+    
+    # Barra de presentes (dentro de la barra de inscriptos)
+    fig_resumen.add_trace(go.Bar(
+        x=resumen_tipos['Tipo'],
+        y=resumen_tipos['Presentes'],
+        name='Presentes',
+        marker_color=styles['accent'],  # Color principal del dashboard
+        hoverinfo='y+name',
+        hovertemplate='Presentes: %{y}<extra></extra>',
+        width=0.5  # Hace la barra más estrecha para visualización interna
+    ))
+    
+    # Personalización del layout
+    fig_resumen.update_layout(
+        title=f"Total de Inscriptos vs Presentes (Última fecha: {resumen_tipos['Fecha'].iloc[0].strftime('%d/%m/%Y')})",
+        plot_bgcolor=styles['card'],
+        paper_bgcolor=styles['background'],
+        font={'color': styles['text']},
+        xaxis={'gridcolor': styles['grid']},
+        yaxis={'gridcolor': styles['grid'], 'title': 'Cantidad'},
+        hovermode='x unified',
+        barmode='overlay',  # Superpone las barras en lugar de apilarlas
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    
+    return fig_resumen
+
+# ===== Tendencias remuestreadas =====
+TENDENCIAS = {
+    'ci': (1, "Tendencias de Inscripciones en Centros Infantiles"),
+    'cch': (0, "Tendencias de Inscripciones en Club de Chicos"),
+    'cj': (2, "Tendencias de Inscripciones en Club de Jóvenes"),
+}
+NOMBRES_FRECUENCIA = {'D': 'diario', 'W-MON': 'promedio semanal', 'MS': 'promedio mensual'}
+# Con más puntos que esto el gráfico se dibuja con WebGL (Scattergl) en lugar de SVG
+PUNTOS_WEBGL = int(os.environ.get('PUNTOS_WEBGL', 5000))
+
+def rango_zoom(relayout):
+    # relayoutData de un zoom: {'xaxis.range[0]': ..., 'xaxis.range[1]': ...} o {'xaxis.range': [...]}.
+    # Devuelve (desde, hasta), 'completo' si se volvió a la vista completa o None si no tocó el eje x
+    relayout = relayout or {}
+    if relayout.get('xaxis.autorange'):
+        return 'completo'
+    extremos = relayout.get('xaxis.range') or [relayout.get('xaxis.range[0]'), relayout.get('xaxis.range[1]')]
+    if None in extremos:
+        return None
+    # Plotly manda '2025-05-01' o '2025-05-01 12:34:56.789' según el zoom: cada extremo por separado
+    desde, hasta = (pd.to_datetime(extremo, errors='coerce') for extremo in extremos)
+    if pd.isna(desde) or pd.isna(hasta):
+        return None
+    return desde.normalize(), hasta.normalize() + pd.Timedelta(days=1)
+
+def datos_tendencias(validas, tipo_centro, zoom=None):
+    """Serie remuestreada para el rango visible: (filas, frecuencia, ventana, título).
 
+    La frecuencia sale del rango visible (todo el año, o lo que se haya hecho zoom).
+    En la frecuencia diaria solo viaja la ventana visible con un margen de un ancho
+    a cada lado, para poder desplazarse sin quedarse enseguida sin datos.
+    """
+    indice, title_tendencias = TENDENCIAS.get(tipo_centro, (None, "Tendencias de Inscripciones"))
+    df = validas.get(indice)
+    if df is None or df.empty:
+        return None, None, None, title_tendencias
+    desde, hasta = zoom if isinstance(zoom, tuple) else (df['Fecha'].min(), df['Fecha'].max())
+    frecuencia = elegir_frecuencia(desde, hasta)
+    ventana = None
+    if frecuencia == 'D' and isinstance(zoom, tuple):
+        margen = hasta - desde
+        ventana = (desde - margen, hasta + margen)
+        df = df[(df['Fecha'] >= ventana[0]) & (df['Fecha'] < ventana[1])]
+    return df, frecuencia, ventana, title_tendencias
+
+def crear_figura_tendencias(df_tendencias, frecuencia, title_tendencias, tipo_centro):
+    if df_tendencias is not None:
+        with metricas.etapa('remuestreo'):
+            df_tendencias = remuestrear(df_tendencias, frecuencia)
+    if df_tendencias is not None and not df_tendencias.empty:
+        fig_tendencias = px.line(
+            df_tendencias,
+            x='Fecha',
+            y='Inscriptos',
+            color='Escuela',
+            title=f"{title_tendencias} ({NOMBRES_FRECUENCIA[frecuencia]})",
+            color_discrete_sequence=px.colors.qualitative.Plotly,
+            render_mode='webgl' if len(df_tendencias) > PUNTOS_WEBGL else 'svg'
+        )
+        
+        fig_tendencias.update_traces(
+            line=dict(width=2),
+            hovertemplate="<b>%{fullData.name}</b><br>Fecha: %{x|%d/%m/%Y}<br>Inscriptos: %{y}<extra></extra>"
+        )
+        
+        fig_tendencias.update_layout(
+            plot_bgcolor=styles['card'],
+            paper_bgcolor=styles['background'],
+            font={'color': styles['text']},
+            xaxis={'gridcolor': styles['grid']},
+            yaxis={'gridcolor': styles['grid']},
+            hovermode='closest',
+            # Al volver con datos más finos tras un zoom se conserva el zoom del usuario
+            uirevision=tipo_centro
+        )
+    else:
+        fig_tendencias = px.line(title=title_tendencias)
+        fig_tendencias.update_layout(
+            annotations=[{
+                'text': 'No hay datos disponibles',
+                'showarrow': False,
+                'font': {'size': 16}
+            }],
+            xaxis={'visible': False},
+            yaxis={'visible': False}
+        )
+    
+    return fig_tendencias
+
+def figura_error(crear):
+    fig = crear()
+    fig.update_layout(
+        title={'text': "Error al cargar datos", 'font': {'color': 'red'}},
+        xaxis={'visible': False},
+        yaxis={'visible': False}
+    )
+    return fig
+
+# Cada salida del resumen tiene su propio callback: cambiar de programa solo
+# rehace las tendencias, y el gráfico de barras y las alertas solo cambian con la foto
 @app.callback(
-    [Output('resumen-graph', 'figure'),
-     Output('alertas-container', 'children'),
-     Output('tendencias-graph', 'figure')],
-    [Input('refresh-button', 'n_clicks'),
-     Input('tipo-centro', 'value')]
+    Output('resumen-graph', 'figure'),
+    Input('version-datos', 'data')
 )
-def update_resumen(n_clicks, tipo_centro):
+@metricas.callback
+def update_resumen(version):
     try:
-        # Cargar datos actualizados
-        spreadsheet = client.open("Raciones_2025")
-        cch = pd.DataFrame(spreadsheet.get_worksheet(0).get_all_records())
-        ci = pd.DataFrame(spreadsheet.get_worksheet(1).get_all_records())
-        cj = pd.DataFrame(spreadsheet.get_worksheet(2).get_all_records())
-        
-        def limpiar_y_convertir(df):
-            if df.empty:
-                return df
-            
-            # Convertir fechas primero
-            df['Fecha'] = pd.to_datetime(df['Fecha'], dayfirst=True, errors='coerce')
-            df = df.dropna(subset=['Fecha'])
-            
-            # Convertir Inscriptos y Presentes a numéricos
-            for col in ['Inscriptos', 'Presentes']:
-                if col in df.columns:
-                    # Convertir a string si no lo es
-                    if not pd.api.types.is_string_dtype(df[col]):
-                        df[col] = df[col].astype(str)
-                    
-                    # Extraer solo los números
-                    df[col] = df[col].str.extract(r'(\d+)', expand=False)
-                    
-                    # Convertir a numérico, reemplazar NaN con 0
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-            
-            return df
-        
-        # Limpiar todos los datasets
-        ci = limpiar_y_convertir(ci)
-        cch = limpiar_y_convertir(cch)
-        cj = limpiar_y_convertir(cj)
+        snapshot = actualizador.snapshot
+        agregados = snapshot.agregados
         
-        def obtener_resumen(df, nombre):
-            if df.empty:
-                return pd.DataFrame()
-            
-            # Filtrar solo filas con Inscriptos > 0
-            df = df[df['Inscriptos'] > 0]
-            
-            if df.empty:
-                return pd.DataFrame()
-            
-            # Obtener la última fecha con datos válidos
-            ultima_fecha = df['Fecha'].max()
-            df_reciente = df[df['Fecha'] == ultima_fecha].copy()
-            
-            # Calcular métricas
-            df_reciente['Presentismo'] = (df_reciente['Presentes'] / df_reciente['Inscriptos']) * 100
-            df_reciente['Tipo'] = nombre
-            
-            return df_reciente[['Escuela', 'Inscriptos', 'Presentes', 'Presentismo', 'Tipo', 'Fecha']]
-        
-        # Procesar cada dataset
-        ci_resumen = obtener_resumen(ci, 'Centros Infantiles')
-        cch_resumen = obtener_resumen(cch, 'Club de Chicos')
-        cj_resumen = obtener_resumen(cj, 'Club de Jóvenes')
-        
-        # Combinar todos los datos
-        todos_datos = pd.concat([df for df in [ci_resumen, cch_resumen, cj_resumen] if not df.empty])
-        
-        if todos_datos.empty:
+        if agregados.vacio:
             # Manejo de caso sin datos
             empty_bar = px.bar(title="No hay datos válidos disponibles")
             empty_bar.update_layout(
@@ -475,163 +1100,193 @@ def update_resumen(n_clicks, tipo_centro):
                     'showarrow': False
                 }]
             )
-            
-            empty_line = px.line(title="No hay datos disponibles")
-            empty_line.update_layout(
-                xaxis={'visible': False},
-                yaxis={'visible': False}
-            )
-            
-            return empty_bar, html.Div("No hay alertas (sin datos)"), empty_line
-        
-        # Crear resumen por tipo para el gráfico de barras apiladas
-        resumen_tipos = todos_datos.groupby('Tipo', as_index=False).agg({
-            'Inscriptos': 'sum',
-            'Presentes': 'sum',
-            'Fecha': 'max'
-        })
-        
-        # Gráfico de barras con sub-barra de presentes
-        fig_resumen = go.Figure()
-    
-    # Barra de inscriptos (transparente, solo para establecer el máximo)
-        fig_resumen.add_trace(go.Bar(
-            x=resumen_tipos['Tipo'],
-            y=resumen_tipos['Inscriptos'],
-            name='Inscriptos',
-            marker_color='rgba(255,0,100,0.8)',  # Rojo levemente transparente
-            hoverinfo='y+name',
-            hovertemplate='Total Inscriptos: %{y}<extra></extra>',
-            width=0.6
-        ))
+            return empty_bar
         
-        # Barra de presentes (dentro de la barra de inscriptos)
-        fig_resumen.add_trace(go.Bar(
-            x=resumen_tipos['Tipo'],
-            y=resumen_tipos['Presentes'],
-            name='Presentes',
-            marker_color=styles['accent'],  # Color principal del dashboard
-            hoverinfo='y+name',
-            hovertemplate='Presentes: %{y}<extra></extra>',
-            width=0.5  # Hace la barra más estrecha para visualización interna
-        ))
-        
-        # Personalización del layout
-        fig_resumen.update_layout(
-            title=f"Total de Inscriptos vs Presentes (Última fecha: {resumen_tipos['Fecha'].iloc[0].strftime('%d/%m/%Y')})",
-            plot_bgcolor=styles['card'],
-            paper_bgcolor=styles['background'],
-            font={'color': styles['text']},
-            xaxis={'gridcolor': styles['grid']},
-            yaxis={'gridcolor': styles['grid'], 'title': 'Cantidad'},
-            hovermode='x unified',
-            barmode='overlay',  # Superpone las barras en lugar de apilarlas
-            showlegend=True,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
+        with metricas.etapa('figura'):
+            return cache_figuras.obtener(
+                ('resumen', snapshot.id),
+                lambda: crear_figura_resumen(agregados.totales)
             )
-        )    
-        
+    
+    except Exception as e:
+        print(f"Error en update_resumen: {str(e)}")
+        return figura_error(px.bar)
+
+@app.callback(
+    Output('alertas-container', 'children'),
+    Input('version-datos', 'data')
+)
+@metricas.callback
+def update_alertas(version):
+    try:
+        agregados = actualizador.snapshot.agregados
+        if agregados.vacio:
+            return html.Div("No hay alertas (sin datos)")
         # ALERTAS!
-        alertas = []
-        baja_asistencia = todos_datos[todos_datos['Presentismo'] < 40]
-        if not baja_asistencia.empty:
-            for _, row in baja_asistencia.iterrows():
-                alertas.append(
-                    html.Div([
-                        html.I(className="fa fa-exclamation-triangle", style={'color': 'red', 'marginRight': '10px'}),
-                        html.Span(f"Baja asistencia en {row['Escuela']} ({row['Tipo']}) {row['Fecha'].strftime('%d/%m/%Y')}: {row['Presentismo']:.1f}%"),
-                    ], style={'color': 'red', 'marginBottom': '10px'})
-                )
-        
-        baja_matricula = todos_datos[todos_datos['Inscriptos'] < 30]
-        if not baja_matricula.empty:
-            for _, row in baja_matricula.iterrows():
-                alertas.append(
-                    html.Div([
-                        html.I(className="fa fa-user-times", style={'color': 'orange', 'marginRight': '10px'}),
-                        html.Span(f"Baja matrícula en {row['Escuela']} ({row['Tipo']}) {row['Fecha'].strftime('%d/%m/%Y')}: {row['Inscriptos']} inscriptos"),
-                    ], style={'color': 'orange', 'marginBottom': '10px'})
-                )
-        
-        if not alertas:
-            alertas = html.Div([
-                html.I(className="fa fa-check-circle", style={'color': 'green', 'marginRight': '10px'}),
-                "No hay alertas críticas en este momento"
-            ], style={'color': 'green'})
-        
-        # Grafico de TENDENCIAS!
+        with metricas.etapa('alertas'):
+            return crear_alertas(agregados.alertas)
+    
+    except Exception as e:
+        print(f"Error en update_alertas: {str(e)}")
+        return html.Div("Error al generar alertas")
+
+@app.callback(
+    Output('tendencias-graph', 'figure'),
+    [Input('version-datos', 'data'),
+     Input('tipo-centro', 'value'),
+     Input('tendencias-graph', 'relayoutData')]
+)
+@metricas.callback
+def update_tendencias(version, tipo_centro, relayout):
+    try:
+        snapshot = actualizador.snapshot
+        agregados = snapshot.agregados
         
-        df_tendencias = None
-        if tipo_centro == 'ci':
-            df_tendencias = ci[ci['Inscriptos'] > 0]  # Solo datos válidos
-            title_tendencias = "Tendencias de Inscripciones en Centros Infantiles"
-        elif tipo_centro == 'cch':
-            df_tendencias = cch[cch['Inscriptos'] > 0]
-            title_tendencias = "Tendencias de Inscripciones en Club de Chicos"
-        elif tipo_centro == 'cj':
-            df_tendencias = cj[cj['Inscriptos'] > 0]
-            title_tendencias = "Tendencias de Inscripciones en Club de Jóvenes"
+        # Un zoom vuelve a pedir la serie con la resolución que corresponde al rango visible.
+        # Al cambiar de programa se empieza de nuevo por la vista completa.
+        disparador = dash.callback_context.triggered_id
+        zoom = rango_zoom(relayout) if disparador != 'tipo-centro' else None
+        if disparador == 'tendencias-graph' and zoom is None:
+            return dash.no_update
         
-        if df_tendencias is not None and not df_tendencias.empty:
-            fig_tendencias = px.line(
-                df_tendencias,
-                x='Fecha',
-                y='Inscriptos',
-                color='Escuela',
-                title=title_tendencias,
-                color_discrete_sequence=px.colors.qualitative.Plotly
-            )
-            
-            fig_tendencias.update_traces(
-                line=dict(width=2),
-                hovertemplate="<b>%{fullData.name}</b><br>Fecha: %{x|%d/%m/%Y}<br>Inscriptos: %{y}<extra></extra>"
-            )
-            
-            fig_tendencias.update_layout(
-                plot_bgcolor=styles['card'],
-                paper_bgcolor=styles['background'],
-                font={'color': styles['text']},
-                xaxis={'gridcolor': styles['grid']},
-                yaxis={'gridcolor': styles['grid']},
-                hovermode='closest'
-            )
-        else:
-            fig_tendencias = px.line(title=title_tendencias)
-            fig_tendencias.update_layout(
-                annotations=[{
-                    'text': 'No hay datos disponibles',
-                    'showarrow': False,
-                    'font': {'size': 16}
-                }],
+        if agregados.vacio:
+            empty_line = px.line(title="No hay datos disponibles")
+            empty_line.update_layout(
                 xaxis={'visible': False},
                 yaxis={'visible': False}
             )
+            return empty_line
         
-        return fig_resumen, alertas, fig_tendencias
+        # Grafico de TENDENCIAS!
+        with metricas.etapa('datos'):
+            df, frecuencia, ventana, titulo = datos_tendencias(agregados.validas, tipo_centro, zoom)
+        with metricas.etapa('figura'):
+            return cache_figuras.obtener(
+                ('tendencias', snapshot.id, tipo_centro, frecuencia, ventana),
+                lambda: crear_figura_tendencias(df, frecuencia, titulo, tipo_centro)
+            )
     
     except Exception as e:
-        print(f"Error en update_resumen: {str(e)}")
-        
-        error_fig = px.bar()
-        error_fig.update_layout(
-            title={'text': "Error al cargar datos", 'font': {'color': 'red'}},
-            xaxis={'visible': False},
-            yaxis={'visible': False}
-        )
-        
-        error_line = px.line()
-        error_line.update_layout(
-            title={'text': "Error al cargar datos", 'font': {'color': 'red'}},
+        print(f"Error en update_tendencias: {str(e)}")
+        return figura_error(px.line)
+
+# ===== Comparación entre años =====
+# El año en curso sale de la foto en memoria; cada año cerrado, de su partición
+# congelada del programa elegido. Nada de esto consulta a Google Sheets.
+def anios_disponibles():
+    # Sin años cerrados no hay comparación: no se ofrece el año en curso solo
+    cerrados = [anio for anio in almacen.anios() if anio < ANIO_PLANILLA]
+    return cerrados + [ANIO_PLANILLA] if cerrados else []
+
+def diarios_por_anio(snapshot, indice, anios):
+    diarios = {}
+    for anio in anios:
+        if anio == ANIO_PLANILLA:
+            diarios[anio] = snapshot.agregados.diarios.get(indice)
+        else:
+            diarios[anio] = almacen.diarios(anio, indice)
+    return diarios
+
+def crear_figura_interanual(diarios, modo, titulo):
+    alinear = modo == 'comparar'
+    with metricas.etapa('remuestreo'):
+        tabla = comparacion_interanual(diarios, alinear=alinear)
+    if tabla.empty:
+        fig = px.line(title=titulo)
+        fig.update_layout(
+            annotations=[{
+                'text': 'No hay datos disponibles',
+                'showarrow': False,
+                'font': {'size': 16}
+            }],
             xaxis={'visible': False},
             yaxis={'visible': False}
         )
-        
-        return error_fig, html.Div("Error al generar alertas"), error_line
+        return fig
+
+    fig = px.line(
+        tabla,
+        x='Fecha',
+        y='Inscriptos',
+        color='Anio',
+        title=f"{titulo} (promedio semanal)",
+        labels={'Anio': 'Año'},
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    # Año contra año: las fechas están llevadas a un mismo año, solo importan día y mes
+    formato = '%d/%m' if alinear else '%d/%m/%Y'
+    fig.update_traces(
+        line=dict(width=2),
+        hovertemplate=f"<b>%{{fullData.name}}</b><br>Semana del %{{x|{formato}}}<br>Inscriptos: %{{y}}<extra></extra>"
+    )
+    fig.update_layout(
+        plot_bgcolor=styles['card'],
+        paper_bgcolor=styles['background'],
+        font={'color': styles['text']},
+        xaxis={'gridcolor': styles['grid'], 'tickformat': '%b' if alinear else None},
+        yaxis={'gridcolor': styles['grid']},
+        hovermode='x unified' if alinear else 'closest'
+    )
+    return fig
+
+@app.callback(
+    Output('interanual-graph', 'figure'),
+    [Input('version-datos', 'data'),
+     Input('tipo-centro', 'value'),
+     Input('interanual-anios', 'value'),
+     Input('interanual-modo', 'value')]
+)
+@metricas.callback
+def update_interanual(version, tipo_centro, anios, modo):
+    try:
+        snapshot = actualizador.snapshot
+        indice, titulo = TENDENCIAS.get(tipo_centro, (None, "Tendencias de Inscripciones"))
+        anios = sorted(anios or [])
+        with metricas.etapa('datos'):
+            diarios = diarios_por_anio(snapshot, indice, anios)
+        # Los años cerrados no cambian salvo que se vuelvan a congelar: su fecha de congelado va en la clave
+        with metricas.etapa('figura'):
+            return cache_figuras.obtener(
+                ('interanual', snapshot.id, tipo_centro, tuple(anios), almacen.firma(anios), modo),
+                lambda: crear_figura_interanual(diarios, modo, titulo)
+            )
+
+    except Exception as e:
+        print(f"Error en update_interanual: {str(e)}")
+        return figura_error(px.line)
+
+
+# ===== Panel de diagnóstico =====
+TRAZAS_VISIBLES = 15
+
+def crear_diagnostico(trazas):
+    celda = {'padding': '2px 6px', 'borderBottom': f'1px solid {styles["grid"]}', 'textAlign': 'left'}
+    filas = [html.Tr([html.Th(t, style=celda) for t in ('Hora', 'Callback', 'ms', 'Pedido ms', 'KB', 'Etapas (ms)')])]
+    for traza in reversed(trazas[-TRAZAS_VISIBLES:]):
+        etapas = ' · '.join(f"{nombre} {segundos * 1000:.0f}" for nombre, segundos in traza['etapas'].items())
+        pedido = traza.get('pedido_segundos')
+        filas.append(html.Tr([
+            html.Td(traza['hora'], style=celda),
+            html.Td(traza['callback'], style=celda),
+            html.Td(f"{traza.get('segundos', 0) * 1000:.0f}", style=celda),
+            html.Td(f"{pedido * 1000:.0f}" if pedido is not None else '-', style=celda),
+            html.Td(f"{traza['bytes'] / 1024:.1f}" if 'bytes' in traza else '-', style=celda),
+            html.Td(etapas, style=celda),
+        ]))
+    resumen = f"Cache de figuras: {cache_figuras.hits} en memoria, {cache_figuras.hits_disco} en disco, {cache_figuras.misses} construidas"
+    if conexion is not None:
+        e = conexion.estadisticas
+        resumen += f" | Sheets: {e['llamadas']} llamadas, {e['reintentos']} reintentos, {e['bytes'] / 1024 / 1024:.1f} MB"
+    return html.Div([html.Div(resumen, style={'margin': '4px 0'}), html.Table(filas, style={'borderCollapse': 'collapse'})])
+
+if DIAGNOSTICO:
+    # Sin @metricas.callback: el panel no se mide a sí mismo
+    @app.callback(
+        Output('diagnostico-trazas', 'children'),
+        Input('intervalo-estado', 'n_intervals')
+    )
+    def actualizar_diagnostico(n_intervals):
+        return crear_diagnostico(list(metricas.recientes))
 
 
 # ===== 5. Configuración para Render =====
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark de punta a punta del dashboard contra la planilla falsa.
+
+Importa app.py sin credenciales, le conecta una `PlanillaFalsa` (ver
+hojas_falsas.py) y mide:
+
+- la carga de las hojas: descarga completa, incremental tras agregar filas y
+  completa forzada por el botón, con llamadas y reintentos contra Sheets;
+- cada callback llamado directamente, como lo haría Dash: latencia p50/p95,
+  bytes de la respuesta serializada y pico de memoria (tracemalloc, en una
+  pasada aparte para no inflar los tiempos).
+
+Las hojas sintéticas son de 2025, así que ese es el año en curso; con
+--anios-cerrados se congelan además otros tantos años anteriores (las mismas
+hojas corridas de año) para medir la comparación interanual.
+
+El cache de figuras está apagado salvo con --cache. Con --guardar se escriben los
+resultados en JSON y con --comparar se contrastan con uno anterior: sale con
+código 1 si algún p95 o payload empeoró más que --tolerancia.
+
+Uso: python benchmarks/bench_callbacks.py [--filas 50000] [--repeticiones 30]
+         [--latencia 0.2] [--tasa-error 0.05] [--guardar base.json] [--comparar base.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextvars import copy_context
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from hojas_falsas import ClienteFalso, PlanillaFalsa  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else float('nan')
+
+
+def llamar_callback(funcion, disparador, *args):
+    # Los callbacks consultan callback_context.triggered_id: se arma uno como el de Dash
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def ejecutar():
+        context_value.set(AttributeDict(triggered_inputs=[{'prop_id': disparador, 'value': 1}]))
+        return funcion(*args)
+    return copy_context().run(ejecutar)
+
+
+def casos(app, rng):
+    """(nombre, funcion, disparador, generador de argumentos) de cada callback a medir."""
+    snapshot = app.actualizador.snapshot
+    version = snapshot.id
+
+    def programa(prefijo):
+        # Con `versiones` vacío el navegador no tiene nada: se manda el programa entero
+        return lambda: (f'tab-{prefijo}', version, {})
+
+    def rango():
+        import pandas as pd
+        desde = pd.Timestamp('2025-03-01') + pd.Timedelta(days=rng.randrange(200))
+        return (version, rng.choice(['ci', 'cch', 'cj']),
+                {'xaxis.range[0]': str(desde.date()), 'xaxis.range[1]': str((desde + pd.Timedelta(days=30)).date())})
+
+    return [
+        ('render_content', app.render_content, 'tabs.value',
+         lambda: (rng.choice(['tab-ci', 'tab-cch', 'tab-cj', 'tab-mapa', 'tab-resumen']),)),
+        ('cargar_datos_escuelas (ci)', app.cargar_datos_escuelas, 'tabs.value', programa('ci')),
+        ('cargar_datos_escuelas (cch)', app.cargar_datos_escuelas, 'tabs.value', programa('cch')),
+        ('cargar_datos_escuelas (cj)', app.cargar_datos_escuelas, 'tabs.value', programa('cj')),
+        ('cargar_datos_escuelas (cai)', app.cargar_datos_escuelas, 'tabs.value', programa('cai')),
+        ('update_resumen', app.update_resumen, 'version-datos.data', lambda: (version,)),
+        ('update_alertas', app.update_alertas, 'version-datos.data', lambda: (version,)),
+        ('update_tendencias', app.update_tendencias, 'tipo-centro.value',
+         lambda: (version, rng.choice(['ci', 'cch', 'cj']), None)),
+        ('update_tendencias (zoom)', app.update_tendencias, 'tendencias-graph.relayoutData', rango),
+        ('update_interanual', app.update_interanual, 'interanual-anios.value',
+         lambda: (version, rng.choice(['ci', 'cch', 'cj']), app.anios_disponibles(),
+                  rng.choice(['comparar', 'continua']))),
+    ]
+
+
+def medir_callbacks(app, repeticiones, semilla):
+    import plotly.io.json as pio_json
+
+    resultados = {}
+    for nombre, funcion, disparador, argumentos in casos(app, random.Random(semilla)):
+        tiempos, tamanos = [], []
+        llamar_callback(funcion, disparador, *argumentos())   # calentamiento
+        for _ in range(repeticiones):
+            args = argumentos()
+            inicio = time.perf_counter()
+            respuesta = llamar_callback(funcion, disparador, *args)
+            tiempos.append(time.perf_counter() - inicio)
+            tamanos.append(len(pio_json.to_json_plotly(respuesta).encode('utf-8')))
+
+        # Memoria en otra pasada: tracemalloc hace todo varias veces más lento
+        pico = 0
+        tracemalloc.start()
+        for _ in range(min(repeticiones, 5)):
+            args = argumentos()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            llamar_callback(funcion, disparador, *args)
+            pico = max(pico, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+        resultados[nombre] = {
+            'p50_ms': percentil(tiempos, 0.5) * 1000,
+            'p95_ms': percentil(tiempos, 0.95) * 1000,
+            'bytes': int(percentil(tamanos, 0.5)),
+            'pico_mb': pico / 1024 / 1024,
+        }
+    return resultados
+
+
+def medir_carga(app, planilla, filas_nuevas):
+    resultados = {}
+    pasos = [
+        ('carga completa', lambda: None),
+        (f'incremental (+{filas_nuevas} filas)', lambda: planilla.agregar_filas(filas_nuevas)),
+        ('completa forzada', app.invalidar_todo),
+    ]
+    for nombre, preparar in pasos:
+        preparar()
+        antes = dict(app.conexion.estadisticas)
+        inicio = time.perf_counter()
+        app.actualizador.actualizar()
+        if app.actualizador.ultimo_error:
+            raise RuntimeError(app.actualizador.ultimo_error)
+        resultados[nombre] = {
+            'segundos': time.perf_counter() - inicio,
+            'llamadas': app.conexion.estadisticas['llamadas'] - antes['llamadas'],
+            'reintentos': app.conexion.estadisticas['reintentos'] - antes['reintentos'],
+        }
+    return resultados
+
+
+def congelar_anios(planilla, cantidad, anio_actual):
+    # Las mismas hojas de la planilla falsa, corridas `n` años para atrás (sin pasar
+    # por su API, para no sumar llamadas, latencia ni errores a la medición)
+    import pandas as pd
+    from datos import _a_registros, normalizar
+    from historico import congelar
+
+    hojas = {i: normalizar(_a_registros(h.valores[0], h.valores[1:])) for i, h in enumerate(planilla.hojas)}
+    for n in range(1, cantidad + 1):
+        corridas = {i: df.assign(Fecha=df['Fecha'] - pd.DateOffset(years=n)) for i, df in hojas.items()}
+        congelar(anio_actual - n, corridas, origen='planilla falsa')
+
+
+def comparar(actual, base, tolerancia):
+    regresiones = []
+    for nombre, medida in actual['callbacks'].items():
+        anterior = base.get('callbacks', {}).get(nombre)
+        if anterior is None:
+            continue
+        for clave in ('p95_ms', 'bytes'):
+            if anterior[clave] and medida[clave] > anterior[clave] * (1 + tolerancia):
+                regresiones.append(f"{nombre}: {clave} {anterior[clave]:.1f} -> {medida[clave]:.1f}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los callbacks del dashboard contra una planilla falsa')
+    parser.add_argument('--filas', type=int, default=50_000, help='filas por hoja')
+    parser.add_argument('--escuelas', type=int, default=300)
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--latencia', type=float, default=0.0, help='segundos por llamada a Sheets')
+    parser.add_argument('--por-celda', type=float, default=0.0, help='segundos extra por celda devuelta')
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='probabilidad de 429 por llamada')
+    parser.add_argument('--filas-nuevas', type=int, default=200)
+    parser.add_argument('--anios-cerrados', type=int, default=2, help='años anteriores congelados en el histórico')
+    parser.add_argument('--cache', action='store_true', help='medir con el cache de figuras en memoria')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--guardar')
+    parser.add_argument('--comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    args = parser.parse_args()
+    guardar = os.path.abspath(args.guardar) if args.guardar else None
+    base = os.path.abspath(args.comparar) if args.comparar else None
+
+    directorio = tempfile.mkdtemp(prefix='bench_callbacks_')
+    # Antes de importar app: nada de disco compartido ni hilos de fondo
+    os.environ.update(DIRECTORIO_SNAPSHOTS=directorio, DIRECTORIO_HISTORICO=os.path.join(directorio, 'historico'),
+                      ANIO_ACTUAL='2025', CACHE_FIGURAS_DIR='',
+                      CACHE_FIGURAS_MAX='256' if args.cache else '0', INTERVALO_ACTUALIZACION='86400')
+    os.chdir(RAIZ)
+    import app
+    from historico import nombre_planilla
+    from sheets import ConexionSheets
+
+    planilla = PlanillaFalsa(filas=args.filas, escuelas=args.escuelas, latencia=args.latencia,
+                             por_celda=args.por_celda, tasa_error=args.tasa_error, semilla=args.semilla)
+    app.conexion = ConexionSheets(None, nombre_planilla(app.ANIO_PLANILLA), cliente=ClienteFalso(planilla),
+                                  espera_base=0.05)
+    congelar_anios(planilla, args.anios_cerrados, app.ANIO_PLANILLA)
+
+    print(f"Planilla falsa: 4 hojas x {args.filas} filas, {args.escuelas} escuelas, latencia {args.latencia:g} s, "
+          f"errores {args.tasa_error:.0%}, cache {'sí' if args.cache else 'no'}, "
+          f"{args.anios_cerrados} años congelados")
+    carga = medir_carga(app, planilla, args.filas_nuevas)
+    for nombre, medida in carga.items():
+        print(f"{nombre:>28}: {medida['segundos'] * 1000:9.1f} ms | "
+              f"{medida['llamadas']} llamadas | {medida['reintentos']} reintentos")
+
+    callbacks = medir_callbacks(app, args.repeticiones, args.semilla)
+    shutil.rmtree(directorio, ignore_errors=True)
+    print(f"\n{'callback':>28}  {'p50 ms':>8}  {'p95 ms':>8}  {'bytes':>9}  {'pico MB':>8}")
+    for nombre, medida in callbacks.items():
+        print(f"{nombre:>28}  {medida['p50_ms']:8.1f}  {medida['p95_ms']:8.1f}  "
+              f"{medida['bytes']:9d}  {medida['pico_mb']:8.1f}")
+
+    resultados = {'parametros': vars(args), 'carga': carga, 'callbacks': callbacks}
+    if guardar:
+        with open(guardar, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    if base:
+        with open(base, encoding='utf-8') as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        for linea in regresiones:
+            print(f"REGRESIÓN {linea}")
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
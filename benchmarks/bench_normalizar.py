@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark de datos.normalizar sobre una hoja sintética.
+
+Uso: python benchmarks/bench_normalizar.py [filas] [repeticiones]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datos import normalizar  # noqa: E402
+
+
+def hoja_sintetica(filas, escuelas=300, semilla=0):
+    # Parecida a lo que devuelve get_all_records(): fechas dd/mm/aaaa como texto,
+    # números mezclados con algunas celdas de texto libre o vacías
+    rng = np.random.default_rng(semilla)
+    fechas = pd.Timestamp('2025-03-01') + pd.to_timedelta(rng.integers(0, 270, filas), unit='D')
+    inscriptos = rng.integers(5, 120, filas).astype(object)
+    presentes = rng.integers(0, 100, filas).astype(object)
+    texto = rng.random(filas) < 0.02
+    inscriptos[texto] = [f"{n} aprox" for n in inscriptos[texto]]
+    presentes[rng.random(filas) < 0.01] = ''
+    return pd.DataFrame({
+        'Escuela': [f"Escuela {i}" for i in rng.integers(0, escuelas, filas)],
+        'Fecha': fechas.strftime('%d/%m/%Y'),
+        'Inscriptos': inscriptos,
+        'Presentes': presentes,
+        'Observaciones': np.where(rng.random(filas) < 0.05, 'Sin clases', ''),
+    })
+
+
+def limpiar_y_convertir(df):
+    # Versión anterior (update_resumen), para comparar
+    df = df.copy()
+    df['Fecha'] = pd.to_datetime(df['Fecha'], dayfirst=True, errors='coerce')
+    df = df.dropna(subset=['Fecha'])
+    for col in ['Inscriptos', 'Presentes']:
+        if not pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype(str)
+        df[col] = df[col].str.extract(r'(\d+)', expand=False)
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    return df
+
+
+def medir(funcion, df, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(df)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), sum(tiempos) / len(tiempos)
+
+
+if __name__ == '__main__':
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    df = hoja_sintetica(filas)
+    print(f"Hoja sintética: {filas} filas, {repeticiones} repeticiones")
+    for nombre, funcion in [('limpiar_y_convertir', limpiar_y_convertir), ('normalizar', normalizar)]:
+        minimo, promedio = medir(funcion, df, repeticiones)
+        print(f"{nombre:>20}: mín {minimo * 1000:8.1f} ms | prom {promedio * 1000:8.1f} ms")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Prueba de carga: throughput del dashboard con 1, 2, 4... workers de gunicorn.
+
+Guarda un snapshot sintético de 2025 en un directorio temporal (con su propio
+histórico), levanta gunicorn con cada cantidad de workers (sin credenciales:
+nadie llama a Google) y pega desde varios hilos al callback que manda los datos de un programa al navegador
+(elegir la escuela ya no pasa por el servidor). El cache de figuras se
+desactiva para medir el costo de armar cada respuesta.
+
+Uso: python benchmarks/bench_workers.py [workers,...] [segundos] [concurrencia]
+     python benchmarks/bench_workers.py 1,2,4 20 16
+"""
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_normalizar import hoja_sintetica  # noqa: E402
+from datos import Snapshot  # noqa: E402
+from snapshots import guardar_snapshot  # noqa: E402
+
+ESCUELAS = 300
+ANIO = 2025   # el de las fechas de hoja_sintetica
+PREFIJOS = ['cch', 'ci', 'cj', 'cai']
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def cuerpo_callback(prefijo, version):
+    salidas = [f'datos-{p}' for p in PREFIJOS] + ['datos-versiones']
+    return json.dumps({
+        'output': '..' + '...'.join(f'{s}.data' for s in salidas) + '..',
+        'outputs': [{'id': s, 'property': 'data'} for s in salidas],
+        'inputs': [{'id': 'tabs', 'property': 'value', 'value': f'tab-{prefijo}'},
+                   {'id': 'version-datos', 'property': 'data', 'value': version}],
+        'changedPropIds': ['tabs.value'],
+        'state': [{'id': 'datos-versiones', 'property': 'data', 'value': {}}],
+    }).encode('utf-8')
+
+
+def esperar(url, segundos=60):
+    limite = time.time() + segundos
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.5)
+    raise RuntimeError(f"El servidor no respondió en {url}")
+
+
+def cargar(url, segundos, concurrencia, version):
+    latencias, errores = [], [0]
+    lock = threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def cliente(semilla):
+        rng = random.Random(semilla)
+        while time.perf_counter() < fin:
+            pedido = urllib.request.Request(
+                url, data=cuerpo_callback(rng.choice(PREFIJOS), version),
+                headers={'Content-Type': 'application/json'}
+            )
+            inicio = time.perf_counter()
+            try:
+                urllib.request.urlopen(pedido, timeout=60).read()
+                with lock:
+                    latencias.append(time.perf_counter() - inicio)
+            except Exception:
+                with lock:
+                    errores[0] += 1
+
+    hilos = [threading.Thread(target=cliente, args=(n,)) for n in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return sorted(latencias), errores[0]
+
+
+def medir(workers, segundos, concurrencia, directorio):
+    puerto = puerto_libre()
+    # Año fijo e histórico temporal: nada se congela ni se lee en historico/ del repo
+    entorno = dict(os.environ, DIRECTORIO_SNAPSHOTS=os.path.join(directorio, 'snapshots'),
+                   DIRECTORIO_HISTORICO=os.path.join(directorio, 'historico'), ANIO_ACTUAL=str(ANIO),
+                   CACHE_FIGURAS_DIR='', CACHE_FIGURAS_MAX='0', INTERVALO_ACTUALIZACION='86400', PORT=str(puerto))
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:server', '--bind', f'127.0.0.1:{puerto}',
+         '--workers', str(workers), '--timeout', '120', '--preload'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base = f'http://127.0.0.1:{puerto}'
+        esperar(base + '/')
+        cargar(base + '/_dash-update-component', 2, concurrencia, 1)   # calentamiento
+        latencias, errores = cargar(base + '/_dash-update-component', segundos, concurrencia, 1)
+    finally:
+        proceso.terminate()
+        proceso.wait()
+    return latencias, errores
+
+
+if __name__ == '__main__':
+    lista = [int(w) for w in (sys.argv[1] if len(sys.argv) > 1 else '1,2,4').split(',')]
+    segundos = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    concurrencia = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    with tempfile.TemporaryDirectory() as directorio:
+        hojas = {i: hoja_sintetica(50_000, escuelas=ESCUELAS, semilla=i) for i in range(4)}
+        snapshot = Snapshot(hojas, version=1, actualizado=datetime.now())
+        guardar_snapshot(snapshot, os.path.join(directorio, 'snapshots'), anio=ANIO)
+        print(f"{os.cpu_count()} CPU, {segundos:g} s por medición, {concurrencia} clientes")
+        base = None
+        for workers in lista:
+            latencias, errores = medir(workers, segundos, concurrencia, directorio)
+            rps = len(latencias) / segundos
+            base = base or rps
+            p50 = latencias[len(latencias) // 2] * 1000 if latencias else float('nan')
+            p95 = latencias[int(len(latencias) * 0.95)] * 1000 if latencias else float('nan')
+            print(f"{workers:>2} workers: {rps:7.1f} req/s (x{rps / base:.2f}) | "
+                  f"p50 {p50:7.1f} ms | p95 {p95:7.1f} ms | errores {errores}")
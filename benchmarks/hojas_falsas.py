@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Planilla de Google Sheets falsa, en memoria, para medir sin red ni credenciales.
+
+Imita la parte de gspread que usa el dashboard: `cliente.open()` /
+`open_by_key()`, `planilla.worksheets()`, `planilla.values_batch_get()` y
+`hoja.get_all_records()`. Las hojas salen de `hoja_sintetica` con los valores
+como texto, igual que los devuelve la API. Cada llamada puede tardar
+`latencia` segundos (más `por_celda` por cada celda devuelta) y fallar con
+probabilidad `tasa_error` con un `APIError` del código `estado_error`, para
+ejercitar los reintentos de `ConexionSheets`.
+
+    planilla = PlanillaFalsa(filas=50_000, latencia=0.3, tasa_error=0.05)
+    conexion = ConexionSheets(None, nombre_planilla(2025), cliente=ClienteFalso(planilla))
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+from gspread.exceptions import APIError
+from gspread.utils import a1_range_to_grid_range, numericise_all
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_normalizar import hoja_sintetica  # noqa: E402
+
+
+def _sin_vacias_al_final(fila):
+    # La API recorta las celdas vacías al final de cada fila
+    fin = len(fila)
+    while fin and fila[fin - 1] == '':
+        fin -= 1
+    return fila[:fin]
+
+
+def _valores(df):
+    filas = df.astype(str).values.tolist()
+    return [list(df.columns)] + [_sin_vacias_al_final(f) for f in filas]
+
+
+def _error_api(estado, mensaje):
+    respuesta = requests.models.Response()
+    respuesta.status_code = estado
+    respuesta._content = json.dumps({'error': {'code': estado, 'message': mensaje}}).encode()
+    return APIError(respuesta)
+
+
+def _separar_rango(rango):
+    # "'Hoja 1'!A5:E" -> ('Hoja 1', 'A5:E'); "'Hoja 1'" -> ('Hoja 1', None)
+    titulo, _, celdas = rango.partition('!')
+    if titulo.startswith("'") and titulo.endswith("'"):
+        titulo = titulo[1:-1].replace("''", "'")
+    return titulo, celdas or None
+
+
+class HojaFalsa:
+    def __init__(self, planilla, titulo, valores):
+        self.planilla = planilla
+        self.title = titulo
+        self.valores = valores   # encabezado + filas, todo texto
+
+    def get_all_records(self):
+        self.planilla._llamada(sum(map(len, self.valores)))
+        encabezado = self.valores[0]
+        ancho = len(encabezado)
+        return [dict(zip(encabezado, numericise_all(list(f) + [''] * (ancho - len(f)))))
+                for f in self.valores[1:]]
+
+    def recortar(self, rango):
+        if rango is None:
+            return self.valores
+        grilla = a1_range_to_grid_range(rango)
+        filas = self.valores[grilla.get('startRowIndex', 0):grilla.get('endRowIndex')]
+        desde, hasta = grilla.get('startColumnIndex', 0), grilla.get('endColumnIndex')
+        return [_sin_vacias_al_final(f[desde:hasta]) for f in filas]
+
+
+class PlanillaFalsa:
+    """Planilla con `hojas` hojas de `filas` registros diarios cada una."""
+
+    def __init__(self, filas=50_000, hojas=4, escuelas=300, latencia=0.0, por_celda=0.0,
+                 tasa_error=0.0, estado_error=429, semilla=0):
+        self.id = 'planilla-falsa'
+        self.latencia = latencia
+        self.por_celda = por_celda
+        self.tasa_error = tasa_error
+        self.estado_error = estado_error
+        self.escuelas = escuelas
+        self.estadisticas = {'llamadas': 0, 'errores': 0, 'celdas': 0}
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._semilla = semilla
+        self.hojas = [
+            HojaFalsa(self, f"Hoja {i}", _valores(hoja_sintetica(filas, escuelas=escuelas, semilla=semilla + i)))
+            for i in range(hojas)
+        ]
+
+    def _llamada(self, celdas=0):
+        with self._lock:
+            self.estadisticas['llamadas'] += 1
+            falla = self._rng.random() < self.tasa_error
+            if falla:
+                self.estadisticas['errores'] += 1
+            else:
+                self.estadisticas['celdas'] += celdas
+        time.sleep(self.latencia + celdas * self.por_celda)
+        if falla:
+            raise _error_api(self.estado_error, 'Error simulado')
+
+    # ===== API de gspread =====
+    def worksheets(self):
+        self._llamada()
+        return list(self.hojas)
+
+    def values_batch_get(self, rangos, params=None):
+        por_titulo = {h.title: h for h in self.hojas}
+        respuesta = []
+        for rango in rangos:
+            titulo, celdas = _separar_rango(rango)
+            if titulo not in por_titulo:
+                # Como la API real: un rango con una hoja inexistente invalida todo el pedido
+                self._llamada()
+                raise _error_api(400, f'Unable to parse range: {rango}')
+            valores = por_titulo[titulo].recortar(celdas)
+            respuesta.append({'range': rango, 'values': valores} if valores else {'range': rango})
+        self._llamada(sum(len(f) for r in respuesta for f in r.get('values', [])))
+        return {'spreadsheetId': self.id, 'valueRanges': respuesta}
+
+    # ===== Cambios en los datos =====
+    def agregar_filas(self, filas):
+        """Agrega `filas` registros nuevos al final de cada hoja, como la carga diaria."""
+        self._semilla += len(self.hojas)
+        for i, hoja in enumerate(self.hojas):
+            nuevas = _valores(hoja_sintetica(filas, escuelas=self.escuelas, semilla=self._semilla + i))[1:]
+            hoja.valores = hoja.valores + nuevas
+
+
+class ClienteFalso:
+    """Hace de `gspread.Client`: cualquier nombre o clave abre la misma planilla."""
+
+    def __init__(self, planilla):
+        self.planilla = planilla
+
+    def open(self, nombre):
+        self.planilla._llamada()
+        return self.planilla
+
+    def open_by_key(self, clave):
+        self.planilla._llamada()
+        return self.planilla
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Verifica que en el informe PDF el gráfico no quede encima de la tabla.
+
+Arma `crear_figura_informe` para escuelas con 1, 30 y 300 registros y
+comprueba que el dominio vertical del gráfico (fila 1) y el de la tabla
+(fila 2) no se superpongan, y que el estilo del gráfico de la pestaña
+(título, fondo, grilla) haya pasado al informe. Con --pdf además se dibuja
+cada informe con kaleido en esa carpeta para mirarlo (necesita Chrome).
+
+Sale con código 1 si algún informe falla.
+
+Uso: python benchmarks/verificar_informe.py [--pdf /tmp/informes]
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+from exportar import crear_figura_informe, escribir_imagenes  # noqa: E402
+from figuras import crear_figura_escuela  # noqa: E402
+
+
+def filas_escuela(cantidad):
+    return pd.DataFrame({
+        'Escuela': 'Escuela 1',
+        'Fecha': pd.date_range('2025-03-03', periods=cantidad),
+        'Inscriptos': 40,
+        'Presentes': [(i * 7) % 41 for i in range(cantidad)],
+        'Observaciones': ['' if i % 7 else 'Paro' for i in range(cantidad)],
+    })
+
+
+def problemas(figura, grafico):
+    tabla = next(traza for traza in figura.data if traza.type == 'table')
+    eje_y = figura.layout.yaxis.domain
+    encontrados = []
+    if eje_y[0] < tabla.domain.y[1]:
+        encontrados.append(f"gráfico y={tuple(eje_y)} pisa la tabla y={tuple(tabla.domain.y)}")
+    if figura.layout.title.text != grafico.layout.title.text:
+        encontrados.append(f"título {figura.layout.title.text!r}")
+    if figura.layout.plot_bgcolor != grafico.layout.plot_bgcolor:
+        encontrados.append(f"fondo {figura.layout.plot_bgcolor!r}")
+    if figura.layout.xaxis.gridcolor != grafico.layout.xaxis.gridcolor:
+        encontrados.append(f"grilla {figura.layout.xaxis.gridcolor!r}")
+    return encontrados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gráfico y tabla del informe PDF sin superponerse')
+    parser.add_argument('--pdf', help='carpeta donde dibujar los informes con kaleido')
+    args = parser.parse_args()
+
+    fallas = 0
+    figuras, rutas = [], []
+    for cantidad in (1, 30, 300):
+        filas = filas_escuela(cantidad)
+        figura = crear_figura_informe(filas, 'Escuela 1', 'Centros Infantiles')
+        encontrados = problemas(figura, crear_figura_escuela(filas, 'Escuela 1', 'Centros Infantiles'))
+        fallas += bool(encontrados)
+        print(f"{cantidad:>4} registros: " + ('; '.join(encontrados) if encontrados else 'OK'))
+        if args.pdf:
+            figuras.append(figura)
+            rutas.append(os.path.join(args.pdf, f'informe_{cantidad}.pdf'))
+    if args.pdf:
+        os.makedirs(args.pdf, exist_ok=True)
+        escribir_imagenes(figuras, rutas)
+        print(f"{len(rutas)} informes dibujados en {args.pdf}")
+    if fallas:
+        print(f"FALLA: {fallas} informes con problemas")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Verifica que renovar el token no trabe a `ConexionSheets`.
+
+Arma credenciales de cuenta de servicio con una clave RSA generada al vuelo y
+`token_uri` en un servidor HTTP local que entrega tokens de un minuto (menos
+que `margen_token`, así cada llamada lo renueva). El POST del token es real y
+dispara el hook que cuenta bytes mientras se renueva, como en producción; las
+llamadas a Sheets en sí van a la planilla falsa.
+
+Sale con código 1 si las cargas no terminan en --timeout segundos (p. ej. un
+lock tomado dos veces) o si cada renovación no pidió exactamente un token.
+
+Uso: python benchmarks/verificar_token.py [--hilos 4] [--timeout 20]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.oauth2.service_account import Credentials
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from datos import cargar_hojas  # noqa: E402
+from hojas_falsas import ClienteFalso, PlanillaFalsa  # noqa: E402
+from sheets import SCOPES, ConexionSheets  # noqa: E402
+
+
+class ServidorToken(BaseHTTPRequestHandler):
+    pedidos = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        ServidorToken.pedidos += 1
+        cuerpo = json.dumps({'access_token': f'token-{ServidorToken.pedidos}', 'expires_in': 60,
+                             'token_type': 'Bearer'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def credenciales_locales(token_uri):
+    clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = clave.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                              serialization.NoEncryption()).decode()
+    return Credentials.from_service_account_info({
+        'type': 'service_account',
+        'project_id': 'local',
+        'private_key_id': 'local',
+        'private_key': pem,
+        'client_email': 'verificar@local.iam.gserviceaccount.com',
+        'token_uri': token_uri,
+    }, scopes=SCOPES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Renovación del token por la sesión de ConexionSheets')
+    parser.add_argument('--hilos', type=int, default=4, help='cargas simultáneas')
+    parser.add_argument('--timeout', type=float, default=20)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ServidorToken)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    credenciales = credenciales_locales(f'http://127.0.0.1:{servidor.server_address[1]}/token')
+
+    conexion = ConexionSheets(credenciales, 'verificar', espera_base=0.01)
+    # Token real; los datos, de la planilla falsa
+    conexion.cliente = ClienteFalso(PlanillaFalsa(filas=500))
+
+    errores = []
+
+    def cargar():
+        try:
+            cargar_hojas(conexion, [0, 1, 2, 3])
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=cargar, daemon=True) for _ in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(args.timeout)
+    servidor.shutdown()
+
+    trabados = sum(hilo.is_alive() for hilo in hilos)
+    print(f"{conexion.estadisticas} | pedidos de token: {ServidorToken.pedidos}")
+    if trabados:
+        print(f"FALLA: {trabados} de {args.hilos} cargas siguen trabadas tras {args.timeout:g} s")
+        sys.exit(1)
+    if errores:
+        print(f"FALLA: {errores[0]!r}")
+        sys.exit(1)
+    renovaciones = conexion.estadisticas['renovaciones_token']
+    if not renovaciones or renovaciones != ServidorToken.pedidos or not conexion.estadisticas['bytes']:
+        print("FALLA: cada renovación debe pedir un token y contar sus bytes")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
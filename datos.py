@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from gspread.utils import absolute_range_name, numericise_all, rowcol_to_a1
+
+
+# ===== Carga completa =====
+def cargar_hojas(spreadsheet, indices):
+    """Descarga varias hojas enteras con un solo `values_batch_get`.
+
+    Pasa por `spreadsheet.values_batch_get`, así con `ConexionSheets` la descarga
+    tiene los mismos reintentos con backoff y el mismo conteo de llamadas que la
+    sincronización incremental. Devuelve `(frames, tiempos)`: un DataFrame por
+    número de hoja, los segundos de la descarga (`tiempos['completa']`), los de
+    armar cada hoja y el total en `tiempos['total']`.
+    """
+    inicio = time.perf_counter()
+    # Una sola consulta de metadatos en lugar de un get_worksheet() por hoja
+    titulos = [ws.title for ws in spreadsheet.worksheets()]
+    t0 = time.perf_counter()
+    respuesta = spreadsheet.values_batch_get([absolute_range_name(titulos[i]) for i in indices])['valueRanges']
+    tiempos = {'completa': time.perf_counter() - t0}
+
+    frames = {}
+    for indice, rango in zip(indices, respuesta):
+        t0 = time.perf_counter()
+        valores = rango.get('values', [])
+        # Mismo resultado que get_all_records(): encabezado como columnas, números ya convertidos
+        frames[indice] = _a_registros(valores[0], valores[1:]) if valores else pd.DataFrame()
+        tiempos[indice] = time.perf_counter() - t0
+    tiempos['total'] = time.perf_counter() - inicio
+    return frames, tiempos
+
+
+# ===== Sincronización incremental =====
+def _rellenar(fila, ancho):
+    # La API recorta las celdas vacías al final de cada fila
+    return list(fila[:ancho]) + [''] * (ancho - len(fila))
+
+
+def _a_registros(encabezado, filas):
+    # Mismo criterio que get_all_records(): números como int/float, vacíos como ''
+    ancho = len(encabezado)
+    return pd.DataFrame([numericise_all(_rellenar(f, ancho)) for f in filas], columns=encabezado)
+
+
+class SincronizadorHojas:
+    """Descarga solo las filas nuevas de cada hoja (son registros diarios que crecen al final).
+
+    Recuerda cuántas filas ya trajo de cada hoja y en cada sincronización pide, en
+    un único `values_batch_get`, el encabezado y el rango desde la última fila
+    conocida. Si el encabezado cambió o esa última fila ya no coincide (se borraron
+    o editaron filas), la hoja se vuelve a descargar entera. Las correcciones en
+    filas intermedias no se detectan: para eso está `invalidar()` y, si se pasa
+    `completa_cada`, una descarga completa cada tantas sincronizaciones.
+    """
+
+    def __init__(self, completa_cada=None):
+        self.completa_cada = completa_cada
+        self.ultimo_detalle = {}
+        self._sincronizaciones = 0
+        self._estado = {}   # indice -> {'titulo', 'encabezado', 'cantidad', 'ultima', 'df'}
+        self._generacion = 0   # sube con cada invalidar(), también durante una sincronización
+        self._lock = threading.Lock()
+
+    def invalidar(self, indice=None):
+        # La próxima sincronización de esas hojas será completa
+        with self._lock:
+            self._generacion += 1
+            if indice is None:
+                self._estado.clear()
+            else:
+                self._estado.pop(indice, None)
+
+    def sincronizar(self, spreadsheet, indices):
+        """Devuelve `(hojas, tiempos)` con la misma forma que `cargar_hojas`."""
+        inicio = time.perf_counter()
+        self._sincronizaciones += 1
+        if self.completa_cada and self._sincronizaciones % self.completa_cada == 0:
+            self.invalidar()
+        titulos = [ws.title for ws in spreadsheet.worksheets()]
+        with self._lock:
+            generacion = self._generacion
+            # Copias: el estado guardado solo cambia al final, si nadie invalidó mientras tanto
+            estado = {i: dict(self._estado[i]) for i in indices
+                      if i in self._estado and self._estado[i]['titulo'] == titulos[i]}
+        detalle, tiempos = {}, {}
+
+        # 1. Una sola consulta con encabezado + filas nuevas de todas las hojas conocidas
+        completas = [i for i in indices if i not in estado]
+        if estado:
+            t0 = time.perf_counter()
+            rangos = []
+            for i, e in estado.items():
+                fila = e['cantidad'] + 1   # fila de la hoja con el último dato conocido
+                columna = re.sub(r'\d+', '', rowcol_to_a1(1, len(e['encabezado'])))
+                rangos += [absolute_range_name(e['titulo'], '1:1'),
+                           absolute_range_name(e['titulo'], f'A{fila}:{columna}')]
+            respuesta = spreadsheet.values_batch_get(rangos)['valueRanges']
+            for n, (i, e) in enumerate(estado.items()):
+                encabezado = (respuesta[2 * n].get('values') or [[]])[0]
+                cola = respuesta[2 * n + 1].get('values', [])
+                ancho = len(e['encabezado'])
+                conocida = e['ultima'] if e['cantidad'] else e['encabezado']
+                if encabezado != e['encabezado'] or not cola or _rellenar(cola[0], ancho) != _rellenar(conocida, ancho):
+                    completas.append(i)
+                    continue
+                nuevas = cola[1:]
+                if nuevas:
+                    e['cantidad'] += len(nuevas)
+                    e['ultima'] = nuevas[-1]
+                    e['df'] = pd.concat([e['df'], _a_registros(e['encabezado'], nuevas)], ignore_index=True)
+                detalle[i] = {'modo': 'incremental', 'filas_nuevas': len(nuevas), 'celdas': sum(map(len, cola))}
+            tiempos['incremental'] = time.perf_counter() - t0
+
+        # 2. Descarga completa de las hojas nuevas, cambiadas o acortadas
+        if completas:
+            t0 = time.perf_counter()
+            respuesta = spreadsheet.values_batch_get([absolute_range_name(titulos[i]) for i in completas])['valueRanges']
+            for i, rango in zip(completas, respuesta):
+                valores = rango.get('values', [])
+                encabezado = valores[0] if valores else []
+                filas = valores[1:]
+                estado[i] = {
+                    'titulo': titulos[i],
+                    'encabezado': encabezado,
+                    'cantidad': len(filas),
+                    'ultima': filas[-1] if filas else [],
+                    'df': _a_registros(encabezado, filas),
+                }
+                detalle[i] = {'modo': 'completa', 'filas_nuevas': len(filas), 'celdas': sum(map(len, valores))}
+            tiempos['completa'] = time.perf_counter() - t0
+
+        with self._lock:
+            # Si se pidió invalidar durante la descarga (el botón "Actualizar Datos"), no se
+            # devuelve el estado copiado al principio: la próxima sincronización es completa
+            if self._generacion == generacion:
+                self._estado.update(estado)
+        self.ultimo_detalle = detalle
+        tiempos['total'] = time.perf_counter() - inicio
+        return {i: estado[i]['df'] for i in indices}, tiempos
+
+
+# ===== Normalización =====
+# Se aplica una vez por foto; el resumen y las pestañas usan el resultado tipado.
+FORMATO_FECHA = '%d/%m/%Y'
+COLUMNAS_NUMERICAS = ['Inscriptos', 'Presentes']
+
+
+def _a_fecha(col):
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    fechas = pd.to_datetime(col, format=FORMATO_FECHA, errors='coerce')
+    # Solo las celdas que no respetan dd/mm/aaaa pasan por el parser genérico
+    resto = fechas.isna() & (col.astype(str).str.strip() != '')
+    if resto.any():
+        fechas[resto] = pd.to_datetime(col[resto].astype(str), dayfirst=True, format='mixed', errors='coerce')
+    return fechas
+
+
+def _a_entero(col):
+    numeros = pd.to_numeric(col, errors='coerce')
+    # Solo las celdas con texto (p. ej. "25 aprox") pasan por la regex
+    texto = numeros.isna() & col.notna()
+    if texto.any():
+        extraidos = col[texto].astype(str).str.extract(r'(\d+)', expand=False)
+        numeros[texto] = pd.to_numeric(extraidos, errors='coerce')
+    return np.trunc(numeros.fillna(0)).astype('Int64')
+
+
+def normalizar(df):
+    """Devuelve una copia tipada de la hoja, ordenada por fecha.
+
+    `Fecha` pasa a datetime (se descartan las filas sin fecha válida),
+    `Inscriptos`/`Presentes` a Int64 con 0 donde no hay número y `Escuela`
+    a categórica en el orden en que aparece en la hoja.
+    """
+    if df.empty or 'Fecha' not in df.columns:
+        return df
+    df = df.copy()
+    if 'Escuela' in df.columns:
+        df['Escuela'] = pd.Categorical(df['Escuela'], categories=pd.unique(df['Escuela']))
+    df['Fecha'] = _a_fecha(df['Fecha'])
+    df = df[df['Fecha'].notna()]
+    for col in COLUMNAS_NUMERICAS:
+        if col in df.columns:
+            df[col] = _a_entero(df[col])
+    if 'Observaciones' in df.columns:
+        df['Observaciones'] = df['Observaciones'].fillna('').astype(str)
+    return df.sort_values('Fecha', kind='stable').reset_index(drop=True)
+
+
+# ===== Particiones por escuela =====
+def particionar(df):
+    """Separa una hoja normalizada en {escuela: filas de esa escuela}.
+
+    Las filas ya vienen ordenadas por fecha y las escuelas quedan en el orden
+    en que aparecen en la hoja.
+    """
+    if df.empty or 'Escuela' not in df.columns:
+        return {}
+    grupos = dict(tuple(df.groupby('Escuela', observed=True)))
+    orden = df['Escuela'].cat.categories if isinstance(df['Escuela'].dtype, pd.CategoricalDtype) else pd.unique(df['Escuela'])
+    return {escuela: grupos[escuela] for escuela in orden if escuela in grupos}
+
+
+# ===== Forma columnar para el navegador =====
+def a_columnas(df):
+    """Hoja normalizada en forma columnar compacta, para mandarla una vez al navegador.
+
+    Un arreglo por columna: las fechas como días desde `base`, los números tal
+    cual y el texto (Escuela, Observaciones) codificado con diccionario, es
+    decir `categorias` más el índice de cada fila en `valores`.
+    """
+    datos = {}
+    for columna in df.columns:
+        serie = df[columna]
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            base = serie.min()
+            datos[columna] = {'tipo': 'fecha', 'base': base.strftime('%Y-%m-%d'),
+                              'valores': (serie - base).dt.days.tolist()}
+        elif pd.api.types.is_numeric_dtype(serie):
+            datos[columna] = {'tipo': 'numero', 'valores': serie.fillna(0).tolist()}
+        else:
+            codigos, categorias = pd.factorize(serie.astype(str))
+            datos[columna] = {'tipo': 'texto', 'categorias': list(categorias), 'valores': codigos.tolist()}
+    return {'filas': len(df), 'columnas': list(df.columns), 'datos': datos}
+
+
+# ===== Agregados del resumen =====
+# Hojas que entran en "Resumen y Alertas", en el orden en que se muestran
+PROGRAMAS_RESUMEN = {1: 'Centros Infantiles', 0: 'Club de Chicos', 2: 'Club de Jóvenes'}
+UMBRAL_PRESENTISMO = 40
+UMBRAL_MATRICULA = 30
+COLUMNAS_ALERTAS = ['Alerta', 'Escuela', 'Programa', 'Fecha', 'Detalle']
+
+
+class Agregados:
+    """Todo lo que muestra la pestaña de resumen, calculado una vez por foto.
+
+    - `validas[indice]`: filas con Inscriptos > 0 (las que grafican las tendencias)
+    - `diarios[indice]`: totales de Inscriptos y Presentes por fecha
+    - `presentismo`: última fecha de cada programa, una fila por escuela con su % de presentes
+    - `totales`: una fila por programa con los totales de su última fecha
+    - `alertas`: una fila por alerta, las más graves primero
+    """
+
+    def __init__(self, hojas, programas=PROGRAMAS_RESUMEN):
+        self.validas, self.diarios = {}, {}
+        recientes, totales = [], []
+        for indice, nombre in programas.items():
+            df = hojas.get(indice)
+            if df is None or df.empty or 'Inscriptos' not in df.columns:
+                continue
+            validas = df[df['Inscriptos'] > 0]
+            if validas.empty:
+                continue
+            self.validas[indice] = validas
+            diarios = validas.groupby('Fecha', as_index=False)[COLUMNAS_NUMERICAS].sum()
+            self.diarios[indice] = diarios
+
+            # Filas ya ordenadas por fecha: la última fecha es la del último día agregado
+            ultima_fecha = diarios['Fecha'].iloc[-1]
+            reciente = validas[validas['Fecha'] == ultima_fecha]
+            recientes.append(reciente.assign(
+                Presentismo=reciente['Presentes'] / reciente['Inscriptos'] * 100,
+                Tipo=nombre
+            )[['Escuela', 'Inscriptos', 'Presentes', 'Presentismo', 'Tipo', 'Fecha']])
+            totales.append(diarios.iloc[[-1]].assign(Tipo=nombre))
+
+        self.presentismo = pd.concat(recientes) if recientes else pd.DataFrame()
+        self.totales = (pd.concat(totales, ignore_index=True)[['Tipo', 'Inscriptos', 'Presentes', 'Fecha']]
+                        if totales else pd.DataFrame())
+        self.alertas = self._alertas(self.presentismo)
+
+    @property
+    def vacio(self):
+        return self.presentismo.empty
+
+    @staticmethod
+    def _alertas(presentismo):
+        if presentismo.empty:
+            return pd.DataFrame(columns=COLUMNAS_ALERTAS)
+        asistencia = presentismo[presentismo['Presentismo'] < UMBRAL_PRESENTISMO].sort_values('Presentismo')
+        asistencia = asistencia.assign(
+            Alerta='Baja asistencia',
+            Detalle=asistencia['Presentismo'].round(1).astype(str) + '%'
+        )
+        matricula = presentismo[presentismo['Inscriptos'] < UMBRAL_MATRICULA].sort_values('Inscriptos')
+        matricula = matricula.assign(
+            Alerta='Baja matrícula',
+            Detalle=matricula['Inscriptos'].astype(str) + ' inscriptos'
+        )
+        alertas = pd.concat([asistencia, matricula]).rename(columns={'Tipo': 'Programa'})
+        alertas['Escuela'] = alertas['Escuela'].astype(str)
+        alertas['Fecha'] = alertas['Fecha'].dt.strftime('%d/%m/%Y')
+        return alertas[COLUMNAS_ALERTAS].reset_index(drop=True)
+
+
+# ===== Series remuestreadas =====
+# Frecuencias de pandas de la más fina a la más gruesa, con los días que cubre cada punto
+FRECUENCIAS = [('D', 1), ('W-MON', 7), ('MS', 30)]
+PUNTOS_POR_SERIE = 120
+
+
+def elegir_frecuencia(desde, hasta, puntos=PUNTOS_POR_SERIE):
+    """La frecuencia más fina que deja a lo sumo `puntos` puntos por escuela en el rango."""
+    dias = max((hasta - desde).days, 1)
+    for frecuencia, dias_por_punto in FRECUENCIAS[:-1]:
+        if dias / dias_por_punto <= puntos:
+            return frecuencia
+    return FRECUENCIAS[-1][0]
+
+
+def remuestrear(df, frecuencia, columna='Inscriptos'):
+    """Promedio de `columna` por escuela y período (cada período se rotula con su primer día)."""
+    if df.empty:
+        return df[['Escuela', 'Fecha', columna]]
+    periodo = pd.Grouper(key='Fecha', freq=frecuencia, label='left', closed='left')
+    promedios = df.groupby(['Escuela', periodo], observed=True)[columna].mean()
+    return promedios.dropna().round().reset_index()
+
+
+# ===== Snapshot y actualización en segundo plano =====
+class Snapshot:
+    """Foto inmutable de las hojas cargadas. Se reemplaza entera, nunca se modifica.
+
+    Al crearse normaliza cada hoja y la separa por escuela, así que elegir una
+    escuela es una búsqueda en un diccionario y no un filtro sobre toda la hoja.
+    Los agregados del resumen también se calculan acá, una sola vez.
+    """
+
+    def __init__(self, hojas, version=0, actualizado=None, tiempos=None):
+        # A los tiempos de la descarga se suman los de cada paso de preparación
+        self.tiempos = dict(tiempos or {})
+        t0 = time.perf_counter()
+        self.hojas = {indice: normalizar(df) for indice, df in hojas.items()}
+        t1 = time.perf_counter()
+        self.version = version
+        self.actualizado = actualizado  # datetime de la última carga exitosa
+        self.particiones = {indice: particionar(df) for indice, df in self.hojas.items()}
+        self.escuelas = {indice: list(partes) for indice, partes in self.particiones.items()}
+        t2 = time.perf_counter()
+        self.agregados = Agregados(self.hojas)
+        self.tiempos.update(normalizar=t1 - t0, particionar=t2 - t1, agregados=time.perf_counter() - t2)
+
+    @property
+    def id(self):
+        """Identificador único de la foto (el mismo que usa su carpeta en disco).
+
+        `version` es un contador que vuelve a empezar si el proceso arranca sin
+        fotos en disco; con la hora de la carga no se repite entre corridas.
+        """
+        if self.actualizado is None:
+            return f'vacia_v{self.version}'
+        return f"{self.actualizado.strftime('%Y%m%dT%H%M%S')}_v{self.version}"
+
+
+class ActualizadorFondo:
+    """Recarga las hojas cada `intervalo` segundos en un hilo aparte.
+
+    Los callbacks solo leen `self.snapshot`; la carga nunca ocurre en el hilo del
+    request. `cargar(indices)` debe devolver `(hojas, tiempos)` como `cargar_hojas`;
+    `al_actualizar(snapshot)`, si se pasa, se llama después de cada carga exitosa.
+    """
+
+    def __init__(self, cargar, indices, intervalo=300, snapshot=None, al_actualizar=None):
+        self.cargar = cargar
+        self.al_actualizar = al_actualizar
+        self.indices = list(indices)
+        self.intervalo = intervalo
+        self.snapshot = snapshot or Snapshot({i: pd.DataFrame() for i in self.indices})
+        self.en_curso = False
+        self.ultimo_error = None
+        self._pedido = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = None
+
+    def iniciar(self):
+        # Idempotente. Con gunicorn --preload el hilo del proceso maestro no
+        # sobrevive al fork, por eso se compara también el pid.
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Sin datos o con una foto (p. ej. leída de disco) más vieja que el intervalo:
+            # se recarga enseguida
+            actualizado = self.snapshot.actualizado
+            if actualizado is None or (datetime.now() - actualizado).total_seconds() >= self.intervalo:
+                self._pedido.set()
+            self._hilo = threading.Thread(target=self._ciclo, name='actualizador-hojas', daemon=True)
+            self._hilo.start()
+
+    def pedir_actualizacion(self):
+        # No bloquea: el hilo de fondo la toma en cuanto termine lo que esté haciendo
+        self._pedido.set()
+
+    def pendiente(self):
+        return self.en_curso or self._pedido.is_set()
+
+    def actualizar(self):
+        self.en_curso = True
+        try:
+            hojas, tiempos = self.cargar(self.indices)
+            # Reemplazo atómico: los lectores ven la foto anterior o la nueva, nunca una mezcla
+            self.snapshot = Snapshot(hojas, self.snapshot.version + 1, datetime.now(), tiempos)
+            self.ultimo_error = None
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"Error al actualizar datos: {str(e)}")
+            return
+        finally:
+            self.en_curso = False
+        if self.al_actualizar is not None:
+            try:
+                self.al_actualizar(self.snapshot)
+            except Exception as e:
+                print(f"Error después de actualizar datos: {str(e)}")
+
+    def _ciclo(self):
+        while True:
+            self._pedido.wait(self.intervalo)
+            self._pedido.clear()
+            self.actualizar()
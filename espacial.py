@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Índice espacial de sedes y participantes para consultas de cercanía y cobertura."""
+import numpy as np
+
+RADIO_TIERRA = 6_371_000   # metros
+CELDA_INDICE = 500         # lado de cada celda de la grilla, en metros
+
+
+def distancia(lat1, lon1, lat2, lon2):
+    """Distancia haversine en metros (acepta escalares o arrays)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA * np.arcsin(np.sqrt(a))
+
+
+class IndiceGrilla:
+    """Grilla uniforme sobre una proyección local en metros.
+
+    Los puntos se ordenan por celda una sola vez (como un CSR: claves ordenadas y
+    el rango de cada una), así una consulta solo mira las celdas que tocan el
+    radio y mide distancias exactas sobre esos candidatos. Para escalas de
+    ciudad la proyección equirectangular alcanza para elegir celdas; la
+    distancia final siempre es haversine.
+    """
+
+    def __init__(self, lat, lon, celda=CELDA_INDICE):
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.celda = celda
+        self._lat0 = np.radians(self.lat.mean()) if len(self.lat) else 0.0
+        cx, cy = self._celda(self.lat, self.lon)
+        self._claves = self._clave(cx, cy)
+        self._orden = np.argsort(self._claves, kind='stable')
+        self._claves_ordenadas = self._claves[self._orden]
+        if len(self.lat):
+            self._cx_min, self._cx_max = int(cx.min()), int(cx.max())
+            self._cy_min, self._cy_max = int(cy.min()), int(cy.max())
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _celda(self, lat, lon):
+        x = RADIO_TIERRA * np.radians(lon) * np.cos(self._lat0)
+        y = RADIO_TIERRA * np.radians(lat)
+        return np.floor(x / self.celda).astype(np.int64), np.floor(y / self.celda).astype(np.int64)
+
+    @staticmethod
+    def _clave(cx, cy):
+        return (np.asarray(cx, dtype=np.int64) << 32) + (np.asarray(cy, dtype=np.int64) & 0xFFFFFFFF)
+
+    def _candidatos(self, cx, cy, anillo):
+        # Índices de los puntos en el cuadrado de (2 * anillo + 1)² celdas alrededor de (cx, cy)
+        xs = np.arange(max(cx - anillo, self._cx_min), min(cx + anillo, self._cx_max) + 1)
+        ys = np.arange(max(cy - anillo, self._cy_min), min(cy + anillo, self._cy_max) + 1)
+        if not len(xs) or not len(ys):
+            return np.empty(0, dtype=np.int64)
+        claves = self._clave(*(m.ravel() for m in np.meshgrid(xs, ys)))
+        inicio = np.searchsorted(self._claves_ordenadas, claves, side='left')
+        fin = np.searchsorted(self._claves_ordenadas, claves, side='right')
+        partes = [self._orden[i:f] for i, f in zip(inicio, fin) if f > i]
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)
+
+    def en_radio(self, lat, lon, radio):
+        """`(indices, distancias)` de los puntos a menos de `radio` metros, de más cerca a más lejos."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        cx, cy = (int(v) for v in self._celda(lat, lon))
+        candidatos = self._candidatos(cx, cy, int(np.ceil(radio / self.celda)))
+        d = distancia(lat, lon, self.lat[candidatos], self.lon[candidatos])
+        dentro = d <= radio
+        orden = np.argsort(d[dentro], kind='stable')
+        return candidatos[dentro][orden], d[dentro][orden]
+
+    def mas_cercanos(self, lat, lon, k=1):
+        """`(indices, distancias)` de los `k` puntos más cercanos.
+
+        Amplía el anillo de celdas hasta tener `k` candidatos y después una vuelta
+        más con el radio del k-ésimo, que es lo que garantiza que no haya uno más
+        cercano en una celda sin revisar.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        cx, cy = (int(v) for v in self._celda(lat, lon))
+        # Anillo que ya cubre todos los puntos: más allá no hay nada que buscar
+        extension = max(abs(cx - self._cx_min), abs(cx - self._cx_max), abs(cy - self._cy_min), abs(cy - self._cy_max))
+        anillo = 1
+        candidatos = self._candidatos(cx, cy, anillo)
+        while len(candidatos) < k and anillo <= extension:
+            anillo *= 2
+            candidatos = self._candidatos(cx, cy, anillo)
+        d = distancia(lat, lon, self.lat[candidatos], self.lon[candidatos])
+        radio = np.partition(d, k - 1)[k - 1]
+        indices, distancias = self.en_radio(lat, lon, radio)
+        return indices[:k], distancias[:k]
+
+
+class IndiceSedes:
+    """Índices de sedes y participantes de una capa del mapa, armados una vez por versión de los datos."""
+
+    def __init__(self, sedes, participantes, celda=CELDA_INDICE):
+        self.sedes = sedes.reset_index(drop=True)
+        self.participantes = participantes.reset_index(drop=True)
+        self.indice_sedes = IndiceGrilla(self.sedes['lat'], self.sedes['lon'], celda)
+        self.indice_participantes = IndiceGrilla(self.participantes['lat'], self.participantes['lon'], celda)
+        # Sede más cercana de cada participante, para saber cuántos van a una sede que no es la suya
+        # más próxima. Las sedes son pocas: una matriz participantes x sedes alcanza
+        if len(self.sedes):
+            d = distancia(self.participantes['lat'].to_numpy()[:, None], self.participantes['lon'].to_numpy()[:, None],
+                          self.sedes['lat'].to_numpy()[None, :], self.sedes['lon'].to_numpy()[None, :])
+            self._cercana = d.argmin(axis=1)
+        else:
+            self._cercana = np.full(len(self.participantes), -1, dtype=np.int64)
+
+    def _fila_sede(self, id_sede):
+        filas = np.flatnonzero(self.sedes['id'].to_numpy() == id_sede)
+        if not len(filas):
+            raise KeyError(id_sede)
+        return filas[0]
+
+    def sede_cercana(self, lat, lon, k=1):
+        """Las `k` sedes más cercanas al punto: [{id, nombre, distancia_m}]."""
+        indices, distancias = self.indice_sedes.mas_cercanos(lat, lon, k)
+        return [
+            {'id': int(self.sedes.at[i, 'id']), 'nombre': self.sedes.at[i, 'nombre'], 'distancia_m': round(float(d), 1)}
+            for i, d in zip(indices, distancias)
+        ]
+
+    def contar_en_radio(self, lat, lon, radio):
+        """Participantes a menos de `radio` metros del punto, en total y por sede a la que asisten."""
+        indices, _ = self.indice_participantes.en_radio(lat, lon, radio)
+        por_sede = self.participantes['sede'].to_numpy()[indices]
+        sedes, cantidades = np.unique(por_sede, return_counts=True)
+        nombres = dict(zip(self.sedes['id'], self.sedes['nombre']))
+        return {
+            'radio_m': radio,
+            'participantes': int(len(indices)),
+            'por_sede': {nombres.get(int(s), 'Sin sede'): int(n) for s, n in zip(sedes, cantidades)},
+        }
+
+    def contar_cerca_de_sede(self, id_sede, radio):
+        fila = self._fila_sede(id_sede)
+        return self.contar_en_radio(self.sedes.at[fila, 'lat'], self.sedes.at[fila, 'lon'], radio)
+
+    def captacion(self, id_sede):
+        """Área de captación de una sede: quiénes asisten, a qué distancia y cuántos tienen otra sede más cerca."""
+        fila = self._fila_sede(id_sede)
+        asisten = np.flatnonzero(self.participantes['sede'].to_numpy() == id_sede)
+        d = distancia(self.sedes.at[fila, 'lat'], self.sedes.at[fila, 'lon'],
+                      self.participantes['lat'].to_numpy()[asisten], self.participantes['lon'].to_numpy()[asisten])
+        return {
+            'id': int(id_sede),
+            'nombre': self.sedes.at[fila, 'nombre'],
+            'participantes': int(len(asisten)),
+            'distancia_mediana_m': round(float(np.median(d)), 1) if len(d) else None,
+            'distancia_p90_m': round(float(np.percentile(d, 90)), 1) if len(d) else None,
+            'con_otra_sede_mas_cerca': int((self._cercana[asisten] != fila).sum()),
+            # Participantes de cualquier sede para los que esta es la más cercana
+            'mas_cercana_para': int((self._cercana == fila).sum()),
+        }
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Exporta en lote el informe de cada escuela de cada programa (PDF, PNG y XLSX).
+
+Por escuela se escriben, en `<salida>/<año>/<programa>/`:
+- `inf_<programa>_<año>_<escuela>.png`: el gráfico de la pestaña de la escuela
+  (si dos escuelas darían el mismo nombre, cada una lleva además un hash corto)
+- `.pdf`: el gráfico y, debajo, la tabla con todos sus registros
+- `.xlsx`: la tabla, con las fechas como fechas
+
+Todas las escuelas salen de una misma foto: la última del año en curso, la
+que se elija con --snapshot o un año congelado del histórico con --anio. El
+trabajo se reparte en lotes de escuelas entre un pool de procesos; cada lote
+manda sus imágenes a kaleido de una sola vez, así el navegador que dibuja se
+abre una vez por lote y no una por archivo.
+
+Cada lote terminado queda anotado en `progreso.jsonl`: el tiempo de cada XLSX
+y de armar cada escuela, y el de dibujar las imágenes de todo el lote juntas
+(kaleido no da el de cada una). Si la corrida se corta, la siguiente saltea las escuelas ya hechas
+desde la misma foto (con --rehacer se hacen todas de nuevo).
+
+Uso:
+    python exportar.py [--formatos pdf png xlsx] [--programas ci cj] [--procesos 4]
+    python exportar.py --anio 2024 --salida informes
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+from datos import FORMATO_FECHA, particionar
+from figuras import crear_figura_escuela, styles
+from historico import ANIO_ACTUAL, DIRECTORIO_HISTORICO, PROGRAMAS, TITULOS, AlmacenAnual
+from snapshots import DIRECTORIO_SNAPSHOTS, anio_snapshot, cargar_snapshot, leer_manifest
+
+try:
+    import kaleido  # noqa: F401  plotly lo usa para las imágenes estáticas
+except ImportError:  # Sin kaleido solo se puede exportar XLSX
+    kaleido = None
+
+try:
+    import openpyxl  # noqa: F401  motor de pandas para escribir .xlsx
+except ImportError:
+    openpyxl = None
+
+FORMATOS = ('pdf', 'png', 'xlsx')
+PROGRESO = 'progreso.jsonl'
+ANCHO = 1100
+ALTO_GRAFICO = 450
+ALTO_FILA = 22
+
+# Filas de cada escuela de la foto elegida, una vez por proceso: {hoja: {escuela: filas}}
+_particiones = None
+
+
+# ===== Datos =====
+def elegir_origen(anio=None, id_snapshot=None, directorio_snapshots=DIRECTORIO_SNAPSHOTS,
+                  directorio_historico=DIRECTORIO_HISTORICO):
+    """('snapshot', id, directorio) o ('historico', año, directorio), y el año de los datos.
+
+    Se resuelve una vez en el proceso principal: aunque llegue una foto nueva
+    en medio de la corrida, todos los procesos leen la misma.
+    """
+    if anio is not None and anio != ANIO_ACTUAL:
+        if AlmacenAnual(directorio_historico).manifest(anio) is None:
+            raise SystemExit(f"El año {anio} no está congelado en {directorio_historico}")
+        return ('historico', anio, directorio_historico), anio
+    entradas = leer_manifest(directorio_snapshots)['snapshots']
+    if id_snapshot is None:
+        entradas = [e for e in entradas if anio_snapshot(e, directorio_snapshots) in (ANIO_ACTUAL, None)]
+    else:
+        entradas = [e for e in entradas if e['id'] == id_snapshot]
+    if not entradas:
+        raise SystemExit(f"No hay snapshots para exportar en {directorio_snapshots}")
+    entrada = entradas[-1]
+    return ('snapshot', entrada['id'], directorio_snapshots), anio_snapshot(entrada, directorio_snapshots) or ANIO_ACTUAL
+
+
+def cargar_particiones(origen):
+    tipo, clave, directorio = origen
+    if tipo == 'snapshot':
+        return cargar_snapshot(clave, directorio).particiones
+    almacen = AlmacenAnual(directorio)
+    particiones = {}
+    for indice in PROGRAMAS:
+        df = almacen.leer(clave, indice)
+        if df is not None:
+            particiones[indice] = particionar(df)
+    return particiones
+
+
+def _iniciar_proceso(origen):
+    # Con fork los procesos heredan la foto ya cargada; con spawn cada uno la lee de disco
+    global _particiones
+    if _particiones is None:
+        _particiones = cargar_particiones(origen)
+
+
+# ===== Informe de una escuela =====
+def nombre_archivo(programa, anio, escuela):
+    texto = unicodedata.normalize('NFKD', str(escuela)).encode('ascii', 'ignore').decode('ascii')
+    return f"inf_{programa}_{anio}_{re.sub(r'[^A-Za-z0-9]+', '_', texto).strip('_').lower()}"
+
+
+def nombres_archivo(programa, anio, escuelas):
+    """{escuela: nombre de archivo} para todas las escuelas de un programa.
+
+    Las que darían el mismo nombre (p. ej. "San José" y "San Jose") o uno
+    vacío llevan además los primeros 8 dígitos del sha1 de su nombre original,
+    así ningún informe pisa a otro y el nombre no depende del orden.
+    """
+    nombres = {escuela: nombre_archivo(programa, anio, escuela) for escuela in escuelas}
+    repetidos = Counter(nombres.values())
+    for escuela, nombre in nombres.items():
+        if repetidos[nombre] > 1 or nombre.endswith('_'):
+            sufijo = hashlib.sha1(str(escuela).encode('utf-8')).hexdigest()[:8]
+            nombres[escuela] = f"{nombre.rstrip('_')}_{sufijo}"
+    return nombres
+
+
+def tabla_escuela(filas):
+    return filas.drop(columns=['Escuela'], errors='ignore').reset_index(drop=True)
+
+
+def crear_figura_informe(filas, escuela, titulo):
+    """El gráfico de la escuela con la tabla de sus registros debajo, en una sola página."""
+    grafico = crear_figura_escuela(filas, escuela, titulo)
+    tabla = tabla_escuela(filas)
+    alto_tabla = ALTO_FILA * (len(tabla) + 2)
+    fig = make_subplots(
+        rows=2, cols=1,
+        specs=[[{'type': 'xy'}], [{'type': 'table'}]],
+        row_heights=[ALTO_GRAFICO, alto_tabla],
+        vertical_spacing=40 / (ALTO_GRAFICO + alto_tabla)
+    )
+    for traza in grafico.data:
+        fig.add_trace(traza, row=1, col=1)
+    celdas = [
+        tabla[col].dt.strftime(FORMATO_FECHA) if col == 'Fecha' else tabla[col].astype(str)
+        for col in tabla.columns
+    ]
+    fig.add_trace(go.Table(
+        header=dict(values=list(tabla.columns), fill_color=styles['background'],
+                    font=dict(color=styles['accent'], size=12), line_color=styles['accent'], align='left'),
+        cells=dict(values=celdas, fill_color=[[styles['card'], '#F5F5F5'] * (len(tabla) // 2 + 1)] * len(celdas),
+                   font=dict(color=styles['text'], size=11), line_color=styles['grid'], align='left',
+                   height=ALTO_FILA)
+    ), row=2, col=1)
+    # Del layout de px solo el estilo: copiarlo entero pisaría los dominios de make_subplots
+    # y el gráfico quedaría encima de la tabla
+    estilo = grafico.layout
+    fig.update_layout(title=estilo.title, font=estilo.font, legend=estilo.legend, plot_bgcolor=estilo.plot_bgcolor,
+                      paper_bgcolor=estilo.paper_bgcolor, width=ANCHO, height=ALTO_GRAFICO + alto_tabla + 100,
+                      hovermode=False)
+    fig.update_xaxes(gridcolor=estilo.xaxis.gridcolor, title_text=estilo.xaxis.title.text, row=1, col=1)
+    fig.update_yaxes(gridcolor=estilo.yaxis.gridcolor, title_text=estilo.yaxis.title.text, row=1, col=1)
+    return fig
+
+
+def escribir_xlsx(filas, ruta):
+    tabla = tabla_escuela(filas)
+    with pd.ExcelWriter(ruta, engine='openpyxl', date_format='DD/MM/YYYY', datetime_format='DD/MM/YYYY') as libro:
+        tabla.to_excel(libro, sheet_name='Registros', index=False)
+        hoja = libro.sheets['Registros']
+        for columna in hoja.columns:
+            ancho = max(len(str(celda.value or '')) for celda in columna[:200])
+            hoja.column_dimensions[columna[0].column_letter].width = min(max(ancho + 2, 10), 60)
+
+
+def escribir_imagenes(figuras, rutas):
+    if hasattr(pio, 'write_images'):
+        # plotly >= 6.1 con kaleido 1: un solo navegador para todo el lote
+        pio.write_images(figuras, rutas)
+    else:
+        for figura, ruta in zip(figuras, rutas):
+            pio.write_image(figura, ruta)
+
+
+def exportar_lote(tareas, formatos, salida, anio):
+    """Escribe los informes de `tareas` [(hoja, escuela, nombre)]; devuelve un registro por escuela.
+
+    Cada archivo se escribe con un nombre temporal y se renombra al final del
+    lote, así un corte a mitad de camino no deja informes a medias.
+
+    `archivos` tiene lo medido por archivo (XLSX) y `segundos`, lo que llevó
+    armar la escuela; el PNG y el PDF se dibujan en una sola llamada por lote,
+    así que `lote_imagenes` trae el total del lote, igual en todas sus escuelas.
+    """
+    resultados, figuras, rutas, temporales = [], [], [], []
+    for indice, escuela, nombre in tareas:
+        inicio = time.perf_counter()
+        filas = _particiones[indice][escuela]
+        programa = PROGRAMAS[indice]
+        carpeta = os.path.join(salida, str(anio), programa)
+        os.makedirs(carpeta, exist_ok=True)
+        base = os.path.join(carpeta, nombre)
+        registro = {'programa': programa, 'escuela': str(escuela), 'archivo': nombre, 'filas': len(filas),
+                    'archivos': {}}
+
+        if 'xlsx' in formatos:
+            t0 = time.perf_counter()
+            escribir_xlsx(filas, f'{base}.tmp.xlsx')
+            temporales.append((f'{base}.tmp.xlsx', f'{base}.xlsx'))
+            registro['archivos']['xlsx'] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        if 'png' in formatos:
+            figura = crear_figura_escuela(filas, escuela, TITULOS[indice])
+            figura.update_layout(width=ANCHO, height=ALTO_GRAFICO)
+            figuras.append(figura)
+            rutas.append(f'{base}.tmp.png')
+            temporales.append((f'{base}.tmp.png', f'{base}.png'))
+        if 'pdf' in formatos:
+            figuras.append(crear_figura_informe(filas, escuela, TITULOS[indice]))
+            rutas.append(f'{base}.tmp.pdf')
+            temporales.append((f'{base}.tmp.pdf', f'{base}.pdf'))
+        registro['figuras'] = time.perf_counter() - t0
+        registro['segundos'] = time.perf_counter() - inicio
+        resultados.append(registro)
+
+    if rutas:
+        t0 = time.perf_counter()
+        escribir_imagenes(figuras, rutas)
+        lote = {'segundos': time.perf_counter() - t0, 'imagenes': len(rutas)}
+        for registro in resultados:
+            registro['lote_imagenes'] = lote
+    for temporal, destino in temporales:
+        os.replace(temporal, destino)
+    return resultados
+
+
+# ===== Progreso =====
+def leer_progreso(ruta, origen, formatos, salida, anio, nombres):
+    """Escuelas ya exportadas desde `origen` con todos sus archivos en disco.
+
+    `nombres` es {(programa, escuela): nombre de archivo} de esta corrida: si
+    una escuela nueva hizo cambiar el nombre de otra, esa otra se rehace.
+    """
+    hechas = set()
+    if not os.path.exists(ruta):
+        return hechas
+    with open(ruta, encoding='utf-8') as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue   # última línea cortada por una interrupción
+            if registro.get('origen') != list(origen[:2]):
+                continue
+            clave = (registro['programa'], registro['escuela'])
+            if clave not in nombres:
+                continue
+            base = os.path.join(salida, str(anio), registro['programa'], nombres[clave])
+            if all(os.path.exists(f'{base}.{formato}') for formato in formatos):
+                hechas.add(clave)
+    return hechas
+
+
+def _lotes(tareas, tamano):
+    return [tareas[i:i + tamano] for i in range(0, len(tareas), tamano)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exportar el informe de cada escuela a PDF, PNG y XLSX')
+    parser.add_argument('--formatos', nargs='+', choices=FORMATOS, default=list(FORMATOS))
+    parser.add_argument('--programas', nargs='+', choices=list(PROGRAMAS.values()), default=list(PROGRAMAS.values()))
+    parser.add_argument('--anio', type=int, help='año congelado del histórico (por defecto, el año en curso)')
+    parser.add_argument('--snapshot', help='id de la foto a exportar (por defecto, la última)')
+    parser.add_argument('--salida', default='informes')
+    parser.add_argument('--procesos', type=int, default=os.cpu_count())
+    parser.add_argument('--lote', type=int, default=10, help='escuelas por tarea del pool')
+    parser.add_argument('--rehacer', action='store_true', help='no saltear las escuelas ya exportadas')
+    parser.add_argument('--directorio-snapshots', default=DIRECTORIO_SNAPSHOTS)
+    parser.add_argument('--directorio-historico', default=DIRECTORIO_HISTORICO)
+    args = parser.parse_args(argv)
+
+    if kaleido is None and {'pdf', 'png'} & set(args.formatos):
+        raise SystemExit("PDF y PNG necesitan kaleido (pip install kaleido) y Chrome (plotly_get_chrome)")
+    if openpyxl is None and 'xlsx' in args.formatos:
+        raise SystemExit("XLSX necesita openpyxl (pip install openpyxl)")
+
+    global _particiones
+    inicio = time.perf_counter()
+    origen, anio = elegir_origen(args.anio, args.snapshot, args.directorio_snapshots, args.directorio_historico)
+    _particiones = cargar_particiones(origen)
+    print(f"Datos de {origen[0]} {origen[1]} cargados en {time.perf_counter() - inicio:.2f}s")
+
+    os.makedirs(os.path.join(args.salida, str(anio)), exist_ok=True)
+    ruta_progreso = os.path.join(args.salida, str(anio), PROGRESO)
+    nombres = {
+        (programa, str(escuela)): nombre
+        for indice, programa in PROGRAMAS.items() if programa in args.programas
+        for escuela, nombre in nombres_archivo(programa, anio, _particiones.get(indice, {})).items()
+    }
+    hechas = set() if args.rehacer else leer_progreso(ruta_progreso, origen, args.formatos, args.salida, anio, nombres)
+    tareas = [
+        (indice, escuela, nombres[(programa, str(escuela))])
+        for indice, programa in PROGRAMAS.items() if programa in args.programas
+        for escuela in _particiones.get(indice, {})
+        if (programa, str(escuela)) not in hechas
+    ]
+    print(f"{len(tareas)} escuelas por exportar ({len(hechas)} ya hechas) en {args.procesos} procesos")
+
+    hechos, fallidos, por_formato = 0, 0, {}
+    dibujo = {'segundos': 0.0, 'imagenes': 0, 'lotes': 0}
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.procesos, initializer=_iniciar_proceso, initargs=(origen,)) as pool, \
+            open(ruta_progreso, 'a', encoding='utf-8') as progreso:
+        futuros = {pool.submit(exportar_lote, lote, args.formatos, args.salida, anio): lote
+                   for lote in _lotes(tareas, args.lote)}
+        for futuro in as_completed(futuros):
+            try:
+                resultados = futuro.result()
+            except Exception as e:
+                fallidos += len(futuros[futuro])
+                print(f"Error al exportar {len(futuros[futuro])} escuelas: {str(e)}")
+                continue
+            for registro in resultados:
+                progreso.write(json.dumps(dict(registro, origen=list(origen[:2])), ensure_ascii=False) + '\n')
+                for formato, segundos in registro['archivos'].items():
+                    por_formato.setdefault(formato, []).append(segundos)
+            progreso.flush()
+            lote = resultados[0].get('lote_imagenes')
+            if lote is not None:
+                dibujo['segundos'] += lote['segundos']
+                dibujo['imagenes'] += lote['imagenes']
+                dibujo['lotes'] += 1
+            hechos += len(resultados)
+            transcurrido = time.perf_counter() - inicio
+            restante = transcurrido / max(hechos, 1) * (len(tareas) - hechos - fallidos)
+            ultimo = resultados[-1]
+            imagenes = f", imágenes del lote {lote['segundos']:.2f}s" if lote is not None else ''
+            print(f"[{hechos + fallidos}/{len(tareas)}] {ultimo['programa']} {ultimo['escuela']}: "
+                  f"{ultimo['segundos']:.2f}s{imagenes} | {transcurrido:.0f}s, faltan ~{restante:.0f}s")
+
+    total = time.perf_counter() - inicio
+    print(f"\n{hechos} escuelas exportadas en {total:.1f}s, {fallidos} con error")
+    for formato, tiempos in sorted(por_formato.items()):
+        print(f"{formato}: {len(tiempos)} archivos, {sum(tiempos) / len(tiempos) * 1000:.0f} ms promedio")
+    if dibujo['lotes']:
+        # Promedio del lote: kaleido dibuja todas juntas, no es la latencia de un informe
+        print(f"imágenes: {dibujo['imagenes']} en {dibujo['lotes']} lotes, {dibujo['segundos']:.1f}s dibujando "
+              f"({dibujo['segundos'] / dibujo['imagenes'] * 1000:.0f} ms por imagen como promedio del lote)")
+    if fallidos:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
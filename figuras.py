@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Configuración de estilos (la usan el dashboard y los informes exportados)
+styles = {
+    'background': '#F5F5F5',
+    'text': '#0A2463',
+    'accent': '#0A2463', #COLOR DE TÍTULO GENERAL
+    'card': '#FFFFFF',
+    'font': 'Roboto, sans-serif',
+    'grid': '#E0E0E0'
+}
+
+
+# ===== Cache de figuras =====
+class CacheFiguras:
+    """Cache LRU de figuras ya construidas, con tope de entradas y de memoria.
+
+    La clave debe incluir el id del snapshot (`Snapshot.id`, no el contador
+    `version`, que se repite entre corridas y dejaría leer del disco figuras de
+    otra foto), así una foto nueva invalida sola las figuras viejas. Se guarda el dict de la figura,
+    listo para devolverlo desde un callback sin volver a construirla.
+
+    Con `directorio`, cada figura se escribe además como JSON en disco: los
+    otros workers (y el mismo proceso tras un reinicio) la leen de ahí en lugar
+    de volver a construirla. El directorio se poda a `max_bytes_disco`, las
+    más viejas primero.
+    """
+
+    def __init__(self, max_entradas=256, max_bytes=64 * 1024 * 1024, directorio=None,
+                 max_bytes_disco=256 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self.hits = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.bytes = 0
+        self._escrituras = 0
+        self._figuras = OrderedDict()   # clave -> (dict de la figura, tamaño en bytes)
+        self._lock = threading.Lock()
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def obtener(self, clave, construir):
+        with self._lock:
+            entrada = self._figuras.get(clave)
+            if entrada is not None:
+                self._figuras.move_to_end(clave)
+                self.hits += 1
+                return entrada[0]
+
+        texto = self._leer_disco(clave)
+        if texto is not None:
+            figura = json.loads(texto)
+            with self._lock:
+                self.hits_disco += 1
+            self._guardar(clave, figura, len(texto))
+            return figura
+
+        with self._lock:
+            self.misses += 1
+        # Se construye fuera del lock: dos pedidos simultáneos de la misma clave
+        # pueden construirla dos veces, pero ninguno bloquea a los demás
+        fig = construir()
+        figura = fig.to_dict() if hasattr(fig, 'to_dict') else fig
+        texto = pio.to_json(figura, validate=False)
+        self._escribir_disco(clave, texto)
+        self._guardar(clave, figura, len(texto))
+        return figura
+
+    def _guardar(self, clave, figura, tamano):
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._figuras.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._figuras[clave] = (figura, tamano)
+            self.bytes += tamano
+            while self._figuras and (len(self._figuras) > self.max_entradas or self.bytes > self.max_bytes):
+                _, (_, liberado) = self._figuras.popitem(last=False)
+                self.bytes -= liberado
+
+    # ===== Segundo nivel en disco, compartido entre procesos =====
+    def _ruta(self, clave):
+        # repr() de la clave es estable entre procesos: tuplas de str, int y Timestamp
+        return os.path.join(self.directorio, hashlib.sha1(repr(clave).encode('utf-8')).hexdigest() + '.json')
+
+    def _leer_disco(self, clave):
+        if not self.directorio:
+            return None
+        try:
+            with open(self._ruta(clave), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _escribir_disco(self, clave, texto):
+        if not self.directorio:
+            return
+        ruta = self._ruta(clave)
+        # Temporal propio de cada proceso y rename atómico: nadie lee un JSON a medias
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporal, 'w', encoding='utf-8') as f:
+                f.write(texto)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            print(f"Error al guardar figura en disco: {str(e)}")
+            return
+        with self._lock:
+            self._escrituras += 1
+            podar = self._escrituras % 32 == 0
+        if podar:
+            self._podar_disco()
+
+    def _podar_disco(self):
+        try:
+            archivos = []
+            for entrada in os.scandir(self.directorio):
+                if entrada.name.endswith('.json'):
+                    datos = entrada.stat()
+                    archivos.append((datos.st_mtime, datos.st_size, entrada.path))
+            total = sum(tamano for _, tamano, _ in archivos)
+            for _, tamano, ruta in sorted(archivos):
+                if total <= self.max_bytes_disco:
+                    break
+                os.remove(ruta)
+                total -= tamano
+        except OSError as e:
+            print(f"Error al podar el cache de figuras: {str(e)}")
+
+
+# ===== Figura por escuela =====
+def crear_figura_escuela(filtered, escuela, title):
+    # Crear gráfico
+    fig = px.line(
+        filtered,
+        x='Fecha',
+        y=['Inscriptos', 'Presentes'],
+        title=f"{title} - {escuela}",
+        color_discrete_sequence=[styles['accent'], '#FF0000']
+    )
+    
+    # Estilo del gráfico
+    fig.update_layout(
+        plot_bgcolor=styles['card'],
+        paper_bgcolor=styles['background'],
+        font={'color': styles['text']},
+        xaxis={'gridcolor': styles['grid']},
+        yaxis={'gridcolor': styles['grid']},
+        title={'font': {'size': 20, 'color': styles['accent']}},
+        legend_title_text='',
+        hovermode='x unified'
+    )
+    
+    # Días sin asistencia: una sola traza de marcadores en lugar de una anotación por fila
+    sin_asistencia = filtered[filtered['Presentes'] == 0]
+    if not sin_asistencia.empty:
+        fig.add_trace(go.Scatter(
+            x=sin_asistencia['Fecha'],
+            y=[0] * len(sin_asistencia),
+            mode='markers',
+            name='Sin asistencia',
+            customdata=sin_asistencia['Observaciones'],
+            hovertemplate='%{customdata}<extra>Sin asistencia</extra>',
+            marker=dict(
+                symbol='triangle-up',
+                size=10,
+                color='rgba(255,165,0,0.8)',
+                line=dict(width=1, color=styles['accent'])
+            )
+        ))
+    
+    return fig
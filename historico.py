@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Histórico por año y programa: los años cerrados, congelados en archivos Feather.
+
+    historico/
+        2024/
+            manifest.json
+            cch.feather  ci.feather  cj.feather  cai.feather
+
+Solo la planilla del año en curso (`nombre_planilla(ANIO_ACTUAL)`) se
+sincroniza con Google Sheets. ANIO_ACTUAL se fija en el entorno al cambiar de
+año; sin él se sigue con el año de la última foto en disco. Un año cerrado se
+congela una vez, desde su última foto en disco o descargando su planilla (el
+dashboard baja solo las que falten, así un deploy con disco efímero rearma el
+histórico), y a partir de ahí se lee solo de acá: cada (año, programa) es un archivo de solo lectura, así que una
+comparación de CI entre 2024 y 2025 abre dos archivos y solo las columnas
+que necesita.
+
+Uso desde la línea de comandos:
+    python historico.py listar
+    python historico.py congelar 2024               # descarga Raciones_2024 de Sheets
+    python historico.py congelar 2025 --desde-snapshots
+    python historico.py mostrar 2024
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+from datos import COLUMNAS_NUMERICAS, cargar_hojas, normalizar
+from snapshots import DIRECTORIO_SNAPSHOTS, anio_snapshot, cargar_snapshot, leer_manifest
+
+DIRECTORIO_HISTORICO = os.environ.get('DIRECTORIO_HISTORICO', 'historico')
+# Nombre de la planilla de cada año; solo la del año en curso se consulta en Sheets
+PLANILLA = os.environ.get('PLANILLA', 'Raciones_{anio}')
+# Hoja de la planilla -> programa (nombre de su archivo en cada año)
+PROGRAMAS = {0: 'cch', 1: 'ci', 2: 'cj', 3: 'cai'}
+TITULOS = {0: "Club de Chicos", 1: "Centros Infantiles", 2: "Club de Jóvenes", 3: "CAI"}
+MANIFEST = 'manifest.json'
+# Año bisiesto de referencia para superponer años distintos en un mismo eje
+ANIO_REFERENCIA = 2000
+
+
+def nombre_planilla(anio):
+    return PLANILLA.format(anio=anio)
+
+
+def anio_ultima_foto(directorio_snapshots=DIRECTORIO_SNAPSHOTS):
+    """Año de la planilla de la foto más reciente en disco, o None si no hay fotos."""
+    for entrada in reversed(leer_manifest(directorio_snapshots)['snapshots']):
+        anio = anio_snapshot(entrada, directorio_snapshots)
+        if anio is not None:
+            return anio
+    return None
+
+
+# Año en curso: sin ANIO_ACTUAL, el de la última foto, así en enero se sigue con
+# la planilla que se estaba cargando hasta pasar al año nuevo a mano
+ANIO_ACTUAL = int(os.environ.get('ANIO_ACTUAL') or anio_ultima_foto() or date.today().year)
+
+
+# ===== Congelar =====
+def congelar(anio, hojas, directorio=DIRECTORIO_HISTORICO, origen=None, forzar=False):
+    """Escribe las hojas de un año cerrado como un archivo por programa. Devuelve el manifest.
+
+    `hojas` es {número de hoja: DataFrame}, tal como vienen de Sheets o de una
+    foto. Si el año ya estaba congelado se lanza FileExistsError, salvo con
+    `forzar`. El año se arma en una carpeta temporal y se mueve entero, así
+    que quien lo lea ve el año anterior completo o el nuevo, nunca una mezcla.
+    """
+    destino = os.path.join(directorio, str(anio))
+    if os.path.exists(os.path.join(destino, MANIFEST)) and not forzar:
+        raise FileExistsError(f"El año {anio} ya está congelado en {destino}")
+    os.makedirs(directorio, exist_ok=True)
+    temporal = os.path.join(directorio, f'.{anio}.{os.getpid()}.tmp')
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    programas = {}
+    for indice, df in sorted(hojas.items()):
+        df = normalizar(df).reset_index(drop=True)
+        programa = PROGRAMAS.get(indice, f'hoja_{indice}')
+        archivo = f'{programa}.feather'
+        ruta = os.path.join(temporal, archivo)
+        df.to_feather(ruta, compression='zstd')
+        os.chmod(ruta, 0o444)
+        fechas = df['Fecha'] if 'Fecha' in df.columns and not df.empty else None
+        programas[programa] = {
+            'hoja': indice,
+            'archivo': archivo,
+            'filas': len(df),
+            'desde': fechas.min().date().isoformat() if fechas is not None else None,
+            'hasta': fechas.max().date().isoformat() if fechas is not None else None,
+        }
+    manifest = {
+        'anio': anio,
+        'congelado': datetime.now().isoformat(timespec='seconds'),
+        'origen': origen,
+        'programas': programas,
+    }
+    with open(os.path.join(temporal, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(destino):
+        viejo = f'{temporal}.viejo'
+        os.replace(destino, viejo)
+        shutil.rmtree(viejo, ignore_errors=True)
+    try:
+        os.replace(temporal, destino)
+    except OSError:
+        # Otro worker congeló el mismo año entre la verificación y el rename
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise FileExistsError(f"El año {anio} ya está congelado en {destino}")
+    return manifest
+
+
+def congelar_cerrados(anio_actual=ANIO_ACTUAL, directorio=DIRECTORIO_HISTORICO,
+                      directorio_snapshots=DIRECTORIO_SNAPSHOTS):
+    """Congela con su última foto en disco cada año anterior a `anio_actual` que falte.
+
+    Se llama al arrancar, antes de que la poda de snapshots borre las fotos
+    del año que terminó. Devuelve los años congelados.
+    """
+    ultimas = {}
+    for entrada in leer_manifest(directorio_snapshots)['snapshots']:
+        anio = anio_snapshot(entrada, directorio_snapshots)
+        if anio is not None and anio < anio_actual:
+            ultimas[anio] = entrada   # el manifest va de la más vieja a la más nueva
+    congelados = []
+    for anio, entrada in sorted(ultimas.items()):
+        if os.path.exists(os.path.join(directorio, str(anio), MANIFEST)):
+            continue
+        snapshot = cargar_snapshot(entrada['id'], directorio_snapshots)
+        try:
+            congelar(anio, snapshot.hojas, directorio, origen=f"snapshot {entrada['id']}")
+        except FileExistsError:
+            continue
+        congelados.append(anio)
+    return congelados
+
+
+def _hojas_de_sheets(anio, credenciales=None):
+    from sheets import ConexionSheets, credenciales_entorno
+    nombre = nombre_planilla(anio)
+    conexion = ConexionSheets(credenciales or credenciales_entorno(), nombre)
+    hojas, tiempos = cargar_hojas(conexion, list(PROGRAMAS))
+    print(f"{nombre} descargada en {tiempos['total']:.1f}s ({conexion.estadisticas['llamadas']} llamadas)")
+    return hojas, f"planilla {nombre}"
+
+
+def congelar_desde_sheets(anios, credenciales=None, directorio=DIRECTORIO_HISTORICO):
+    """Congela descargando su planilla cada año de `anios` que falte.
+
+    Para un disco sin fotos de los años cerrados (p. ej. un deploy efímero,
+    donde historico/ no sobrevive): cada planilla se baja una sola vez y
+    después el año se lee del disco. Devuelve (congelados, sin planilla); un
+    año que falló por otro motivo no está en ninguna y se puede reintentar.
+    """
+    from gspread.exceptions import SpreadsheetNotFound
+    congelados, sin_planilla = [], []
+    for anio in sorted(anios):
+        if os.path.exists(os.path.join(directorio, str(anio), MANIFEST)):
+            continue
+        try:
+            hojas, origen = _hojas_de_sheets(anio, credenciales)
+            congelar(anio, hojas, directorio, origen=origen)
+        except SpreadsheetNotFound:
+            print(f"No se encontró {nombre_planilla(anio)}; el año {anio} queda sin histórico")
+            sin_planilla.append(anio)
+            continue
+        except FileExistsError:
+            continue
+        except Exception as e:
+            print(f"Error al congelar {anio} desde Sheets: {str(e)}")
+            continue
+        congelados.append(anio)
+    return congelados, sin_planilla
+
+
+# ===== Lectura =====
+class AlmacenAnual:
+    """Lee los años congelados de a una partición (año, programa) por vez.
+
+    Los archivos no cambian, así que lo leído queda en memoria; la clave lleva
+    la fecha de congelado del manifest para que recongelar un año no sirva
+    datos viejos. `lecturas` y `aciertos` cuentan las particiones leídas de
+    disco y las servidas de memoria.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_HISTORICO):
+        self.directorio = directorio
+        self.lecturas = 0
+        self.aciertos = 0
+        self._manifests = {}   # año -> (mtime del manifest, manifest)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def anios(self):
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            int(nombre) for nombre in os.listdir(self.directorio)
+            if nombre.isdigit() and os.path.exists(os.path.join(self.directorio, nombre, MANIFEST))
+        )
+
+    def manifest(self, anio):
+        ruta = os.path.join(self.directorio, str(anio), MANIFEST)
+        try:
+            mtime = os.path.getmtime(ruta)
+        except OSError:
+            return None
+        with self._lock:
+            guardado = self._manifests.get(anio)
+        if guardado is not None and guardado[0] == mtime:
+            return guardado[1]
+        with open(ruta, encoding='utf-8') as f:
+            manifest = json.load(f)
+        with self._lock:
+            self._manifests[anio] = (mtime, manifest)
+        return manifest
+
+    def _obtener(self, clave, crear):
+        with self._lock:
+            if clave in self._cache:
+                self.aciertos += 1
+                return self._cache[clave]
+        valor = crear()
+        with self._lock:
+            self._cache[clave] = valor
+        return valor
+
+    def leer(self, anio, indice, columnas=None):
+        """Filas de un programa en un año cerrado (solo `columnas`, si se pasan), o None."""
+        manifest = self.manifest(anio)
+        entrada = manifest['programas'].get(PROGRAMAS.get(indice, f'hoja_{indice}')) if manifest else None
+        if entrada is None:
+            return None
+        ruta = os.path.join(self.directorio, str(anio), entrada['archivo'])
+        clave = ('filas', anio, indice, tuple(columnas) if columnas else None, manifest['congelado'])
+
+        def leer_disco():
+            with self._lock:
+                self.lecturas += 1
+            return pd.read_feather(ruta, columns=columnas)
+        return self._obtener(clave, leer_disco)
+
+    def diarios(self, anio, indice):
+        """Totales de Inscriptos y Presentes por fecha, como `Agregados.diarios`, o None."""
+        manifest = self.manifest(anio)
+        if manifest is None:
+            return None
+
+        def calcular():
+            df = self.leer(anio, indice, ['Fecha'] + COLUMNAS_NUMERICAS)
+            if df is None:
+                return None
+            validas = df[df['Inscriptos'] > 0]
+            return validas.groupby('Fecha', as_index=False)[COLUMNAS_NUMERICAS].sum()
+        return self._obtener(('diarios', anio, indice, manifest['congelado']), calcular)
+
+    def firma(self, anios):
+        """Fecha de congelado de cada año pedido, para usar en claves de cache."""
+        firmas = []
+        for anio in anios:
+            manifest = self.manifest(anio)
+            firmas.append(manifest['congelado'] if manifest else None)
+        return tuple(firmas)
+
+
+# ===== Comparaciones entre años =====
+def comparacion_interanual(diarios, frecuencia='W-MON', alinear=True):
+    """Promedio por período de los totales diarios de cada año, en una sola tabla.
+
+    `diarios` es {año: totales por fecha}. Con `alinear` cada fecha se lleva al
+    mismo día de `ANIO_REFERENCIA`, para superponer los años en un eje de
+    enero a diciembre; sin alinear queda la serie continua de varios años.
+    """
+    partes = []
+    for anio, df in sorted(diarios.items()):
+        if df is None or df.empty:
+            continue
+        df = df[['Fecha'] + COLUMNAS_NUMERICAS]
+        if alinear:
+            fechas = df['Fecha']
+            df = df.assign(Fecha=pd.to_datetime(pd.DataFrame({
+                'year': ANIO_REFERENCIA, 'month': fechas.dt.month, 'day': fechas.dt.day})))
+        periodo = pd.Grouper(key='Fecha', freq=frecuencia, label='left', closed='left')
+        promedios = df.groupby(periodo)[COLUMNAS_NUMERICAS].mean().dropna().round().reset_index()
+        partes.append(promedios.assign(Anio=str(anio)))
+    if not partes:
+        return pd.DataFrame(columns=['Anio', 'Fecha'] + COLUMNAS_NUMERICAS)
+    return pd.concat(partes, ignore_index=True)[['Anio', 'Fecha'] + COLUMNAS_NUMERICAS]
+
+
+# ===== Línea de comandos =====
+def _tamano(carpeta):
+    return sum(os.path.getsize(os.path.join(carpeta, f)) for f in os.listdir(carpeta)) if os.path.isdir(carpeta) else 0
+
+
+def _hojas_de_snapshots(anio, directorio_snapshots):
+    for entrada in reversed(leer_manifest(directorio_snapshots)['snapshots']):
+        if anio_snapshot(entrada, directorio_snapshots) == anio:
+            return cargar_snapshot(entrada['id'], directorio_snapshots).hojas, f"snapshot {entrada['id']}"
+    raise SystemExit(f"No hay snapshots del año {anio} en {directorio_snapshots}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Congelar e inspeccionar los años cerrados')
+    parser.add_argument('--directorio', default=DIRECTORIO_HISTORICO)
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('listar', help='lista los años congelados')
+    congelar_cmd = sub.add_parser('congelar', help='congela un año cerrado')
+    congelar_cmd.add_argument('anio', type=int)
+    congelar_cmd.add_argument('--desde-snapshots', action='store_true',
+                              help='usar la última foto de ese año en lugar de descargar su planilla')
+    congelar_cmd.add_argument('--snapshots', default=DIRECTORIO_SNAPSHOTS)
+    congelar_cmd.add_argument('--forzar', action='store_true', help='reemplazar el año si ya estaba congelado')
+    mostrar = sub.add_parser('mostrar', help='lee cada programa de un año y mide cuánto tarda')
+    mostrar.add_argument('anio', type=int)
+    args = parser.parse_args(argv)
+
+    if args.comando == 'listar':
+        almacen = AlmacenAnual(args.directorio)
+        for anio in almacen.anios():
+            manifest = almacen.manifest(anio)
+            kb = _tamano(os.path.join(args.directorio, str(anio))) / 1024
+            programas = ', '.join(f"{p} {e['filas']}" for p, e in manifest['programas'].items())
+            print(f"{anio}  {manifest['congelado']}  {kb:>9.1f} KB  {programas}  ({manifest['origen']})")
+    elif args.comando == 'congelar':
+        if args.anio >= ANIO_ACTUAL:
+            raise SystemExit(f"{args.anio} no está cerrado (año en curso: {ANIO_ACTUAL})")
+        if args.desde_snapshots:
+            hojas, origen = _hojas_de_snapshots(args.anio, args.snapshots)
+        else:
+            hojas, origen = _hojas_de_sheets(args.anio)
+        try:
+            manifest = congelar(args.anio, hojas, args.directorio, origen=origen, forzar=args.forzar)
+        except FileExistsError as e:
+            raise SystemExit(f"{e} (usar --forzar para reemplazarlo)")
+        for programa, entrada in manifest['programas'].items():
+            print(f"{programa}: {entrada['filas']} filas, {entrada['desde']} a {entrada['hasta']}")
+    elif args.comando == 'mostrar':
+        almacen = AlmacenAnual(args.directorio)
+        if almacen.manifest(args.anio) is None:
+            raise SystemExit(f"El año {args.anio} no está congelado")
+        for indice, programa in PROGRAMAS.items():
+            inicio = time.perf_counter()
+            df = almacen.leer(args.anio, indice)
+            if df is None:
+                continue
+            escuelas = df['Escuela'].nunique() if 'Escuela' in df.columns else 0
+            print(f"{programa}: {len(df)} filas, {escuelas} escuelas, "
+                  f"leído en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
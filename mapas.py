@@ -0,0 +1,664 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Mapas de sedes servidos como GeoJSON en lugar de los HTML exportados por Folium.
+
+Los exports (`inscriptos_sede.html`, `control_sedes.html`) traen un bloque de
+JavaScript por participante: marcador, línea hasta la sede, popup y tooltip.
+Acá se leen una vez, se guardan como dos tablas (sedes y participantes) y se
+sirven como un GeoJSON compacto; las líneas y los popups se arman en el navegador
+a partir de las propiedades de cada punto. Para el mapa interactivo los
+participantes se agrupan además en celdas según el zoom, con un haz de líneas
+por celda y sede en lugar de una línea por participante.
+
+Los mapas estáticos también se generan desde acá, a partir de tablas CSV:
+    python mapas.py extraer inscriptos        # export de Folium -> datos_mapas/*.csv
+    python mapas.py generar inscriptos --raciones --salida mapa_inscriptos.html
+"""
+import argparse
+import hashlib
+import html as html_lib
+import json
+import os
+import re
+import string
+import threading
+
+import numpy as np
+import pandas as pd
+
+from espacial import IndiceSedes
+
+# Capas disponibles: nombre en la URL -> export de Folium del que se leen los datos
+CAPAS_MAPA = {
+    'inscriptos': 'inscriptos_sede.html',
+    'control': 'control_sedes.html',
+}
+DECIMALES = 6   # ~10 cm, la misma precisión que traen los exports
+TAMANO_CELDA = 40   # lado de cada celda de agrupamiento, en píxeles de pantalla
+ZOOM_MAXIMO = 20
+# Tablas de sedes y participantes de cada capa; si existen tienen prioridad sobre el export de Folium
+DIRECTORIO_MAPAS = os.environ.get('DIRECTORIO_MAPAS', 'datos_mapas')
+
+
+# ===== Lectura de los exports de Folium =====
+_MARCADOR = re.compile(r'var (circle_marker|marker)_\w+ = L\.(?:circleMarker|marker)\(\s*\[([-\d.]+),\s*([-\d.]+)\]')
+_POPUP = re.compile(r'\$\(`<div id="html_\w+"[^>]*>(.*?)</div>`\)', re.S)
+_TOOLTIP = re.compile(r'bindTooltip\(\s*`<div>(.*?)</div>`', re.S)
+_COLOR = re.compile(r'"(?:iconColor|color)": "(#[0-9a-fA-F]{6})"')
+_ETIQUETAS = re.compile(r'<[^>]+>')
+
+
+def _texto(html):
+    return re.sub(r'\s+', ' ', _ETIQUETAS.sub(' ', html)).strip()
+
+
+def _sede(popup):
+    # "<b>Nombre</b><br> <i ...></i> Dirección<br> <i ...></i> Inscriptos: 39<br> <i ...></i> Talleres: ..."
+    partes = [_texto(p) for p in re.split(r'<br\s*/?>', popup)]
+    nombre = _texto(re.search(r'<b>(.*?)</b>', popup, re.S).group(1))
+    inscriptos = next((p.split(':', 1)[1] for p in partes if p.startswith('Inscriptos:')), '')
+    talleres = next((p.split(':', 1)[1].strip() for p in partes if p.startswith('Talleres:')), '')
+    return {
+        'nombre': nombre,
+        'direccion': partes[1] if len(partes) > 1 else '',
+        'inscriptos': int(re.sub(r'\D', '', inscriptos) or 0),
+        'talleres': talleres,
+    }
+
+
+def leer_export_folium(ruta):
+    """Devuelve `(sedes, participantes)` leídos de un mapa exportado por Folium.
+
+    `sedes`: id, nombre, direccion, inscriptos, talleres, color, lat, lon.
+    `participantes`: id, nombre, dni, sede (id de la sede, -1 si no se encontró), color, lat, lon.
+    """
+    with open(ruta, encoding='utf-8') as f:
+        html = f.read()
+    marcadores = list(_MARCADOR.finditer(html))
+    sedes, participantes = [], []
+    for n, m in enumerate(marcadores):
+        fin = marcadores[n + 1].start() if n + 1 < len(marcadores) else len(html)
+        bloque = html[m.end():fin]
+        popup = _POPUP.search(bloque)
+        tooltip = _TOOLTIP.search(bloque)
+        color = _COLOR.search(bloque)
+        punto = {
+            'lat': float(m.group(2)),
+            'lon': float(m.group(3)),
+            'color': color.group(1) if color else '#0A2463',
+        }
+        if m.group(1) == 'marker':
+            if popup is None or '<b>' not in popup.group(1):
+                continue
+            sedes.append({**_sede(popup.group(1)), **punto})
+        else:
+            asiste = _texto(popup.group(1)) if popup else ''
+            datos = _texto(tooltip.group(1)) if tooltip else ''
+            nombre, _, dni = datos.partition('| DNI:')
+            participantes.append({
+                'nombre': re.sub(r'\s+', ' ', nombre.replace('Nombre:', '', 1)).strip(),
+                'dni': dni.strip(),
+                'asiste': asiste.split(':', 1)[1].strip() if ':' in asiste else asiste,
+                **punto,
+            })
+
+    columnas_sedes = ['id', 'nombre', 'direccion', 'inscriptos', 'talleres', 'color', 'lat', 'lon']
+    sedes = pd.DataFrame(sedes).drop_duplicates('nombre').reset_index(drop=True)
+    sedes = sedes.assign(id=sedes.index)[columnas_sedes] if not sedes.empty else pd.DataFrame(columns=columnas_sedes)
+    participantes = pd.DataFrame(participantes, columns=['nombre', 'dni', 'asiste', 'color', 'lat', 'lon'])
+    ids_sede = dict(zip(sedes['nombre'], sedes['id']))
+    participantes['sede'] = participantes['asiste'].map(ids_sede).fillna(-1).astype(int)
+    participantes['id'] = participantes.index
+    return sedes, participantes[['id', 'nombre', 'dni', 'sede', 'color', 'lat', 'lon']]
+
+
+# ===== Tablas de sedes y participantes =====
+COLUMNAS_SEDES = ['nombre', 'direccion', 'inscriptos', 'talleres', 'color', 'lat', 'lon']
+COLUMNAS_PARTICIPANTES = ['nombre', 'dni', 'sede', 'lat', 'lon']
+
+
+def rutas_tablas(capa, directorio=DIRECTORIO_MAPAS):
+    return (os.path.join(directorio, f'{capa}_sedes.csv'),
+            os.path.join(directorio, f'{capa}_participantes.csv'))
+
+
+def ordenar(sedes, participantes):
+    """Orden estable e independiente del origen: sedes por nombre, participantes por sede y posición.
+
+    Devuelve copias con los ids renumerados en ese orden.
+    """
+    nombres = participantes['sede'].map(dict(zip(sedes['id'], sedes['nombre']))).fillna('')
+    sedes = sedes.sort_values('nombre', kind='stable').reset_index(drop=True)
+    nuevos = dict(zip(sedes['id'], sedes.index))
+    sedes['id'] = sedes.index
+    participantes = (participantes.assign(_sede=nombres)
+                     .sort_values(['_sede', 'lat', 'lon', 'nombre', 'dni'], kind='stable')
+                     .drop(columns='_sede').reset_index(drop=True))
+    participantes['sede'] = participantes['sede'].map(nuevos).fillna(-1).astype(int)
+    participantes['id'] = participantes.index
+    return sedes, participantes
+
+
+def guardar_tablas(sedes, participantes, capa, directorio=DIRECTORIO_MAPAS):
+    """Escribe las dos tablas de la capa, ordenadas, con la sede de cada participante por nombre."""
+    os.makedirs(directorio, exist_ok=True)
+    sedes, participantes = ordenar(sedes, participantes)
+    participantes = participantes.assign(sede=participantes['sede'].map(dict(zip(sedes['id'], sedes['nombre']))))
+    ruta_sedes, ruta_participantes = rutas_tablas(capa, directorio)
+    sedes[COLUMNAS_SEDES].to_csv(ruta_sedes, index=False, lineterminator='\n')
+    participantes[COLUMNAS_PARTICIPANTES].to_csv(ruta_participantes, index=False, lineterminator='\n')
+    return ruta_sedes, ruta_participantes
+
+
+def leer_tablas(capa, directorio=DIRECTORIO_MAPAS):
+    """Devuelve `(sedes, participantes)` con la misma forma que `leer_export_folium`."""
+    ruta_sedes, ruta_participantes = rutas_tablas(capa, directorio)
+    sedes = pd.read_csv(ruta_sedes, dtype={'nombre': str, 'direccion': str, 'talleres': str, 'color': str},
+                        keep_default_na=False)
+    participantes = pd.read_csv(ruta_participantes, dtype={'nombre': str, 'dni': str, 'sede': str},
+                                keep_default_na=False)
+    sedes = sedes.assign(id=sedes.index)[['id'] + COLUMNAS_SEDES]
+    color = dict(zip(sedes['nombre'], sedes['color']))
+    participantes = participantes.assign(
+        id=participantes.index,
+        color=participantes['sede'].map(color).fillna('#0A2463'),
+        sede=participantes['sede'].map(dict(zip(sedes['nombre'], sedes['id']))).fillna(-1).astype(int)
+    )
+    return sedes, participantes[['id', 'nombre', 'dni', 'sede', 'color', 'lat', 'lon']]
+
+
+def leer_capa(capa, capas=CAPAS_MAPA, directorio='.', directorio_datos=DIRECTORIO_MAPAS):
+    """Lee la capa de sus tablas si existen, si no del export de Folium. Devuelve `(sedes, participantes, rutas)`."""
+    tablas = rutas_tablas(capa, directorio_datos)
+    if all(os.path.exists(ruta) for ruta in tablas):
+        return (*leer_tablas(capa, directorio_datos), tablas)
+    ruta = os.path.join(directorio, capas[capa])
+    return (*leer_export_folium(ruta), (ruta,))
+
+
+# ===== GeoJSON =====
+def _punto(lat, lon):
+    return {'type': 'Point', 'coordinates': [round(lon, DECIMALES), round(lat, DECIMALES)]}
+
+
+def _features_sedes(sedes):
+    return [
+        {'type': 'Feature', 'geometry': _punto(s.lat, s.lon), 'properties': {
+            'tipo': 'sede', 'id': int(s.id), 'nombre': s.nombre, 'direccion': s.direccion,
+            'inscriptos': int(s.inscriptos), 'talleres': s.talleres, 'color': s.color,
+        }}
+        for s in sedes.itertuples(index=False)
+    ]
+
+
+def a_geojson(sedes, participantes):
+    """FeatureCollection con una feature por sede y una por participante.
+
+    Los participantes solo llevan su id y el id de su sede: el color, la línea
+    hasta la sede y el texto del popup salen de la feature de la sede. Nombre y
+    DNI no viajan en el GeoJSON; se piden al abrir el popup.
+    """
+    features = _features_sedes(sedes)
+    features += [
+        {'type': 'Feature', 'geometry': _punto(lat, lon), 'properties': {'id': int(i), 's': int(s)}}
+        for i, s, lat, lon in zip(participantes['id'], participantes['sede'], participantes['lat'], participantes['lon'])
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# ===== Agrupamiento espacial =====
+def _celdas(lat, lon, zoom, tamano=TAMANO_CELDA):
+    # Índices de celda sobre la grilla de píxeles de Web Mercator (la de las teselas):
+    # a cualquier zoom cada celda mide `tamano` píxeles de lado en pantalla
+    escala = 256 * 2 ** zoom / tamano
+    seno = np.sin(np.radians(np.clip(lat, -85, 85)))
+    x = (np.asarray(lon) + 180) / 360
+    y = 0.5 - np.log((1 + seno) / (1 - seno)) / (4 * np.pi)
+    return np.floor(x * escala).astype(np.int64), np.floor(y * escala).astype(np.int64)
+
+
+def deduplicar(participantes):
+    """Una fila por coordenada y sede, con `n` participantes y el id del primero."""
+    return (participantes.groupby(['lat', 'lon', 'sede'], sort=False)
+            .agg(n=('id', 'size'), id=('id', 'first'))
+            .reset_index())
+
+
+def agrupar(participantes, zoom, tamano=TAMANO_CELDA):
+    """Agrupa participantes en celdas de `tamano` píxeles al `zoom` dado.
+
+    Devuelve `(grupos, flujos)`:
+    - `grupos`: una fila por celda con centroide (lat, lon), `n`, la sede más
+      frecuente (`sede`), `por_sede` {id de sede: cantidad} y `id` cuando hay
+      un único participante (para pedir su popup).
+    - `flujos`: una fila por celda y sede con centroide y `n`; reemplaza las
+      líneas individuales por un haz por sede desde cada celda.
+    """
+    puntos = deduplicar(participantes)
+    puntos['cx'], puntos['cy'] = _celdas(puntos['lat'].to_numpy(), puntos['lon'].to_numpy(), zoom, tamano)
+    puntos['lat_n'] = puntos['lat'] * puntos['n']
+    puntos['lon_n'] = puntos['lon'] * puntos['n']
+
+    flujos = puntos.groupby(['cx', 'cy', 'sede'], sort=False)[['n', 'lat_n', 'lon_n']].sum().reset_index()
+    flujos['lat'] = flujos['lat_n'] / flujos['n']
+    flujos['lon'] = flujos['lon_n'] / flujos['n']
+
+    grupos = flujos.groupby(['cx', 'cy'], sort=False)[['n', 'lat_n', 'lon_n']].sum()
+    grupos['lat'] = grupos['lat_n'] / grupos['n']
+    grupos['lon'] = grupos['lon_n'] / grupos['n']
+    # Sede más frecuente de cada celda (la primera en caso de empate)
+    mayor = flujos.sort_values('n', ascending=False, kind='stable').drop_duplicates(['cx', 'cy'])
+    grupos['sede'] = mayor.set_index(['cx', 'cy'])['sede']
+    por_sede = {}
+    for cx, cy, sede, n in zip(flujos['cx'], flujos['cy'], flujos['sede'], flujos['n']):
+        por_sede.setdefault((cx, cy), {})[int(sede)] = int(n)
+    grupos['por_sede'] = [por_sede[celda] for celda in grupos.index]
+    solos = puntos[puntos['n'] == 1].groupby(['cx', 'cy'])['id'].first()
+    grupos['id'] = solos.reindex(grupos.index).where(grupos['n'] == 1)
+    grupos = grupos.reset_index()[['cx', 'cy', 'lat', 'lon', 'n', 'sede', 'por_sede', 'id']]
+    return grupos, flujos[['cx', 'cy', 'sede', 'lat', 'lon', 'n']]
+
+
+def a_geojson_agrupado(grupos, flujos, sedes, bbox=None):
+    """GeoJSON de grupos (Point) y haces hacia cada sede (LineString), opcionalmente recortado a `bbox`.
+
+    `bbox` es (oeste, sur, este, norte); se recorta por el centroide de cada celda.
+    """
+    if bbox is not None:
+        oeste, sur, este, norte = bbox
+        dentro = lambda df: df[df['lon'].between(oeste, este) & df['lat'].between(sur, norte)]
+        grupos, flujos = dentro(grupos), dentro(flujos)
+    posicion = dict(zip(sedes['id'], zip(sedes['lon'], sedes['lat'])))
+    features = []
+    for g in grupos.itertuples(index=False):
+        propiedades = {'n': int(g.n), 's': int(g.sede)}
+        if len(g.por_sede) > 1:
+            propiedades['sedes'] = {str(k): v for k, v in g.por_sede.items()}
+        if not pd.isna(g.id):
+            propiedades['id'] = int(g.id)
+        features.append({'type': 'Feature', 'geometry': _punto(g.lat, g.lon), 'properties': propiedades})
+    for f in flujos.itertuples(index=False):
+        destino = posicion.get(f.sede)
+        if destino is None:
+            continue
+        features.append({'type': 'Feature', 'properties': {'tipo': 'flujo', 's': int(f.sede), 'n': int(f.n)}, 'geometry': {
+            'type': 'LineString',
+            'coordinates': [[round(f.lon, DECIMALES), round(f.lat, DECIMALES)],
+                            [round(destino[0], DECIMALES), round(destino[1], DECIMALES)]],
+        }})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+class ServicioMapas:
+    """Lee cada capa una sola vez y la vuelve a leer solo si cambiaron sus archivos.
+
+    Cada capa sale de sus tablas en `directorio_datos` si existen, si no del export de Folium.
+    """
+
+    def __init__(self, capas=CAPAS_MAPA, directorio='.', directorio_datos=None):
+        self.capas = capas
+        self.directorio = directorio
+        self.directorio_datos = directorio_datos or os.path.join(directorio, DIRECTORIO_MAPAS)
+        self._datos = {}   # capa -> (mtime, sedes, participantes, geojson en bytes, versión)
+        self._agrupados = {}   # (capa, mtime, zoom) -> (grupos, flujos)
+        self._indices = {}     # capa -> (mtime, IndiceSedes)
+        self._lock = threading.Lock()
+
+    def _cargar(self, capa):
+        if capa not in self.capas:
+            raise KeyError(capa)
+        tablas = rutas_tablas(capa, self.directorio_datos)
+        if all(os.path.exists(ruta) for ruta in tablas):
+            mtime = tuple(os.path.getmtime(ruta) for ruta in tablas)
+        else:
+            mtime = (os.path.getmtime(os.path.join(self.directorio, self.capas[capa])),)
+        with self._lock:
+            datos = self._datos.get(capa)
+            if datos is not None and datos[0] == mtime:
+                return datos
+        sedes, participantes, _ = leer_capa(capa, self.capas, self.directorio, self.directorio_datos)
+        cuerpo = json.dumps(a_geojson(sedes, participantes), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # La versión es un hash del contenido: las URLs que la llevan se pueden cachear un año
+        datos = (mtime, sedes, participantes, cuerpo, hashlib.sha1(cuerpo).hexdigest()[:12])
+        with self._lock:
+            self._datos[capa] = datos
+            # Los agrupamientos de la versión anterior del archivo ya no sirven
+            self._agrupados = {k: v for k, v in self._agrupados.items() if k[0] != capa}
+        return datos
+
+    def geojson(self, capa):
+        return self._cargar(capa)[3]
+
+    def version(self, capa):
+        return self._cargar(capa)[4]
+
+    def sedes(self, capa):
+        return self._cargar(capa)[1]
+
+    def participantes(self, capa):
+        return self._cargar(capa)[2]
+
+    def sedes_geojson(self, capa):
+        geojson = {'type': 'FeatureCollection', 'features': _features_sedes(self.sedes(capa))}
+        return json.dumps(geojson, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def agrupados(self, capa, zoom, bbox=None):
+        """GeoJSON (en bytes) con los grupos y haces de la capa al `zoom` dado.
+
+        El agrupamiento de cada zoom se calcula una vez por versión del archivo;
+        el recorte a `bbox` se hace en cada pedido.
+        """
+        zoom = min(max(int(zoom), 0), ZOOM_MAXIMO)
+        mtime, sedes, participantes = self._cargar(capa)[:3]
+        clave = (capa, mtime, zoom)
+        with self._lock:
+            agrupado = self._agrupados.get(clave)
+        if agrupado is None:
+            agrupado = agrupar(participantes, zoom)
+            with self._lock:
+                self._agrupados[clave] = agrupado
+        geojson = a_geojson_agrupado(*agrupado, sedes, bbox)
+        return json.dumps(geojson, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def indice(self, capa):
+        """Índice espacial de la capa, armado una vez por versión de sus datos."""
+        mtime, sedes, participantes = self._cargar(capa)[:3]
+        with self._lock:
+            actual = self._indices.get(capa)
+        if actual is not None and actual[0] == mtime:
+            return actual[1]
+        indice = IndiceSedes(sedes, participantes)
+        with self._lock:
+            self._indices[capa] = (mtime, indice)
+        return indice
+
+    def participante(self, capa, id_participante):
+        """Datos del popup de un participante, o None si el id no existe."""
+        participantes = self.participantes(capa)
+        if not 0 <= id_participante < len(participantes):
+            return None
+        fila = participantes.iloc[id_participante]
+        sedes = self.sedes(capa)
+        sede = sedes.loc[sedes['id'] == fila['sede'], 'nombre']
+        return {
+            'nombre': fila['nombre'],
+            'dni': fila['dni'],
+            'sede': sede.iloc[0] if not sede.empty else '',
+        }
+
+    def pagina(self, capa, datos_personales=False):
+        """HTML de la capa; sin `datos_personales` el popup de un participante muestra solo su sede."""
+        if capa not in self.capas:
+            raise KeyError(capa)
+        return (PAGINA_MAPA.replace('{{capa}}', capa).replace('{{version}}', self.version(capa))
+                .replace('{{datos_personales}}', 'true' if datos_personales else 'false'))
+
+
+# ===== Página del mapa =====
+# Leaflet con render en canvas; los grupos se vuelven a pedir en cada zoom o desplazamiento
+PAGINA_MAPA = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"/>
+    <script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"></script>
+    <style>
+        html, body, #mapa {width: 100%; height: 100%; margin: 0; padding: 0; font-family: Roboto, sans-serif;}
+        .cantidad {background: none; border: none; box-shadow: none; color: #fff; font-weight: bold;}
+        .cantidad::before {display: none;}
+    </style>
+</head>
+<body>
+<div id="mapa"></div>
+<script>
+const capa = '{{capa}}';
+const version = '{{version}}';   // cambia con los datos: las respuestas se cachean por versión
+const datosPersonales = {{datos_personales}};   // nombre y DNI solo si el servidor los habilita
+const mapa = L.map('mapa', {preferCanvas: true}).setView([-34.61, -58.44], 12);
+L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    maxZoom: 19, attribution: '&copy; OpenStreetMap'
+}).addTo(mapa);
+
+const escapar = t => String(t).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+const sedes = {};
+const colorDe = id => (sedes[id] || {}).color || '#0A2463';
+const nombreDe = id => (sedes[id] || {}).nombre || 'Sede desconocida';
+
+// Los participantes llegan ya agrupados por el servidor según el zoom y la vista
+const capaGrupos = L.layerGroup();
+const capaFlujos = L.layerGroup();
+let pedido = 0;
+
+function popupGrupo(p) {
+    if (p.n === 1 && p.id !== undefined) return datosPersonales ? 'Cargando...' : 'Asiste a: ' + escapar(nombreDe(p.s));
+    const filas = Object.entries(p.sedes || {[p.s]: p.n})
+        .sort((a, b) => b[1] - a[1])
+        .map(([s, n]) => escapar(nombreDe(s)) + ': ' + n);
+    return '<b>' + p.n + ' participantes</b><br>' + filas.join('<br>');
+}
+
+function recargar() {
+    const b = mapa.getBounds();
+    const numero = ++pedido;
+    const url = capa + '/grupos.geojson?v=' + version + '&z=' + mapa.getZoom() +
+                '&bbox=' + [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].join(',');
+    fetch(url).then(r => r.json()).then(datos => {
+        if (numero !== pedido) return;   // llegó tarde: ya se pidió otra vista
+        capaGrupos.clearLayers();
+        capaFlujos.clearLayers();
+        for (const f of datos.features) {
+            const p = f.properties;
+            if (p.tipo === 'flujo') {
+                L.polyline(f.geometry.coordinates.map(c => [c[1], c[0]]), {
+                    color: colorDe(p.s), weight: Math.min(1 + Math.log2(p.n), 8), opacity: 0.5, interactive: false
+                }).addTo(capaFlujos);
+                continue;
+            }
+            const marcador = L.circleMarker([f.geometry.coordinates[1], f.geometry.coordinates[0]], {
+                radius: Math.min(4 + 3 * Math.sqrt(p.n), 30), weight: 2,
+                color: colorDe(p.s), fillColor: colorDe(p.s), fillOpacity: 0.7
+            }).addTo(capaGrupos);
+            if (p.n > 1) marcador.bindTooltip(String(p.n), {permanent: p.n >= 10, direction: 'center', className: 'cantidad'});
+            marcador.bindPopup(() => popupGrupo(p));
+            if (datosPersonales && p.n === 1 && p.id !== undefined) {
+                marcador.on('popupopen', evento => {
+                    fetch(capa + '/participante/' + p.id).then(r => r.json()).then(d => {
+                        evento.popup.setContent('<b>' + escapar(d.nombre) + '</b><br>DNI: ' + escapar(d.dni) +
+                                                '<br>Asiste a: ' + escapar(d.sede));
+                    });
+                });
+            }
+        }
+    });
+}
+
+fetch(capa + '/sedes.geojson?v=' + version).then(r => r.json()).then(datos => {
+    for (const f of datos.features) sedes[f.properties.id] = f.properties;
+    const capaSedes = L.geoJSON(datos, {
+        pointToLayer: (f, ll) => L.circleMarker(ll, {radius: 10, weight: 2, color: '#333', fillColor: f.properties.color, fillOpacity: 1}),
+        onEachFeature: (f, marcador) => {
+            const p = f.properties;
+            marcador.bindTooltip('Sede: ' + escapar(p.nombre), {sticky: true});
+            marcador.bindPopup('<b>' + escapar(p.nombre) + '</b><br>' + escapar(p.direccion) +
+                               '<br>Inscriptos: ' + p.inscriptos + '<br>Talleres: ' + escapar(p.talleres));
+        }
+    });
+    capaFlujos.addTo(mapa);
+    capaGrupos.addTo(mapa);
+    capaSedes.addTo(mapa);
+    L.control.layers(null, {'Sedes': capaSedes, 'Participantes': capaGrupos, 'Recorridos': capaFlujos},
+                     {collapsed: false}).addTo(mapa);
+    mapa.on('moveend', recargar);
+    if (datos.features.length) mapa.fitBounds(capaSedes.getBounds().pad(0.2));
+    recargar();
+});
+</script>
+</body>
+</html>
+'''
+
+
+# ===== Mapas estáticos =====
+# Un popup por plantilla y no por marcador: cada texto distinto se escribe una sola vez
+# en el HTML y los marcadores lo referencian por índice
+PLANTILLAS_POPUP = {
+    'sede': string.Template('<b>$nombre</b><br>$direccion<br>Inscriptos: $inscriptos<br>Talleres: $talleres'),
+    'participante': string.Template('Asiste a: $sede'),
+}
+PLANTILLA_TOOLTIP = string.Template('Nombre: $nombre | DNI: $dni')
+
+
+def inscriptos_raciones(snapshot):
+    """{escuela: inscriptos de la última fecha} según las hojas de Raciones."""
+    presentismo = snapshot.agregados.presentismo
+    if presentismo.empty:
+        return {}
+    return presentismo.groupby(presentismo['Escuela'].astype(str))['Inscriptos'].sum().astype(int).to_dict()
+
+
+def _llenar(plantilla, **valores):
+    return plantilla.substitute({k: html_lib.escape(str(v)) for k, v in valores.items()})
+
+
+def generar_html(sedes, participantes, titulo, datos_personales=False):
+    """HTML autocontenido del mapa, siempre igual para los mismos datos.
+
+    No lleva ids aleatorios ni fechas: sedes y participantes se ordenan, las
+    coordenadas se redondean y el JSON se escribe con separadores fijos. Nombre
+    y DNI de los participantes solo se incluyen con `datos_personales`.
+    """
+    sedes, participantes = ordenar(sedes, participantes)
+    popups = {}
+
+    def internar(texto):
+        return popups.setdefault(texto, len(popups))
+
+    lista_sedes = [
+        [round(s.lat, DECIMALES), round(s.lon, DECIMALES), s.color, internar(_llenar(
+            PLANTILLAS_POPUP['sede'], nombre=s.nombre, direccion=s.direccion,
+            inscriptos=s.inscriptos, talleres=s.talleres)), s.nombre]
+        for s in sedes.itertuples(index=False)
+    ]
+    nombres = dict(zip(sedes['id'], sedes['nombre']))
+    puntos = []
+    for p in participantes.itertuples(index=False):
+        punto = [round(p.lat, DECIMALES), round(p.lon, DECIMALES), int(p.sede),
+                 internar(_llenar(PLANTILLAS_POPUP['participante'], sede=nombres.get(p.sede, '')))]
+        if datos_personales:
+            punto.append(_llenar(PLANTILLA_TOOLTIP, nombre=p.nombre, dni=p.dni))
+        puntos.append(punto)
+
+    datos = {'sedes': lista_sedes, 'puntos': puntos, 'popups': list(popups)}
+    # '</' dentro de un <script> cerraría la etiqueta antes de tiempo
+    datos = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    return PLANTILLA_ESTATICA.replace('{{titulo}}', html_lib.escape(titulo)).replace('{{datos}}', datos)
+
+
+def escribir_si_cambio(ruta, contenido):
+    """Escribe `contenido` solo si difiere de lo que ya hay. Devuelve `(cambio, sha256)`."""
+    datos = contenido.encode('utf-8')
+    digesto = hashlib.sha256(datos).hexdigest()
+    if os.path.exists(ruta):
+        with open(ruta, 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() == digesto:
+                return False, digesto
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(datos)
+    os.replace(temporal, ruta)
+    return True, digesto
+
+
+PLANTILLA_ESTATICA = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{titulo}}</title>
+    <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"/>
+    <script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"></script>
+    <style>
+        html, body, #mapa {width: 100%; height: 100%; margin: 0; padding: 0; font-family: Roboto, sans-serif;}
+        .leaflet-popup-content {width: auto; height: auto;}
+    </style>
+</head>
+<body>
+<div id="mapa"></div>
+<script>
+const DATOS = {{datos}};
+const mapa = L.map('mapa', {preferCanvas: true}).setView([-34.61, -58.44], 12);
+L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    maxZoom: 19, attribution: '&copy; OpenStreetMap'
+}).addTo(mapa);
+
+const capaSedes = L.layerGroup(), capaParticipantes = L.layerGroup(), capaLineas = L.layerGroup();
+const lineas = DATOS.sedes.map(() => []);
+for (const [lat, lon, sede, popup, tooltip] of DATOS.puntos) {
+    const s = DATOS.sedes[sede];
+    const color = s ? s[2] : '#0A2463';
+    const marcador = L.circleMarker([lat, lon], {radius: 5, weight: 3, color: color, fillColor: color, fillOpacity: 0.7})
+        .bindPopup(() => DATOS.popups[popup]).addTo(capaParticipantes);
+    if (tooltip !== undefined) marcador.bindTooltip(tooltip, {sticky: true});
+    if (s) lineas[sede].push([[lat, lon], [s[0], s[1]]]);
+}
+DATOS.sedes.forEach(([lat, lon, color, popup, nombre], i) => {
+    L.circleMarker([lat, lon], {radius: 10, weight: 2, color: '#333', fillColor: color, fillOpacity: 1})
+        .bindPopup(() => DATOS.popups[popup]).bindTooltip('Sede: ' + nombre, {sticky: true}).addTo(capaSedes);
+    // Una multilínea por sede en lugar de una polilínea por participante
+    if (lineas[i].length) L.polyline(lineas[i], {color: color, weight: 1.5, opacity: 0.6, interactive: false}).addTo(capaLineas);
+});
+capaLineas.addTo(mapa);
+capaParticipantes.addTo(mapa);
+capaSedes.addTo(mapa);
+L.control.layers(null, {'Sedes': capaSedes, 'Participantes': capaParticipantes, 'Recorridos': capaLineas},
+                 {collapsed: false}).addTo(mapa);
+if (DATOS.sedes.length) mapa.fitBounds(DATOS.sedes.map(s => [s[0], s[1]]), {padding: [40, 40]});
+</script>
+</body>
+</html>
+'''
+
+
+# ===== Línea de comandos =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extraer datos de los mapas de sedes y generar mapas estáticos')
+    parser.add_argument('--directorio-datos', default=DIRECTORIO_MAPAS)
+    sub = parser.add_subparsers(dest='comando', required=True)
+    extraer = sub.add_parser('extraer', help='pasa un export de Folium a tablas CSV')
+    extraer.add_argument('capa', choices=sorted(CAPAS_MAPA))
+    generar = sub.add_parser('generar', help='genera el HTML estático de una capa')
+    generar.add_argument('capa', choices=sorted(CAPAS_MAPA))
+    generar.add_argument('--salida')
+    generar.add_argument('--titulo', default='Mapa de sedes')
+    generar.add_argument('--raciones', action='store_true',
+                         help='toma los inscriptos de cada sede del último snapshot de Raciones')
+    generar.add_argument('--datos-personales', action='store_true',
+                         help='incluye nombre y DNI de cada participante en el tooltip')
+    args = parser.parse_args(argv)
+
+    if args.comando == 'extraer':
+        sedes, participantes = leer_export_folium(CAPAS_MAPA[args.capa])
+        for ruta in guardar_tablas(sedes, participantes, args.capa, args.directorio_datos):
+            print(f"Escrito {ruta}")
+        print(f"{len(sedes)} sedes, {len(participantes)} participantes")
+    elif args.comando == 'generar':
+        sedes, participantes, rutas = leer_capa(args.capa, directorio_datos=args.directorio_datos)
+        print(f"Leído {', '.join(rutas)}")
+        if args.raciones:
+            from snapshots import cargar_ultimo
+            snapshot = cargar_ultimo()
+            if snapshot is None:
+                print("No hay snapshots de Raciones; se usan los inscriptos de las tablas")
+            else:
+                raciones = inscriptos_raciones(snapshot)
+                sedes = sedes.assign(inscriptos=[raciones.get(n, i) for n, i in zip(sedes['nombre'], sedes['inscriptos'])])
+        salida = args.salida or f'mapa_{args.capa}.html'
+        contenido = generar_html(sedes, participantes, args.titulo, args.datos_personales)
+        cambio, digesto = escribir_si_cambio(salida, contenido)
+        estado = 'escrito' if cambio else 'sin cambios'
+        print(f"{salida}: {len(contenido.encode('utf-8')) / 1024:.1f} KB, sha256 {digesto[:12]} ({estado})")
+
+
+if __name__ == '__main__':
+    main()
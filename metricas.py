@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tiempos por callback y etapa, con salida en formato de texto de Prometheus.
+
+    metricas = RegistroMetricas()
+
+    @app.callback(...)
+    @metricas.callback
+    def update_ci(...):
+        with metricas.etapa('figura'):
+            ...
+
+Cada callback decorado queda en el histograma `dashboard_callback_segundos`
+y cada etapa en `dashboard_etapa_segundos`. Las últimas trazas se guardan en
+memoria para el panel de diagnóstico; dentro de un pedido de Flask la traza
+queda además en `g.traza_metricas`. El texto de `/metrics` se arma acá, sin
+depender de prometheus_client.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, has_request_context
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LIMITES_BYTES = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_traza_actual = contextvars.ContextVar('traza_actual', default=None)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores)) + ([extra] if extra else [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapar(v)}"' for n, v in pares) + '}'
+
+
+def _numero(valor):
+    return f'{valor:.6g}' if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """Histograma acumulado con etiquetas, como el de Prometheus."""
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}   # valores de etiquetas -> [cuentas por límite..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        posicion = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.setdefault(tuple(etiquetas), [0] * len(self.limites) + [0.0, 0])
+            if posicion < len(self.limites):
+                serie[posicion] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for valores, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.limites, serie):
+                acumulado += cuenta
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, ("le", _numero(float(limite))))} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, ("le", "+Inf"))} {serie[-1]}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(serie[-2])}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {serie[-1]}')
+        return lineas
+
+
+class RegistroMetricas:
+    """Histogramas del proceso, contadores leídos al exportar y trazas recientes."""
+
+    def __init__(self, trazas=50):
+        self.callbacks = Histograma('dashboard_callback_segundos', 'Duración de cada callback de Dash', ['callback'])
+        self.etapas = Histograma('dashboard_etapa_segundos', 'Duración de cada etapa dentro de un callback',
+                                 ['callback', 'etapa'])
+        self._histogramas = [self.callbacks, self.etapas]
+        self._contadores = []   # (nombre, ayuda, funcion que devuelve {etiquetas: valor})
+        self.recientes = deque(maxlen=trazas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        histograma = Histograma(nombre, ayuda, etiquetas, limites)
+        self._histogramas.append(histograma)
+        return histograma
+
+    def contador(self, nombre, ayuda, leer, etiquetas=()):
+        """Contador que se lee al exportar: `leer()` devuelve {tupla de etiquetas: valor}."""
+        self._contadores.append((nombre, ayuda, tuple(etiquetas), leer))
+
+    # ===== Trazas =====
+    def callback(self, funcion):
+        """Decorador: mide el callback completo y junta sus etapas en una traza."""
+        nombre = funcion.__name__
+
+        @functools.wraps(funcion)
+        def medido(*args, **kwargs):
+            traza = {'callback': nombre, 'hora': datetime.now().strftime('%H:%M:%S'), 'etapas': {}}
+            token = _traza_actual.set(traza)
+            if has_request_context():
+                # Para sumarle después el tiempo total del pedido y los bytes de la respuesta
+                g.traza_metricas = traza
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                segundos = time.perf_counter() - inicio
+                _traza_actual.reset(token)
+                traza['segundos'] = segundos
+                self.callbacks.observar(segundos, nombre)
+                self.recientes.append(traza)
+        return medido
+
+    @contextmanager
+    def etapa(self, nombre):
+        traza = _traza_actual.get()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            # Fuera de un callback (p. ej. en un benchmark) la etapa se registra igual
+            callback = traza['callback'] if traza is not None else '-'
+            self.etapas.observar(segundos, callback, nombre)
+            if traza is not None:
+                traza['etapas'][nombre] = traza['etapas'].get(nombre, 0) + segundos
+
+    # ===== Exportación =====
+    def exportar(self):
+        lineas = []
+        for nombre, ayuda, etiquetas, leer in self._contadores:
+            lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+            try:
+                valores = leer()
+            except Exception as e:
+                print(f"Error al leer métrica {nombre}: {str(e)}")
+                continue
+            for claves, valor in sorted(valores.items()):
+                lineas.append(f'{nombre}{_etiquetas(etiquetas, claves)} {_numero(valor)}')
+        for histograma in self._histogramas:
+            lineas += histograma.exportar()
+        return '\n'.join(lineas) + '\n'
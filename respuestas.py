@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compresión y encabezados de cache para las respuestas del servidor Flask.
+
+- `CompresorRespuestas` comprime con brotli (si está instalado) o gzip las
+  respuestas de texto: el JSON de `_dash-update-component`, los bundles de
+  `_dash-component-suites`, el layout y los GeoJSON de los mapas. Las que
+  traen ETag o `max-age` (contenido fijo) se comprimen una vez y se guardan.
+- `cacheable` pone a una respuesta un ETag por contenido y, si la URL trae la
+  versión vigente de los datos (`?v=`), `Cache-Control` de un año.
+
+La variante comprimida lleva el ETag con sufijo (`"abc-br"`, como hace
+Apache), y antes de cada pedido el sufijo se quita de `If-None-Match` para
+que la comparación de Flask y de Dash siga funcionando.
+"""
+import gzip
+import re
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Sin brotli se comprime solo con gzip
+    brotli = None
+
+TIPOS_COMPRIMIBLES = {
+    'application/json', 'application/geo+json', 'application/javascript', 'text/javascript',
+    'text/css', 'text/html', 'text/plain', 'image/svg+xml',
+}
+MINIMO_BYTES = 1024   # por debajo, el encabezado gzip y el CPU no compensan
+UN_ANIO = 31536000
+_SUFIJO_ETAG = re.compile(r'-(?:br|gzip)"')
+
+
+def elegir_codificacion(aceptadas):
+    """'br', 'gzip' o None según `Accept-Encoding` (respetando q=0)."""
+    valores = {}
+    for parte in aceptadas.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        calidad = 1.0
+        if parametros.strip().startswith('q='):
+            try:
+                calidad = float(parametros.strip()[2:])
+            except ValueError:
+                calidad = 0.0
+        valores[nombre.strip().lower()] = calidad
+    if brotli is not None and valores.get('br', 0) > 0:
+        return 'br'
+    if valores.get('gzip', valores.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+class CompresorRespuestas:
+    """Comprime en un `after_request` las respuestas de texto de `server`."""
+
+    def __init__(self, server, minimo=MINIMO_BYTES, nivel_gzip=6, nivel_brotli=5, max_cache=64):
+        self.minimo = minimo
+        self.nivel_gzip = nivel_gzip
+        self.nivel_brotli = nivel_brotli
+        self.max_cache = max_cache
+        self.bytes_originales = 0
+        self.bytes_enviados = 0
+        self._cache = OrderedDict()   # (etag, codificacion) -> cuerpo comprimido
+        self._lock = threading.Lock()
+        server.before_request(self._normalizar_if_none_match)
+        server.after_request(self.comprimir)
+
+    @staticmethod
+    def _normalizar_if_none_match():
+        valor = request.environ.get('HTTP_IF_NONE_MATCH')
+        if valor:
+            request.environ['HTTP_IF_NONE_MATCH'] = _SUFIJO_ETAG.sub('"', valor)
+
+    def _comprimir(self, datos, codificacion):
+        if codificacion == 'br':
+            return brotli.compress(datos, quality=self.nivel_brotli)
+        return gzip.compress(datos, compresslevel=self.nivel_gzip, mtime=0)
+
+    def comprimir(self, respuesta):
+        if (respuesta.status_code != 200 or 'Content-Encoding' in respuesta.headers
+                or respuesta.mimetype not in TIPOS_COMPRIMIBLES or respuesta.is_streamed):
+            return respuesta
+        respuesta.vary.add('Accept-Encoding')
+        codificacion = elegir_codificacion(request.headers.get('Accept-Encoding', ''))
+        if codificacion is None:
+            return respuesta
+        if respuesta.direct_passthrough:
+            # Archivos servidos con send_file: se leen para poder comprimirlos
+            respuesta.direct_passthrough = False
+        datos = respuesta.get_data()
+        if len(datos) < self.minimo:
+            return respuesta
+
+        if respuesta.cache_control.max_age and not respuesta.get_etag()[0]:
+            # Bundles de Dash con huella en la URL: contenido fijo, se comprimen una sola vez
+            respuesta.add_etag()
+            if request.method in ('GET', 'HEAD'):
+                respuesta.make_conditional(request)
+                if respuesta.status_code == 304:
+                    return respuesta
+        etag, debil = respuesta.get_etag()
+        clave = (etag, codificacion) if etag else None
+        comprimido = None
+        if clave is not None:
+            with self._lock:
+                comprimido = self._cache.get(clave)
+                if comprimido is not None:
+                    self._cache.move_to_end(clave)
+        if comprimido is None:
+            comprimido = self._comprimir(datos, codificacion)
+            if clave is not None:
+                with self._lock:
+                    self._cache[clave] = comprimido
+                    while len(self._cache) > self.max_cache:
+                        self._cache.popitem(last=False)
+
+        respuesta.set_data(comprimido)
+        respuesta.headers['Content-Encoding'] = codificacion
+        if etag:
+            respuesta.set_etag(f'{etag}-{codificacion}', weak=debil)
+        with self._lock:
+            self.bytes_originales += len(datos)
+            self.bytes_enviados += len(comprimido)
+        return respuesta
+
+
+def cacheable(respuesta, version=None, max_age=UN_ANIO):
+    """ETag por contenido; cache larga solo si el pedido trae `?v=` igual a `version`.
+
+    Sin versión en la URL el navegador debe revalidar siempre (`no-cache`), lo
+    que con el ETag cuesta un 304 sin cuerpo cuando nada cambió.
+    """
+    respuesta.add_etag()
+    if version is not None and request.args.get('v') == version:
+        respuesta.headers['Cache-Control'] = f'public, max-age={max_age}, immutable'
+    else:
+        respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
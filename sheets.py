@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Conexión a Google Sheets que se arma una vez y se reutiliza en cada actualización."""
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+from gspread.exceptions import APIError
+from requests.adapters import HTTPAdapter
+
+# Respuestas que vale la pena reintentar: cuota excedida y errores transitorios de Google
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+VARIABLES_CREDENCIALES = ['GCP_PROJECT_ID', 'GCP_PRIVATE_KEY', 'GCP_CLIENT_EMAIL', 'GCP_CLIENT_X509_CERT_URL']
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+
+def credenciales_entorno():
+    """Credenciales de la cuenta de servicio armadas con las variables GCP_* del entorno."""
+    faltantes = [var for var in VARIABLES_CREDENCIALES if var not in os.environ]
+    if faltantes:
+        raise RuntimeError(f"Faltan variables de entorno: {', '.join(faltantes)}")
+    creds_dict = {
+        "type": "service_account",
+        "project_id": os.environ['GCP_PROJECT_ID'],
+        "private_key_id": os.environ.get('GCP_PRIVATE_KEY_ID', ''),
+        "private_key": os.environ['GCP_PRIVATE_KEY'].replace('\\n', '\n'),
+        "client_email": os.environ['GCP_CLIENT_EMAIL'],
+        "client_id": os.environ.get('GCP_CLIENT_ID', ''),
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": os.environ['GCP_CLIENT_X509_CERT_URL']
+    }
+    return Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+
+
+def _estado(error):
+    respuesta = getattr(error, 'response', None)
+    return getattr(respuesta, 'status_code', None)
+
+
+class ConexionSheets:
+    """Planilla de Google Sheets con sesión HTTP, clave y hojas resueltas una sola vez.
+
+    - El nombre se busca en Drive solo la primera vez; después se abre por clave.
+    - La planilla y la lista de hojas se guardan (`ttl_metadatos` segundos); se
+      vuelven a pedir con `invalidar()` o si una consulta falla con 400 (p. ej.
+      se renombró una hoja).
+    - La sesión `requests` mantiene un pool de `pool` conexiones keep-alive,
+      compartido por los hilos que descargan hojas en paralelo.
+    - El token se renueva antes de que venza (`margen_token` segundos), no al
+      recibir un 401 en medio de una actualización.
+    - 429 y 5xx se reintentan con backoff exponencial y jitter completo, o lo que
+      diga `Retry-After` si viene.
+
+    `estadisticas` cuenta llamadas (también por operación) y bytes recibidos;
+    `al_llamar(operacion, segundos)`, si se pasa, se llama después de cada
+    llamada que responde bien.
+
+    Expone `worksheets()` y `values_batch_get()` como un `gspread.Spreadsheet`,
+    así `cargar_hojas` y `SincronizadorHojas` la usan sin cambios. Con `cliente`
+    se usa ese cliente (p. ej. uno falso para pruebas) en lugar de crear uno con
+    `credenciales`, que entonces puede ser None.
+    """
+
+    def __init__(self, credenciales, nombre, pool=8, reintentos=5, espera_base=1.0, espera_max=32.0,
+                 margen_token=300, ttl_metadatos=3600, cliente=None, al_llamar=None):
+        self.credenciales = credenciales
+        self.nombre = nombre
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.margen_token = margen_token
+        self.ttl_metadatos = ttl_metadatos
+        self.clave = None
+        self.al_llamar = al_llamar
+        self.estadisticas = {'llamadas': 0, 'reintentos': 0, 'renovaciones_token': 0, 'aperturas': 0, 'bytes': 0}
+        self.llamadas_por_operacion = {}
+        self._planilla = None
+        self._hojas = None
+        self._hojas_hasta = 0
+        self._lock = threading.Lock()
+        self._lock_token = threading.Lock()
+        self._lock_bytes = threading.Lock()   # el hook corre también dentro de la renovación
+        # El token se pide por una sesión común: por AuthorizedSession se renovaría dos veces
+        self._sesion_token = requests.Session()
+        self._sesion_token.hooks['response'].append(self._contar_bytes)
+        self._pedido_token = Request(self._sesion_token)
+
+        if cliente is not None:
+            self.sesion = None
+            self.cliente = cliente
+            return
+        self.sesion = AuthorizedSession(credenciales)
+        adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=0)
+        self.sesion.mount('https://', adaptador)
+        self.sesion.hooks['response'].append(self._contar_bytes)
+        self.cliente = gspread.authorize(credenciales, session=self.sesion)
+
+    # ===== Token =====
+    def _renovar_token(self):
+        # Fuera de self._lock: el POST del token pasa por la sesión y su hook
+        if self.credenciales is None:
+            return
+        with self._lock_token:
+            self._renovar_si_vence()
+
+    def _renovar_si_vence(self):
+        vence = self.credenciales.expiry
+        if vence is not None and vence.tzinfo is None:
+            vence = vence.replace(tzinfo=timezone.utc)   # google-auth usa UTC sin zona
+        ahora = datetime.now(timezone.utc)
+        if self.credenciales.token is None or vence is None or vence - ahora < timedelta(seconds=self.margen_token):
+            self.credenciales.refresh(self._pedido_token)
+            self.estadisticas['renovaciones_token'] += 1
+
+    def _contar_bytes(self, respuesta, *args, **kwargs):
+        with self._lock_bytes:
+            self.estadisticas['bytes'] += len(respuesta.content)
+
+    # ===== Reintentos =====
+    def _espera(self, intento, error):
+        respuesta = getattr(error, 'response', None)
+        reintentar_en = respuesta.headers.get('Retry-After') if respuesta is not None else None
+        if reintentar_en and reintentar_en.isdigit():
+            return min(float(reintentar_en), self.espera_max)
+        return random.uniform(0, min(self.espera_max, self.espera_base * 2 ** intento))
+
+    def _llamar(self, funcion, *args, **kwargs):
+        operacion = funcion.__name__
+        for intento in range(self.reintentos + 1):
+            self._renovar_token()
+            with self._lock:
+                self.estadisticas['llamadas'] += 1
+                self.llamadas_por_operacion[operacion] = self.llamadas_por_operacion.get(operacion, 0) + 1
+            inicio = time.perf_counter()
+            try:
+                resultado = funcion(*args, **kwargs)
+            except APIError as e:
+                if _estado(e) == 400:
+                    # Rango inválido: la lista de hojas cambió, se vuelve a pedir en la próxima
+                    self.invalidar()
+                if _estado(e) not in ESTADOS_REINTENTABLES or intento == self.reintentos:
+                    raise
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if intento == self.reintentos:
+                    raise
+                error = e
+            else:
+                if self.al_llamar is not None:
+                    self.al_llamar(operacion, time.perf_counter() - inicio)
+                return resultado
+            espera = self._espera(intento, error)
+            self.estadisticas['reintentos'] += 1
+            print(f"Sheets: reintento {intento + 1}/{self.reintentos} en {espera:.1f}s ({error})")
+            time.sleep(espera)
+
+    # ===== Planilla y hojas =====
+    def planilla(self):
+        if self._planilla is None:
+            if self.clave is None:
+                # Única búsqueda por nombre en Drive; después alcanza con la clave
+                self._planilla = self._llamar(self.cliente.open, self.nombre)
+                self.clave = self._planilla.id
+            else:
+                self._planilla = self._llamar(self.cliente.open_by_key, self.clave)
+            self.estadisticas['aperturas'] += 1
+        return self._planilla
+
+    def cerrar_sockets(self):
+        # P. ej. antes de un fork: cada proceso abre los suyos en la próxima llamada
+        for sesion in (self.sesion, self._sesion_token):
+            if sesion is not None:
+                sesion.close()
+
+    def invalidar(self):
+        # La clave se conserva: la planilla es la misma aunque cambien sus hojas
+        self._planilla = None
+        self._hojas = None
+
+    def worksheets(self):
+        if self._hojas is None or time.monotonic() > self._hojas_hasta:
+            self._hojas = self._llamar(self.planilla().worksheets)
+            self._hojas_hasta = time.monotonic() + self.ttl_metadatos
+        return self._hojas
+
+    def values_batch_get(self, rangos, params=None):
+        return self._llamar(self.planilla().values_batch_get, rangos, params=params)
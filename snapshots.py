@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Fotos de la planilla del año en curso guardadas en disco (una carpeta Feather por foto + manifest.json).
+
+Cada foto anota en el manifest el año de su planilla; al cambiar de año, la
+última foto del año anterior se congela en el histórico (ver historico.py).
+
+Uso desde la línea de comandos:
+    python snapshots.py listar
+    python snapshots.py mostrar <id>
+    python snapshots.py podar --conservar 5
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:   # Windows: sin locks de archivo, cada proceso se actualiza solo
+    fcntl = None
+
+import pandas as pd
+
+from datos import Snapshot
+
+DIRECTORIO_SNAPSHOTS = os.environ.get('DIRECTORIO_SNAPSHOTS', 'snapshots')
+MANIFEST = 'manifest.json'
+
+
+# ===== Manifest =====
+def leer_manifest(directorio=DIRECTORIO_SNAPSHOTS):
+    ruta = os.path.join(directorio, MANIFEST)
+    if not os.path.exists(ruta):
+        return {'snapshots': []}
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def escribir_manifest(manifest, directorio=DIRECTORIO_SNAPSHOTS):
+    # Se escribe a un temporal y se renombra para no dejar un manifest a medias
+    ruta = os.path.join(directorio, MANIFEST)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+
+# ===== Guardar y cargar =====
+def guardar_snapshot(snapshot, directorio=DIRECTORIO_SNAPSHOTS, anio=None):
+    """Guarda las hojas normalizadas de `snapshot` y lo agrega al manifest. Devuelve el id.
+
+    `anio` es el de la planilla de donde salió la foto.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    actualizado = snapshot.actualizado or datetime.now()
+    id_snapshot = f"{actualizado.strftime('%Y%m%dT%H%M%S')}_v{snapshot.version}"
+    temporal = os.path.join(directorio, f'.{id_snapshot}.tmp')
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    hojas = {}
+    for indice, df in snapshot.hojas.items():
+        archivo = f'hoja_{indice}.feather'
+        df.reset_index(drop=True).to_feather(os.path.join(temporal, archivo))
+        hojas[str(indice)] = {'archivo': archivo, 'filas': len(df)}
+
+    destino = os.path.join(directorio, id_snapshot)
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporal, destino)
+
+    manifest = leer_manifest(directorio)
+    manifest['snapshots'] = [s for s in manifest['snapshots'] if s['id'] != id_snapshot]
+    manifest['snapshots'].append({
+        'id': id_snapshot,
+        'version': snapshot.version,
+        'anio': anio,
+        'actualizado': actualizado.isoformat(),
+        'hojas': hojas,
+        'tiempos': {str(k): v for k, v in snapshot.tiempos.items()},
+    })
+    escribir_manifest(manifest, directorio)
+    return id_snapshot
+
+
+def cargar_snapshot(id_snapshot, directorio=DIRECTORIO_SNAPSHOTS):
+    entrada = next((s for s in leer_manifest(directorio)['snapshots'] if s['id'] == id_snapshot), None)
+    if entrada is None:
+        raise KeyError(f"No existe el snapshot {id_snapshot}")
+    carpeta = os.path.join(directorio, id_snapshot)
+    hojas = {
+        int(indice): pd.read_feather(os.path.join(carpeta, datos_hoja['archivo']))
+        for indice, datos_hoja in entrada['hojas'].items()
+    }
+    return Snapshot(
+        hojas,
+        version=entrada['version'],
+        actualizado=datetime.fromisoformat(entrada['actualizado']),
+        tiempos=entrada.get('tiempos')
+    )
+
+
+def anio_snapshot(entrada, directorio=DIRECTORIO_SNAPSHOTS):
+    """Año de la planilla de una entrada del manifest, o None si no se puede saber.
+
+    Las fotos guardadas antes de anotar el año se datan por su última fecha.
+    """
+    if entrada.get('anio') is not None:
+        return entrada['anio']
+    ultimas = []
+    for datos_hoja in entrada['hojas'].values():
+        try:
+            fechas = pd.read_feather(os.path.join(directorio, entrada['id'], datos_hoja['archivo']), columns=['Fecha'])
+        except Exception:
+            continue
+        if not fechas.empty:
+            ultimas.append(fechas['Fecha'].max())
+    return max(ultimas).year if ultimas else None
+
+
+def cargar_ultimo(directorio=DIRECTORIO_SNAPSHOTS, anio=None):
+    """Devuelve el snapshot más reciente que se pueda leer, o None si no hay ninguno.
+
+    Con `anio` se saltean las fotos de otro año (p. ej. las del año ya cerrado).
+    """
+    for entrada in reversed(leer_manifest(directorio)['snapshots']):
+        if anio is not None and anio_snapshot(entrada, directorio) not in (anio, None):
+            continue
+        try:
+            return cargar_snapshot(entrada['id'], directorio)
+        except Exception as e:
+            print(f"Snapshot {entrada['id']} ilegible: {str(e)}")
+    return None
+
+
+def podar(conservar, directorio=DIRECTORIO_SNAPSHOTS):
+    """Borra todos los snapshots salvo los `conservar` más recientes. Devuelve los ids borrados."""
+    manifest = leer_manifest(directorio)
+    snapshots = manifest['snapshots']
+    borrar = snapshots[:-conservar] if conservar > 0 else snapshots
+    manifest['snapshots'] = snapshots[len(borrar):]
+    escribir_manifest(manifest, directorio)
+    for entrada in borrar:
+        shutil.rmtree(os.path.join(directorio, entrada['id']), ignore_errors=True)
+    return [entrada['id'] for entrada in borrar]
+
+
+# ===== Varios workers =====
+class CoordinadorWorkers:
+    """Comparte una sola descarga de Sheets entre los workers que usan el mismo `directorio`.
+
+    El worker que consigue el lock de `.actualizador.lock` corre el `ActualizadorFondo`
+    (descarga y guarda cada foto en disco, como con un solo proceso). Los demás
+    revisan el manifest cada `sondeo` segundos y cargan la foto nueva de disco
+    cuando aparece. Si el worker que actualiza muere, el sistema libera el lock y
+    otro lo toma en el siguiente sondeo. `al_pedir()`, si se pasa, lo corre el
+    worker que actualiza antes de atender un pedido de "Actualizar Datos".
+    """
+
+    LOCK = '.actualizador.lock'
+    PEDIDO = '.pedido'
+
+    def __init__(self, actualizador, directorio=DIRECTORIO_SNAPSHOTS, sondeo=5, al_pedir=None):
+        self.actualizador = actualizador
+        self.directorio = directorio
+        self.sondeo = sondeo
+        self.al_pedir = al_pedir
+        self.es_lider = False
+        self._archivo_lock = None
+        self._manifest_visto = None
+        self._pedido_visto = None
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = None
+
+    def iniciar(self):
+        # Idempotente y seguro tras un fork (gunicorn --preload), igual que ActualizadorFondo.iniciar
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self.es_lider = False
+                self._archivo_lock = None
+            self._pid = os.getpid()
+            os.makedirs(self.directorio, exist_ok=True)
+            self._pedido_visto = self._mtime(self.PEDIDO)
+            self._intentar_liderar()
+            self._hilo = threading.Thread(target=self._ciclo, name='coordinador-workers', daemon=True)
+            self._hilo.start()
+
+    def pedir_actualizacion(self):
+        if self.es_lider:
+            self._atender_pedido()
+        else:
+            # El worker que actualiza lo ve en su próximo sondeo
+            with open(os.path.join(self.directorio, self.PEDIDO), 'w', encoding='utf-8') as f:
+                f.write(str(os.getpid()))
+
+    def pendiente(self):
+        if self.es_lider:
+            return self.actualizador.pendiente()
+        pedido = self._mtime(self.PEDIDO)
+        return pedido is not None and pedido > (self._mtime(MANIFEST) or 0)
+
+    def _mtime(self, nombre):
+        try:
+            return os.path.getmtime(os.path.join(self.directorio, nombre))
+        except OSError:
+            return None
+
+    def _intentar_liderar(self):
+        if fcntl is None:
+            self.es_lider = True
+        else:
+            archivo = open(os.path.join(self.directorio, self.LOCK), 'a')
+            try:
+                fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                archivo.close()
+                return False
+            # El archivo queda abierto mientras viva el proceso: eso es lo que sostiene el lock
+            self._archivo_lock = archivo
+            self.es_lider = True
+        print(f"Worker {os.getpid()}: actualiza los datos desde Google Sheets")
+        self.actualizador.iniciar()
+        return True
+
+    def _atender_pedido(self):
+        if self.al_pedir is not None:
+            self.al_pedir()
+        self.actualizador.pedir_actualizacion()
+
+    def _seguir(self):
+        # Carga la foto más nueva de disco si el manifest cambió y trae otra versión
+        manifest = self._mtime(MANIFEST)
+        if manifest is None or manifest == self._manifest_visto:
+            return
+        self._manifest_visto = manifest
+        snapshots = leer_manifest(self.directorio)['snapshots']
+        if not snapshots or snapshots[-1]['id'] == self.actualizador.snapshot.id:
+            return
+        snapshot = cargar_ultimo(self.directorio)
+        if snapshot is not None:
+            self.actualizador.snapshot = snapshot
+
+    def _ciclo(self):
+        while True:
+            try:
+                if not self.es_lider:
+                    # Primero la última foto de disco: si toma el lock, arranca desde ahí
+                    self._seguir()
+                    self._intentar_liderar()
+                else:
+                    pedido = self._mtime(self.PEDIDO)
+                    if pedido is not None and pedido != self._pedido_visto:
+                        self._pedido_visto = pedido
+                        self._atender_pedido()
+            except Exception as e:
+                print(f"Error al coordinar workers: {str(e)}")
+            time.sleep(self.sondeo)
+
+
+# ===== Línea de comandos =====
+def _tamano(carpeta):
+    return sum(os.path.getsize(os.path.join(carpeta, f)) for f in os.listdir(carpeta)) if os.path.isdir(carpeta) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspeccionar y podar los snapshots locales de la planilla del año en curso')
+    parser.add_argument('--directorio', default=DIRECTORIO_SNAPSHOTS)
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('listar', help='lista los snapshots del manifest')
+    mostrar = sub.add_parser('mostrar', help='muestra las hojas de un snapshot')
+    mostrar.add_argument('id')
+    podar_cmd = sub.add_parser('podar', help='borra los snapshots viejos')
+    podar_cmd.add_argument('--conservar', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.comando == 'listar':
+        for entrada in leer_manifest(args.directorio)['snapshots']:
+            filas = sum(h['filas'] for h in entrada['hojas'].values())
+            kb = _tamano(os.path.join(args.directorio, entrada['id'])) / 1024
+            anio = entrada.get('anio') or '?'
+            print(f"{entrada['id']}  v{entrada['version']}  {anio}  {filas:>8} filas  {kb:>9.1f} KB")
+    elif args.comando == 'mostrar':
+        inicio = time.perf_counter()
+        snapshot = cargar_snapshot(args.id, args.directorio)
+        print(f"Cargado en {(time.perf_counter() - inicio) * 1000:.1f} ms, actualizado {snapshot.actualizado}")
+        for indice, df in sorted(snapshot.hojas.items()):
+            print(f"Hoja {indice}: {len(df)} filas, {len(snapshot.escuelas[indice])} escuelas")
+    elif args.comando == 'podar':
+        for id_snapshot in podar(args.conservar, args.directorio):
+            print(f"Borrado {id_snapshot}")
+
+
+if __name__ == '__main__':
+    main()